@@ -3,18 +3,25 @@ import os
 import base64
 import re
 import argparse
+import sys
 import openai
 import concurrent.futures
 from pathlib import Path
 from typing import Dict, Any, List
 
+# Shared helpers (results journal, image sources) live at the repository root.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from result_io import GracefulStop, ResultJournal, atomic_write_text, journal_path_for, replay_journal
+from image_prep import MIME_TYPES, sniff_format
+from image_source import ImageSource, read_image
+
 REQUIRED_SCORE_KEYS = {"consistency", "realism", "aesthetic_quality"}
 MAX_EXTRACT_RETRIES = 3
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Image Quality Assessment Tool')
     parser.add_argument('--json_path', required=True)
-    parser.add_argument('--image_dir', required=True)
+    parser.add_argument('--image_dir', required=True)  # directory, tar/zip shard, or glob of shards
     parser.add_argument('--output_dir', required=True)
     parser.add_argument('--api_key', required=True)
     parser.add_argument('--model', required=True)
@@ -22,6 +29,7 @@ def parse_arguments():
     parser.add_argument('--result_scores', required=True)  # .jsonl
     parser.add_argument('--api_base', default=None, type=str)
     parser.add_argument('--max_workers', type=int, default=10)
+    parser.add_argument('--fsync_every', type=int, default=32)
     return parser.parse_args()
 
 def get_config(args):
@@ -34,6 +42,7 @@ def get_config(args):
         "model": args.model,
         "result_files": {"full": args.result_full, "scores": args.result_scores},
         "max_workers": args.max_workers,
+        "fsync_every": args.fsync_every,
     }
 
 def load_jsonl(path: str) -> Dict[int, Dict]:
@@ -75,16 +84,16 @@ def extract_scores(txt: str) -> Dict[str, float]:
         }
     return out
 
-def encode_image(path: str) -> str:
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
+def encode_image(ref):
+    data = read_image(ref)
+    return base64.b64encode(data).decode(), MIME_TYPES[sniff_format(data)]
 
 def load_prompts(path: str) -> Dict[int, Dict[str, Any]]:
     with open(path, 'r') as f:
         data = json.load(f)
     return {item["prompt_id"]: item for item in data}
 
-def build_evaluation_messages(prompt_data: Dict, image_base64: str) -> list:
+def build_evaluation_messages(prompt_data: Dict, image_base64: str, mime: str = "image/png") -> list:
     return [
 
         {
@@ -162,7 +171,7 @@ Please strictly adhere to the scoring criteria and follow the template format wh
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/png;base64,{image_base64}"
+                        "url": f"data:{mime};base64,{image_base64}"
                     }
                 }
             ]
@@ -173,8 +182,8 @@ Please strictly adhere to the scoring criteria and follow the template format wh
 
 def evaluate_image(prompt_id: int, prompt: Dict, img_path: str, cfg: Dict):
     print(f"Evaluating {prompt_id} ...")
-    img64 = encode_image(img_path)
-    msgs = build_evaluation_messages(prompt, img64)
+    img64, mime = encode_image(img_path)
+    msgs = build_evaluation_messages(prompt, img64, mime)
 
     for attempt in range(1, MAX_EXTRACT_RETRIES + 1):
         try:
@@ -192,7 +201,7 @@ def evaluate_image(prompt_id: int, prompt: Dict, img_path: str, cfg: Dict):
                         "prompt_id": prompt_id,
                         "prompt": prompt["Prompt"],
                         "key": prompt["Explanation"],
-                        "image_path": img_path,
+                        "image_path": str(img_path),
                         "evaluation": eval_txt
                     },
                     "score": {
@@ -211,15 +220,21 @@ def evaluate_image(prompt_id: int, prompt: Dict, img_path: str, cfg: Dict):
 
     return {"status": "extract_fail", "prompt_id": prompt_id}
 
+def _evaluate_unless_stopped(stop: GracefulStop, prompt_id: int, prompt: Dict, img_path: str, cfg: Dict):
+    if stop.is_set():
+        return None
+    return evaluate_image(prompt_id, prompt, img_path, cfg)
+
 def save_results(data: List[Dict], filename: str, cfg: Dict):
     path = os.path.join(cfg["output_dir"], filename)
     if filename.endswith('.jsonl'):
-        with open(path, 'w', encoding='utf-8') as f:
+        def write(f):
             for item in data:
                 f.write(json.dumps(item, ensure_ascii=False) + '\n')
     else:
-        with open(path, 'w', encoding='utf-8') as f:
+        def write(f):
             json.dump(data, f, ensure_ascii=False, indent=2)
+    atomic_write_text(path, write)
     print(f"[SAVE] {path}")
 
 def main():
@@ -235,22 +250,37 @@ def main():
     # ---- Resume: load existing results ----
     exist_scores = load_jsonl(os.path.join(cfg["output_dir"], cfg["result_files"]["scores"]))
     exist_full   = load_json (os.path.join(cfg["output_dir"], cfg["result_files"]["full"]))
+    journal_path = journal_path_for(os.path.join(cfg["output_dir"], cfg["result_files"]["scores"]))
+    replayed = 0
+    for rec in replay_journal(journal_path):
+        exist_full[rec["full"]["prompt_id"]]    = rec["full"]
+        exist_scores[rec["score"]["prompt_id"]] = rec["score"]
+        replayed += 1
+    if replayed:
+        print(f"[RESUME] Replayed {replayed} records from {journal_path}")
     done_ids = set(exist_scores.keys())
 
+    source = ImageSource(cfg["image_dir"])
+    print(f"[IMAGES] {source.describe()}")
     tasks = []
     for pid, pdata in prompts.items():
         if pid in done_ids:
             continue
-        img_path = os.path.join(cfg["image_dir"], f"{pid}.png")
-        if not os.path.exists(img_path):
-            print(f"[WARN] Missing image: {img_path}")
+        img_path = source.get(pid)
+        if img_path is None:
+            print(f"[WARN] Missing image: prompt {pid} in {cfg['image_dir']}")
             continue
         tasks.append((pid, pdata, img_path))
 
     # ---- Multi-threaded evaluation ----
     failed_extract_ids = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as ex:
-        future_to_id = {ex.submit(evaluate_image, pid, pd, ip, cfg): pid for pid, pd, ip in tasks}
+    journal = ResultJournal(journal_path, fsync_every=cfg["fsync_every"])
+    stop = GracefulStop()
+    stop.install()
+    # Not a `with` block: on abort we must not wait for queued futures.
+    ex = concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"])
+    try:
+        future_to_id = {ex.submit(_evaluate_unless_stopped, stop, pid, pd, ip, cfg): pid for pid, pd, ip in tasks}
         for fut in concurrent.futures.as_completed(future_to_id):
             res = fut.result()
             if not res or res.get("status") != "ok":
@@ -261,6 +291,13 @@ def main():
             score_rec = res["score"]
             exist_full[full_rec["prompt_id"]]     = full_rec
             exist_scores[score_rec["prompt_id"]]  = score_rec
+            journal.append(full_rec, score_rec)
+    except KeyboardInterrupt:
+        journal.close()
+        print(f"[ABORT] {len(exist_scores)} records kept in {journal_path}; rerun the same command to resume.")
+        os._exit(130)
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
 
     # ---- Merge, sort, and save ----
     full_sorted  = [exist_full[k]   for k in sorted(exist_full.keys())]
@@ -268,8 +305,12 @@ def main():
 
     save_results(full_sorted,  cfg["result_files"]["full"],   cfg)
     save_results(score_sorted, cfg["result_files"]["scores"], cfg)
+    journal.discard()
     if failed_extract_ids:
         print(f"[WARN] Failed to extract scores (skipped): {sorted(failed_extract_ids)}")
+    if stop.is_set():
+        print(f"[STOP] Saved {len(score_sorted)} records; rerun the same command to evaluate the remaining prompts.")
+        sys.exit(130)
 
 if __name__ == "__main__":
     main()
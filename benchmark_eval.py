@@ -0,0 +1,192 @@
+"""End-to-end throughput benchmark of vllm_eval.py against mock_judge_server.py.
+
+Generates synthetic images, starts the mock judge (unless --api_base points at
+a real one), runs vllm_eval.py once with the given flags and reports
+requests/s, client-observed latency percentiles and client CPU/memory.
+
+    python benchmark_eval.py --num_prompts 1000 --eval_args "--engine async --max_workers 256" \
+        --mock_args "--latency_mean 0.5 --max_concurrency 128"
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shlex
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import zlib
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark vllm_eval.py against a mock judge")
+    parser.add_argument("--json_path", default=os.path.join(SCRIPT_DIR, "data_verified", "merge.json"))
+    parser.add_argument("--num_prompts", type=int, default=1000)
+    parser.add_argument("--image_size", type=int, default=1024, help="Side length of the synthetic square images.")
+    parser.add_argument(
+        "--distinct_images",
+        type=int,
+        default=16,
+        help="Number of distinct image files; the rest are symlinks to them to save disk.",
+    )
+    parser.add_argument("--workdir", default=None, help="Where images and outputs go (default: a temp dir, removed afterwards).")
+    parser.add_argument("--api_base", default=None, help="Benchmark against this endpoint instead of starting the mock judge.")
+    parser.add_argument("--mock_args", default="", help="Extra flags for mock_judge_server.py.")
+    parser.add_argument("--eval_args", default="--engine async --max_workers 128", help="Extra flags for vllm_eval.py.")
+    parser.add_argument("--model", default="Qwen3.5-35B-A3B")
+    parser.add_argument("--report_json", default=None)
+    return parser.parse_args()
+
+
+def write_png(path: str, size: int, rng: random.Random):
+    # Plain-stdlib PNG writer (8-bit RGB), so the benchmark doesn't need Pillow.
+    # Noise compresses poorly, giving file sizes close to real generator output.
+    raw = b"".join(b"\x00" + rng.randbytes(size * 3) for _ in range(size))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 1)))
+        f.write(chunk(b"IEND", b""))
+
+
+def prepare_inputs(args, workdir: str):
+    with open(args.json_path, "r", encoding="utf-8") as f:
+        prompts = sorted(json.load(f), key=lambda item: item["prompt_id"])[: args.num_prompts]
+    json_path = os.path.join(workdir, "prompts.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(prompts, f, ensure_ascii=False)
+
+    image_dir = os.path.join(workdir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    rng = random.Random(0)
+    distinct = []
+    for i, item in enumerate(prompts):
+        path = os.path.join(image_dir, f"{item['prompt_id']}.png")
+        if os.path.exists(path):
+            continue
+        if i < args.distinct_images:
+            write_png(path, args.image_size, rng)
+            distinct.append(path)
+        else:
+            os.symlink(distinct[i % len(distinct)], path)
+    return json_path, image_dir, len(prompts)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mock(args):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(SCRIPT_DIR, "mock_judge_server.py"), "--port", str(port), "--model", args.model]
+    proc = subprocess.Popen(cmd + shlex.split(args.mock_args), stdout=subprocess.DEVNULL)
+    api_base = f"http://127.0.0.1:{port}/v1"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{api_base}/models", timeout=1).read()
+            return proc, api_base
+        except OSError:
+            if proc.poll() is not None:
+                raise SystemExit("mock_judge_server.py exited during startup (is aiohttp installed?)")
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("mock_judge_server.py did not become ready within 30s")
+
+
+def main():
+    args = parse_arguments()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="wise_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    mock = None
+    try:
+        json_path, image_dir, n = prepare_inputs(args, workdir)
+        if args.api_base:
+            api_base = args.api_base
+        else:
+            mock, api_base = start_mock(args)
+
+        output_dir = os.path.join(workdir, "out")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        summary_path = os.path.join(workdir, "summary.json")
+        cmd = [
+            sys.executable, os.path.join(SCRIPT_DIR, "vllm_eval.py"),
+            "--json_path", json_path,
+            "--image_dir", image_dir,
+            "--output_dir", output_dir,
+            "--model", args.model,
+            "--api_base", api_base,
+            "--result_full", "full_results.jsonl",
+            "--result_scores", "scores_results.jsonl",
+            "--summary_json", summary_path,
+        ] + shlex.split(args.eval_args)
+
+        log_path = os.path.join(workdir, "vllm_eval.log")
+        print(f"[BENCH] {n} prompts, {args.image_size}px images, api_base={api_base}")
+        print(f"[BENCH] vllm_eval.py {args.eval_args}")
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.monotonic()
+        with open(log_path, "w", encoding="utf-8") as log:
+            rc = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+        wall = time.monotonic() - start
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if rc != 0:
+            raise SystemExit(f"vllm_eval.py exited with {rc}; see {log_path}")
+
+        with open(summary_path, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+        cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        report = {
+            "prompts": n,
+            "image_size": args.image_size,
+            "eval_args": args.eval_args,
+            "mock_args": None if args.api_base else args.mock_args,
+            "process_wall_s": round(wall, 3),
+            "engine_wall_s": summary["wall_s"],
+            "items_judged": summary["items_judged"],
+            "items_failed": summary["items_failed"],
+            "requests_per_s": summary["requests_per_s"],
+            "latency_s": summary["latency_s"],
+            "client_cpu_s": round(cpu, 3),
+            "client_cpu_util": round(cpu / wall, 3) if wall > 0 else 0.0,
+            # ru_maxrss is in KiB on Linux; it is the largest single child, i.e. the evaluator.
+            "client_peak_rss_mb": round(after.ru_maxrss / 1024, 1),
+        }
+
+        lat = report["latency_s"]
+        print(f"[BENCH] judged={report['items_judged']} failed={report['items_failed']} wall={report['engine_wall_s']}s")
+        print(f"[BENCH] throughput={report['requests_per_s']} req/s")
+        print(f"[BENCH] latency p50={lat['p50']}s p95={lat['p95']}s p99={lat['p99']}s")
+        print(
+            f"[BENCH] client cpu={report['client_cpu_s']}s ({report['client_cpu_util']:.0%} of one core) "
+            f"peak_rss={report['client_peak_rss_mb']}MB"
+        )
+        if args.report_json:
+            with open(args.report_json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"[SAVE] {args.report_json}")
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,107 +1,283 @@
 import json
 import os
 import argparse
-from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_verified", "merge.json")
+
+# Report label for each dataset Category, in report order.
+CATEGORY_LABELS = {
+    "Cultural knowledge": "CULTURE",
+    "time": "TIME",
+    "Space": "SPACE",
+    "Biology": "BIOLOGY",
+    "Physical Knowledge": "PHYSICS",
+    "Chemistry": "CHEMISTRY",
+}
+ORDERED_CATEGORIES = list(CATEGORY_LABELS.values())
+CATEGORY_CODES = {label: code for code, label in enumerate(ORDERED_CATEGORIES)}
+# Weight of each category (same order) in the overall WiScore.
+CATEGORY_WEIGHTS = np.array([0.4, 0.12, 0.12, 0.12, 0.12, 0.12])
+
+# Categories a single file is expected to cover for each --category choice.
+CATEGORY_ARG_GROUPS = {
+    "culture": ("CULTURE",),
+    "space-time": ("TIME", "SPACE"),
+    "science": ("BIOLOGY", "PHYSICS", "CHEMISTRY"),
+    "all": tuple(ORDERED_CATEGORIES),
+}
+
 
 def calculate_wiscore(score):
-    """Returns the binary WISE score for one sample.
+    """Returns the binary WISE score for one sample, or an array of them.
 
     The evaluator now outputs a single score in {0, 1}: 1 means the image is
     semantically correct and visually usable, 0 means rejected.
     """
-    return float(score)
-
-# Define expected prompt ID ranges at a global level for easy access
-EXPECTED_PROMPT_RANGES = {
-    "culture": range(1, 401),
-    "space-time": range(401, 641), # Covers TIME (401-520) and SPACE (521-640)
-    "science": range(641, 1001), # Covers BIOLOGY (641-760), PHYSICS (761-880), CHEMISTRY (881-1000)
-    "all": range(1, 1001) # Full range for combined evaluation
-}
+    return np.asarray(score, dtype=np.float64)
+
+
+class PromptIndex:
+    """prompt_id -> category/subcategory lookup, built once from the dataset JSON.
 
-def process_jsonl_file_segment(file_path, category_arg=None):
+    Codes live in arrays indexed directly by prompt_id (-1 where an id is not
+    in the dataset), so classifying a whole score file is one indexing
+    operation, and the category boundaries come from the data rather than
+    from hard-coded ranges.
     """
-    Processes a segment of a JSONL file, collecting scores and present prompt_ids.
+
+    def __init__(self, json_paths=(DEFAULT_JSON_PATH,)):
+        prompts = {}
+        for path in json_paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                for item in json.load(f):
+                    prompts[int(item['prompt_id'])] = item
+
+        unknown = sorted({item['Category'] for item in prompts.values()} - set(CATEGORY_LABELS))
+        if unknown:
+            raise ValueError(f"{', '.join(json_paths)}: unknown Category value(s) {unknown}; add them to CATEGORY_LABELS")
+
+        ids = np.fromiter(prompts, dtype=np.int64, count=len(prompts))
+        if len(ids) == 0 or ids.min() < 0:
+            raise ValueError(f"{', '.join(json_paths)}: expected non-negative integer prompt_ids")
+        self.subcategories = sorted({item.get('Subcategory') or '' for item in prompts.values()})
+        subcategory_codes = {name: code for code, name in enumerate(self.subcategories)}
+
+        self.prompt_ids = np.sort(ids)
+        self.category = np.full(int(ids.max()) + 1, -1, dtype=np.int8)
+        self.subcategory = np.full(len(self.category), -1, dtype=np.int16)
+        self.category[ids] = [CATEGORY_CODES[CATEGORY_LABELS[item['Category']]] for item in prompts.values()]
+        self.subcategory[ids] = [subcategory_codes[item.get('Subcategory') or ''] for item in prompts.values()]
+
+    def _lookup(self, table, prompt_ids):
+        prompt_ids = np.asarray(prompt_ids, dtype=np.int64)
+        codes = np.full(prompt_ids.shape, -1, dtype=table.dtype)
+        known = (prompt_ids >= 0) & (prompt_ids < len(table))
+        codes[known] = table[prompt_ids[known]]
+        return codes
+
+    def categories_of(self, prompt_ids):
+        """Category code (index into ORDERED_CATEGORIES) per prompt_id; -1 if not in the dataset."""
+        return self._lookup(self.category, prompt_ids)
+
+    def subcategories_of(self, prompt_ids):
+        """Subcategory code (index into self.subcategories) per prompt_id; -1 if not in the dataset."""
+        return self._lookup(self.subcategory, prompt_ids)
+
+    def expected_ids(self, labels):
+        """Sorted prompt_ids belonging to the given report categories."""
+        codes = [CATEGORY_CODES[label] for label in labels]
+        return self.prompt_ids[np.isin(self.category[self.prompt_ids], codes)]
+
+
+@lru_cache(maxsize=None)
+def load_prompt_index(json_paths=(DEFAULT_JSON_PATH,)):
+    return PromptIndex(tuple(json_paths))
+
+
+def _read_records(file_path):
+    """Parsed JSONL records and their line numbers; unparsable lines are reported and skipped."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    line_nums = [n for n, line in enumerate(lines, 1) if line.strip()]
+    try:
+        # One parser call for the whole file; per-line parsing only to locate bad lines.
+        records = json.loads("[" + ",".join(lines[n - 1] for n in line_nums) + "]")
+        if len(records) == len(line_nums) and all(isinstance(r, dict) for r in records):
+            return records, line_nums
+    except json.JSONDecodeError:
+        pass
+
+    records, good_nums = [], []
+    for line_num in line_nums:
+        try:
+            data = json.loads(lines[line_num - 1])
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            print(f"Warning: File '{file_path}', Line {line_num}: Invalid JSON format. Skipping this line.")
+            continue
+        records.append(data)
+        good_nums.append(line_num)
+    return records, good_nums
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def process_jsonl_file_segment(file_path, category_arg=None, soft=False, index=None):
+    """
+    Loads one JSONL score file into arrays: every integer 'prompt_id' present, and
+    the prompt_id, category code and WiScore of each sample with a valid binary 'score'.
     Performs prompt_id validation if a specific category_arg is provided for a single file.
+    With soft=True, each sample contributes its 'score_prob' (P(score=1), written by
+    vllm_eval.py --score_mode guided) instead of the binary score, when present.
     Returns collected data or None if critical errors or missing prompt_ids (for single-file validation).
     """
-    segment_scores = defaultdict(list)
-    segment_present_prompt_ids = set()
-    
+    index = index or load_prompt_index()
+
     if not os.path.exists(file_path):
         print(f"Error: File '{file_path}' not found.")
         return None
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line_num, line in enumerate(file, 1):
-                try:
-                    data = json.loads(line)
-                    
-                    prompt_id = data.get('prompt_id')
-                    if prompt_id is None:
-                        print(f"Warning: File '{file_path}', Line {line_num}: Missing 'prompt_id'. Skipping this line.")
-                        continue
-                    
-                    if not isinstance(prompt_id, int):
-                        print(f"Warning: File '{file_path}', Line {line_num}: 'prompt_id' is not an integer. Skipping this line.")
-                        continue
-
-                    segment_present_prompt_ids.add(prompt_id)
-                    
-                    score = data.get('score')
-
-                    if not isinstance(score, (int, float)):
-                        print(f"Warning: File '{file_path}', Line {line_num}: Missing or non-numeric 'score'. Skipping this line for category calculation.")
-                        continue
-
-                    if score not in (0, 1, 0.0, 1.0):
-                        print(f"Warning: File '{file_path}', Line {line_num}: score={score} is outside the expected binary range {{0, 1}}. Skipping this line.")
-                        continue
-                    
-                    wiscore = calculate_wiscore(score)
-
-                    # Determine category based on prompt_id
-                    if 1 <= prompt_id <= 400:
-                        segment_scores['CULTURE'].append(wiscore)
-                    elif 401 <= prompt_id <= 520:
-                        segment_scores['TIME'].append(wiscore)
-                    elif 521 <= prompt_id <= 640:
-                        segment_scores['SPACE'].append(wiscore)
-                    elif 641 <= prompt_id <= 760:
-                        segment_scores['BIOLOGY'].append(wiscore)
-                    elif 761 <= prompt_id <= 880:
-                        segment_scores['PHYSICS'].append(wiscore)
-                    elif 881 <= prompt_id <= 1000:
-                        segment_scores['CHEMISTRY'].append(wiscore)
-                    else:
-                        print(f"Warning: File '{file_path}', Line {line_num}: prompt_id {prompt_id} is outside defined categories. Skipping this line.")
-                        continue
-
-                except json.JSONDecodeError:
-                    print(f"Warning: File '{file_path}', Line {line_num}: Invalid JSON format. Skipping this line.")
-                except KeyError as e:
-                    print(f"Warning: File '{file_path}', Line {line_num}: Missing expected key '{e}'. Skipping this line.")
+        records, line_nums = _read_records(file_path)
     except Exception as e:
         print(f"Error reading file '{file_path}': {e}")
         return None
-    
+    line_nums = np.asarray(line_nums, dtype=np.int64)
+
+    raw_ids = [r.get('prompt_id') for r in records]
+    has_id = np.array([pid is not None for pid in raw_ids], dtype=bool)
+    id_ok = np.array([isinstance(pid, int) for pid in raw_ids], dtype=bool)
+    for line_num in line_nums[~has_id]:
+        print(f"Warning: File '{file_path}', Line {line_num}: Missing 'prompt_id'. Skipping this line.")
+    for line_num in line_nums[has_id & ~id_ok]:
+        print(f"Warning: File '{file_path}', Line {line_num}: 'prompt_id' is not an integer. Skipping this line.")
+
+    kept = np.flatnonzero(id_ok)
+    prompt_ids = np.array([raw_ids[i] for i in kept], dtype=np.int64)
+    raw_scores = [records[i].get('score') for i in kept]
+    numeric = np.array([isinstance(s, (int, float)) for s in raw_scores], dtype=bool)
+    scores = calculate_wiscore([s if ok else np.nan for s, ok in zip(raw_scores, numeric)])
+    binary = numeric & ((scores == 0) | (scores == 1))
+    for line_num in line_nums[kept[~numeric]]:
+        print(f"Warning: File '{file_path}', Line {line_num}: Missing or non-numeric 'score'. Skipping this line for category calculation.")
+    for i in np.flatnonzero(numeric & ~binary):
+        print(f"Warning: File '{file_path}', Line {line_nums[kept[i]]}: score={raw_scores[i]} is outside the expected binary range {{0, 1}}. Skipping this line.")
+
+    if soft:
+        probs = np.array([p if _is_number(p) else np.nan for p in (records[i].get('score_prob') for i in kept)], dtype=np.float64)
+        valid_prob = (probs >= 0) & (probs <= 1)
+        scores = np.where(valid_prob, probs, scores)
+        soft_fallbacks = int(np.count_nonzero(binary & ~valid_prob))
+        if soft_fallbacks:
+            print(f"Warning: File '{file_path}': {soft_fallbacks} samples have no valid 'score_prob'; using their binary score.")
+
+    categories = index.categories_of(prompt_ids)
+    for i in np.flatnonzero(binary & (categories < 0)):
+        print(f"Warning: File '{file_path}', Line {line_nums[kept[i]]}: prompt_id {prompt_ids[i]} is outside defined categories. Skipping this line.")
+    scored = binary & (categories >= 0)
+
     # --- Single-file prompt_id validation logic ---
-    if category_arg and category_arg != 'all' and category_arg in EXPECTED_PROMPT_RANGES:
-        expected_ids_for_this_category = set(EXPECTED_PROMPT_RANGES[category_arg])
-        missing_ids_in_segment = expected_ids_for_this_category - segment_present_prompt_ids
+    if category_arg and category_arg != 'all' and category_arg in CATEGORY_ARG_GROUPS:
+        missing_ids_in_segment = np.setdiff1d(index.expected_ids(CATEGORY_ARG_GROUPS[category_arg]), prompt_ids)
 
-        if missing_ids_in_segment:
+        if len(missing_ids_in_segment):
             print(f"Error: File '{file_path}': When evaluating as '--category {category_arg}', "
-                  f"missing the following prompt_ids: {sorted(list(missing_ids_in_segment))}")
+                  f"missing the following prompt_ids: {missing_ids_in_segment.tolist()}")
             return None # Return None if required prompt_ids are missing for a specific category file
-    
+
     return {
-        'scores': segment_scores,
-        'present_prompt_ids': segment_present_prompt_ids,
+        'prompt_ids': prompt_ids,
+        'scored_ids': prompt_ids[scored],
+        'categories': categories[scored],
+        'scores': scores[scored],
         'file_path': file_path
     }
 
+
+def category_totals(categories, scores, groups=None, num_groups=1):
+    """Per-category score sums and sample counts with one bincount each.
+
+    `groups` (e.g. a file or model number per sample) splits the totals into
+    rows, giving arrays of shape (num_groups, len(ORDERED_CATEGORIES)).
+    """
+    width = len(ORDERED_CATEGORIES)
+    bins = np.asarray(categories, dtype=np.int64)
+    if groups is not None:
+        bins = np.asarray(groups, dtype=np.int64) * width + bins
+    sums = np.bincount(bins, weights=scores, minlength=num_groups * width).reshape(num_groups, width)
+    counts = np.bincount(bins, minlength=num_groups * width).reshape(num_groups, width)
+    return sums, counts
+
+
+def category_means(sums, counts):
+    """Average WiScore per category; NaN where a category has no samples."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def overall_wiscore(means):
+    """Weighted overall WiScore over the last axis of `means` (one row per run works too)."""
+    return np.asarray(means) @ CATEGORY_WEIGHTS
+
+
+def binomial_bootstrap_means(sums, counts, n_resamples=10000, seed=0):
+    """Stratified bootstrap replicates of per-category means for binary scores, from totals alone.
+
+    Resampling n binary scores with replacement draws Binomial(n, mean) ones,
+    so each category's replicates are one vectorized binomial draw. Leading
+    axes of `sums`/`counts` (e.g. one row per model) are kept: the result has
+    shape (..., n_resamples, len(ORDERED_CATEGORIES)), NaN where a category
+    has no samples.
+    """
+    rng = np.random.default_rng(seed)
+    sums = np.asarray(sums, dtype=np.float64)[..., None, :]
+    counts = np.asarray(counts, dtype=np.int64)[..., None, :]
+    p = np.nan_to_num(category_means(sums, counts))
+    shape = counts.shape[:-2] + (n_resamples, counts.shape[-1])
+    return category_means(rng.binomial(counts, np.clip(p, 0.0, 1.0), size=shape), counts)
+
+
+def bootstrap_means(categories, scores, n_resamples=10000, seed=0, chunk_elements=1 << 24):
+    """Stratified bootstrap replicates of the per-category means, shape (n_resamples, len(ORDERED_CATEGORIES)).
+
+    Each category is resampled on its own, so every replicate keeps the
+    benchmark's per-category sample sizes. Binary scores use the exact
+    binomial shortcut; soft scores are resampled by index in chunks of about
+    `chunk_elements` draws to bound memory.
+    """
+    categories = np.asarray(categories)
+    scores = np.asarray(scores, dtype=np.float64)
+    if np.isin(scores, (0.0, 1.0)).all():
+        sums, counts = category_totals(categories, scores)
+        return binomial_bootstrap_means(sums[0], counts[0], n_resamples, seed)
+
+    rng = np.random.default_rng(seed)
+    replicates = np.full((n_resamples, len(ORDERED_CATEGORIES)), np.nan)
+    for code in range(len(ORDERED_CATEGORIES)):
+        values = scores[categories == code]
+        if len(values) == 0:
+            continue
+        step = max(1, chunk_elements // len(values))
+        for start in range(0, n_resamples, step):
+            stop = min(n_resamples, start + step)
+            picks = rng.integers(0, len(values), size=(stop - start, len(values)))
+            replicates[start:stop, code] = values[picks].mean(axis=1)
+    return replicates
+
+
+def percentile_interval(replicates, confidence=0.95, axis=0):
+    """(low, high) percentile bootstrap interval over the resample `axis`."""
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(replicates, [tail, 100 - tail], axis=axis)
+    return low, high
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Evaluate JSONL files for model performance, categorizing scores by prompt_id."
@@ -119,17 +295,49 @@ def main():
         default='all',
         help="Specify the category of the JSONL file(s) for specific prompt_id validation. Choose from 'culture', 'space-time', 'science', or 'all' (default). If evaluating a single category file, use the corresponding category."
     )
-    
+    parser.add_argument(
+        '--soft',
+        action='store_true',
+        help="Average P(score=1) ('score_prob', from vllm_eval.py --score_mode guided) instead of the binary score."
+    )
+    parser.add_argument(
+        '--json_path',
+        nargs='+',
+        default=[DEFAULT_JSON_PATH],
+        help="Prompt file(s) defining each prompt_id's Category and Subcategory (default: data_verified/merge.json)."
+    )
+    parser.add_argument(
+        '--bootstrap',
+        type=int,
+        default=0,
+        metavar='N',
+        help="Report stratified-bootstrap confidence intervals from N resamples (e.g. 10000); 0 disables them."
+    )
+    parser.add_argument(
+        '--confidence',
+        type=float,
+        default=0.95,
+        help="Confidence level of the bootstrap intervals (default: 0.95)."
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help="Random seed for the bootstrap resamples."
+    )
+
     args = parser.parse_args()
-    
+    score_label = "soft" if args.soft else "binary"
+    index = load_prompt_index(tuple(args.json_path))
+
     all_raw_results = []
-    
+
     # Process each file to collect raw scores and prompt IDs
     for file_path in args.files:
         print(f"\n--- Processing file: {file_path} ---")
         # Pass the category argument to process_jsonl_file_segment
         # This enables single-file validation logic
-        results = process_jsonl_file_segment(file_path, args.category if len(args.files) == 1 else None)
+        results = process_jsonl_file_segment(file_path, args.category if len(args.files) == 1 else None, soft=args.soft, index=index)
         if results:
             all_raw_results.append(results)
         else:
@@ -139,44 +347,40 @@ def main():
         print("No valid data processed from any of the provided files. Exiting.")
         return # Exit if no files were successfully processed
 
-    # Aggregate data across all successful files
-    aggregated_scores = defaultdict(list)
-    combined_present_prompt_ids = set()
-    final_file_reports = {} # To store calculated averages/counts per file for individual display
+    # Per-file and aggregated totals in one pass over all samples
+    file_numbers = np.repeat(np.arange(len(all_raw_results)), [len(r['scores']) for r in all_raw_results])
+    file_sums, file_counts = category_totals(
+        np.concatenate([r['categories'] for r in all_raw_results]),
+        np.concatenate([r['scores'] for r in all_raw_results]),
+        groups=file_numbers,
+        num_groups=len(all_raw_results),
+    )
+    file_means = category_means(file_sums, file_counts)
+    overall_counts = file_counts.sum(axis=0)
+    overall_means = category_means(file_sums.sum(axis=0), overall_counts)
 
-    for file_data in all_raw_results:
-        file_path = file_data['file_path']
-        combined_present_prompt_ids.update(file_data['present_prompt_ids'])
-        
-        # Calculate scores for this individual file (for individual file report)
-        current_file_avg_scores = {}
-        current_file_num_samples = {}
-        detected_categories_in_file = []
-
-        for category, scores_list in file_data['scores'].items():
-            aggregated_scores[category].extend(scores_list) # Aggregate for overall score later
-            
-            if scores_list: # Only add to individual file report if samples exist
-                current_file_avg_scores[category] = sum(scores_list) / len(scores_list)
-                current_file_num_samples[category] = len(scores_list)
-                detected_categories_in_file.append(category)
-
-        final_file_reports[file_path] = {
-            'average': current_file_avg_scores,
-            'num_processed_samples': current_file_num_samples,
-            'detected_categories': detected_categories_in_file
-        }
+    if args.bootstrap > 0:
+        replicates = bootstrap_means(
+            np.concatenate([r['categories'] for r in all_raw_results]),
+            np.concatenate([r['scores'] for r in all_raw_results]),
+            n_resamples=args.bootstrap,
+            seed=args.seed,
+        )
+        ci_label = f"{args.confidence:.0%} CI"
+        category_ci = percentile_interval(replicates, args.confidence)
+        # Categories are resampled independently, so each replicate's overall score keeps the 0.4/0.12 weights.
+        overall_ci = percentile_interval(overall_wiscore(replicates), args.confidence)
 
     # --- Step 1: Validate Prompt IDs for 'all' category scenario ---
     # This check happens only when --category all is explicitly chosen or is the default for multiple files.
     # Single-file specific category validation happens inside process_jsonl_file_segment.
     if args.category == 'all':
-        expected_prompt_ids_for_all = set(EXPECTED_PROMPT_RANGES['all'])
-        missing_prompt_ids_in_combined = expected_prompt_ids_for_all - combined_present_prompt_ids
+        combined_present_prompt_ids = np.concatenate([r['prompt_ids'] for r in all_raw_results])
+        missing_prompt_ids_in_combined = np.setdiff1d(index.prompt_ids, combined_present_prompt_ids)
 
-        if missing_prompt_ids_in_combined:
+        if len(missing_prompt_ids_in_combined):
             print(f"\nError: When '--category all' is specified, the combined files are missing the following prompt_ids:")
-            print(f"Missing IDs: {sorted(list(missing_prompt_ids_in_combined))}")
+            print(f"Missing IDs: {missing_prompt_ids_in_combined.tolist()}")
             print("\nAborting overall evaluation due to incomplete data.")
             return # Exit if combined prompt IDs are missing when 'all' is expected
 
@@ -185,23 +389,17 @@ def main():
     print("                 Individual File Reports")
     print("="*50 + "\n")
 
-    ordered_categories = ['CULTURE', 'TIME', 'SPACE', 'BIOLOGY', 'PHYSICS', 'CHEMISTRY']
-
-    for file_path, file_data in final_file_reports.items():
+    for file_data, means, counts in zip(all_raw_results, file_means, file_counts):
+        file_path = file_data['file_path']
         print(f"--- Evaluation Results for File: {file_path} ---")
-        
-        categories_to_print = sorted([cat for cat in ordered_categories if cat in file_data['detected_categories']],
-                                     key=lambda x: ordered_categories.index(x))
 
-        if not categories_to_print:
+        if not counts.any():
             print("  No scores found for any defined categories in this file.")
         else:
-            for category in categories_to_print:
-                avg_score = file_data['average'].get(category, 0)
-                sample_count = file_data['num_processed_samples'].get(category, 0)
-                print(f"  Category: {category}")
-                print(f"    Average binary WiScore: {avg_score:.2f}")
-                print(f"    Number of samples: {sample_count}\n")
+            for code in np.flatnonzero(counts):
+                print(f"  Category: {ORDERED_CATEGORIES[code]}")
+                print(f"    Average {score_label} WiScore: {means[code]:.2f}")
+                print(f"    Number of samples: {counts[code]}\n")
         print("-" * (len(file_path) + 30) + "\n")
 
     # --- Step 3: Calculate and Display Overall Summary (if applicable) ---
@@ -209,47 +407,31 @@ def main():
     print("                 Overall Evaluation Summary")
     print("="*50 + "\n")
 
-    # Calculate overall averages from aggregated scores
-    overall_avg_scores = {
-        category: sum(scores) / len(scores) if len(scores) > 0 else 0
-        for category, scores in aggregated_scores.items()
-    }
-    overall_num_samples = {
-        category: len(scores)
-        for category, scores in aggregated_scores.items()
-    }
-
     # Print overall category scores (only for categories that have samples)
-    overall_categories_to_print = sorted([cat for cat in ordered_categories if overall_num_samples.get(cat, 0) > 0],
-                                          key=lambda x: ordered_categories.index(x))
-    
-    if not overall_categories_to_print and args.category != 'all':
+    if not overall_counts.any() and args.category != 'all':
         print("No valid scores found for any categories in the aggregated data.")
     else:
         print("Aggregated Category Scores:")
-        for category in overall_categories_to_print:
-            print(f"  Category: {category}")
-            print(f"    Average binary WiScore: {overall_avg_scores.get(category, 0):.2f}")
-            print(f"    Number of samples: {overall_num_samples.get(category, 0)}\n")
+        for code in np.flatnonzero(overall_counts):
+            print(f"  Category: {ORDERED_CATEGORIES[code]}")
+            print(f"    Average {score_label} WiScore: {overall_means[code]:.2f}")
+            if args.bootstrap > 0:
+                print(f"    {ci_label}: [{category_ci[0][code]:.2f}, {category_ci[1][code]:.2f}]")
+            print(f"    Number of samples: {overall_counts[code]}\n")
 
     # Calculate and print Overall WiScore if '--category all' was specified and all categories have samples
-    all_categories_have_overall_samples = all(overall_num_samples.get(cat, 0) > 0 for cat in ordered_categories)
-    
+    all_categories_have_overall_samples = bool(overall_counts.all())
+
     if args.category == 'all' and all_categories_have_overall_samples:
-        cultural_score = overall_avg_scores.get('CULTURE', 0)
-        time_score = overall_avg_scores.get('TIME', 0)
-        space_score = overall_avg_scores.get('SPACE', 0)
-        biology_score = overall_avg_scores.get('BIOLOGY', 0)
-        physics_score = overall_avg_scores.get('PHYSICS', 0)
-        chemistry_score = overall_avg_scores.get('CHEMISTRY', 0)
-
-        overall_wiscore = (0.4 * cultural_score + 0.12 * time_score + 0.12 * space_score +
-                           0.12 * biology_score + 0.12 * physics_score + 0.12 * chemistry_score)
-        
+        overall_score = overall_wiscore(overall_means)
+        cultural_score, time_score, space_score, biology_score, physics_score, chemistry_score = overall_means
+
         print("\n--- Overall WiScore Across All Categories ---")
-        print(f"Overall WiScore: {overall_wiscore:.2f}")
+        print(f"Overall WiScore: {overall_score:.2f}")
+        if args.bootstrap > 0:
+            print(f"Overall WiScore {ci_label}: [{overall_ci[0]:.2f}, {overall_ci[1]:.2f}] ({args.bootstrap} stratified bootstrap resamples)")
         print("Cultural\tTime\tSpace\tBiology\tPhysics\tChemistry\tOverall")
-        print(f"{cultural_score:.2f}\t\t{time_score:.2f}\t{space_score:.2f}\t{biology_score:.2f}\t{physics_score:.2f}\t{chemistry_score:.2f}\t\t{overall_wiscore:.2f}")
+        print(f"{cultural_score:.2f}\t\t{time_score:.2f}\t{space_score:.2f}\t{biology_score:.2f}\t{physics_score:.2f}\t{chemistry_score:.2f}\t\t{overall_score:.2f}")
     elif args.category == 'all' and not all_categories_have_overall_samples:
         print("\nOverall WiScore cannot be calculated: Not all categories have samples in the aggregated data when '--category all' is specified.")
     else:
@@ -6,43 +6,33 @@ cd "${SCRIPT_DIR}"
 
 : "${IMAGE_DIR:?Please set IMAGE_DIR to the directory containing 1.png ... 1000.png}"
 
+# Space-separated list to load-balance across several vLLM replicas.
 VLLM_API_BASE="${VLLM_API_BASE:-http://127.0.0.1:8000/v1}"
+read -r -a API_BASES <<< "${VLLM_API_BASE}"
 VLLM_API_KEY="${VLLM_API_KEY:-EMPTY}"
 JUDGE_MODEL="${JUDGE_MODEL:-Qwen3.5-35B-A3B}"
 MAX_WORKERS="${MAX_WORKERS:-96}"
+ENGINE="${ENGINE:-threads}"
+# json (legacy array), jsonl, jsonl.gz or jsonl.zst
+FULL_EXT="${FULL_EXT:-json}"
+# Extra vllm_eval.py flags, e.g. EVAL_ARGS="--cache_path ${HOME}/.cache/wise/judge_cache.sqlite"
+read -r -a EXTRA_EVAL_ARGS <<< "${EVAL_ARGS:-}"
 
+# All three categories go through one worker pool; results are still written
+# per category ({category} = cultural_common_sense, spatio-temporal_reasoning,
+# natural_science) for calculate_verified.py.
 python vllm_eval.py \
-    --json_path data_verified/cultural_common_sense_verified.json \
-    --output_dir "${IMAGE_DIR}/Results-qwen35/cultural_common_sense" \
+    --json_path data_verified/merge.json \
+    --output_dir "${IMAGE_DIR}/Results-qwen35" \
     --image_dir "${IMAGE_DIR}" \
     --api_key "${VLLM_API_KEY}" \
-    --api_base "${VLLM_API_BASE}" \
+    --api_base "${API_BASES[@]}" \
     --model "${JUDGE_MODEL}" \
-    --result_full "${IMAGE_DIR}/Results-qwen35/cultural_common_sense_full_results.json" \
-    --result_scores "${IMAGE_DIR}/Results-qwen35/cultural_common_sense_scores_results.jsonl" \
-    --max_workers "${MAX_WORKERS}"
-
-python vllm_eval.py \
-    --json_path data_verified/spatio-temporal_reasoning_verified.json \
-    --output_dir "${IMAGE_DIR}/Results-qwen35/spatio-temporal_reasoning" \
-    --image_dir "${IMAGE_DIR}" \
-    --api_key "${VLLM_API_KEY}" \
-    --api_base "${VLLM_API_BASE}" \
-    --model "${JUDGE_MODEL}" \
-    --result_full "${IMAGE_DIR}/Results-qwen35/spatio-temporal_reasoning_full_results.json" \
-    --result_scores "${IMAGE_DIR}/Results-qwen35/spatio-temporal_reasoning_scores_results.jsonl" \
-    --max_workers "${MAX_WORKERS}"
-
-python vllm_eval.py \
-    --json_path data_verified/natural_science_verified.json \
-    --output_dir "${IMAGE_DIR}/Results-qwen35/natural_science" \
-    --image_dir "${IMAGE_DIR}" \
-    --api_key "${VLLM_API_KEY}" \
-    --api_base "${VLLM_API_BASE}" \
-    --model "${JUDGE_MODEL}" \
-    --result_full "${IMAGE_DIR}/Results-qwen35/natural_science_full_results.json" \
-    --result_scores "${IMAGE_DIR}/Results-qwen35/natural_science_scores_results.jsonl" \
-    --max_workers "${MAX_WORKERS}"
+    --result_full "{category}_full_results.${FULL_EXT}" \
+    --result_scores "{category}_scores_results.jsonl" \
+    --max_workers "${MAX_WORKERS}" \
+    --engine "${ENGINE}" \
+    ${EXTRA_EVAL_ARGS[@]+"${EXTRA_EVAL_ARGS[@]}"}
 
 python calculate_verified.py \
     "${IMAGE_DIR}/Results-qwen35/cultural_common_sense_scores_results.jsonl" \
@@ -0,0 +1,110 @@
+import base64
+import io
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from image_source import ImageRef, read_image
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF8", "gif"),
+)
+
+
+def sniff_format(data: bytes) -> str:
+    for magic, fmt in _MAGIC:
+        if data.startswith(magic):
+            return fmt
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    # Unknown: keep the historical default the judge has always been sent.
+    return "png"
+
+
+def prepare_image_bytes(
+    data: bytes,
+    max_pixels: Optional[int] = None,
+    image_format: Optional[str] = None,
+    quality: int = 90,
+) -> Tuple[str, str, int]:
+    """Returns (base64, mime, encoded_bytes) for one image.
+
+    Images above `max_pixels` are downscaled (aspect preserved, Lanczos) and
+    optionally transcoded to `image_format`. An image that needs neither is
+    passed through byte-for-byte without being decoded. Runs in a worker
+    process, so it must stay a plain top-level function.
+    """
+    src_fmt = sniff_format(data)
+    out_fmt = image_format or src_fmt
+
+    img = None
+    if max_pixels or out_fmt != src_fmt:
+        try:
+            from PIL import Image
+        except ImportError as e:
+            raise RuntimeError("image pre-processing requires Pillow (pip install pillow)") from e
+        img = Image.open(io.BytesIO(data))
+        w, h = img.size
+        needs_resize = bool(max_pixels) and w * h > max_pixels
+        if not needs_resize and out_fmt == src_fmt:
+            img = None
+        elif needs_resize:
+            scale = math.sqrt(max_pixels / (w * h))
+            img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+
+    if img is not None:
+        if out_fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        save_kwargs = {"quality": quality} if out_fmt in ("jpeg", "webp") else {"optimize": False}
+        img.save(buf, format=out_fmt.upper(), **save_kwargs)
+        data = buf.getvalue()
+
+    return base64.b64encode(data).decode(), MIME_TYPES[out_fmt], len(data)
+
+
+def prepare_image(
+    ref: Union[str, ImageRef],
+    max_pixels: Optional[int] = None,
+    image_format: Optional[str] = None,
+    quality: int = 90,
+) -> Tuple[str, str, int, int, Tuple[float, float]]:
+    """Wrapper around prepare_image_bytes for a file path or an image_source.ImageRef.
+
+    Also returns the original size and the (read, encode) times in seconds,
+    measured where the work ran (possibly a worker process).
+    """
+    start = time.perf_counter()
+    data = read_image(ref)
+    read_done = time.perf_counter()
+    img64, mime, sent = prepare_image_bytes(data, max_pixels, image_format, quality)
+    return img64, mime, len(data), sent, (read_done - start, time.perf_counter() - read_done)
+
+
+class PrepStats:
+    """Thread-safe tally of original vs. transmitted image bytes."""
+
+    def __init__(self):
+        self.images = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, original: int, sent: int):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original
+            self.sent_bytes += sent
+
+    def summary(self) -> Dict[str, float]:
+        saved = 1 - self.sent_bytes / self.original_bytes if self.original_bytes else 0.0
+        return {
+            "images": self.images,
+            "original_mb": round(self.original_bytes / 2**20, 2),
+            "sent_mb": round(self.sent_bytes / 2**20, 2),
+            "saved": saved,
+        }
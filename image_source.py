@@ -0,0 +1,257 @@
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import tarfile
+import threading
+import zipfile
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Searched in this order when a prompt has several candidates (e.g. 12.png and 12.jpg).
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".zip")
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+
+# "12", "000012", "sample_000012", "flux-12": the trailing number is the prompt id.
+_KEY_ID = re.compile(r"(?:^|[_\-])(\d+)$")
+_ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+class ImageRef(NamedTuple):
+    """Where one image's bytes live: a whole file, a byte range of an archive, or a compressed member.
+
+    Plain and picklable, so it can be handed to image pre-processing worker
+    processes, which then read the bytes themselves.
+    """
+
+    path: str
+    offset: int = 0
+    size: int = -1  # -1: the whole file
+    member: Optional[str] = None  # archive member name; None for a loose file
+    codec: Optional[str] = None  # "zip"/"tar" when the member must be decompressed
+
+    def __str__(self) -> str:
+        return self.path if self.member is None else f"{self.path}::{self.member}"
+
+
+def prompt_id_for(name: str) -> Optional[Tuple[int, int]]:
+    """(prompt_id, extension rank) for an image file or archive member name, or None if it isn't one.
+
+    Follows the WebDataset convention that the key is the basename up to the
+    first dot, so "000012.png" and "shard/000012.png" are both prompt 12.
+    """
+    base = name.rsplit("/", 1)[-1]
+    key, dot, ext = base.partition(".")
+    ext = dot + ext.lower()
+    if ext not in IMAGE_EXTENSIONS:
+        return None
+    m = _KEY_ID.search(key)
+    if m is None:
+        return None
+    return int(m.group(1)), IMAGE_EXTENSIONS.index(ext)
+
+
+# ---- Reading (also runs in worker processes) ----
+
+_handles: Dict[str, object] = {}
+_handles_lock = threading.Lock()
+
+
+def _mapping(path: str):
+    # One read-only mapping per archive per process; None where mmap isn't possible.
+    with _handles_lock:
+        if path not in _handles:
+            try:
+                with open(path, "rb") as f:
+                    _handles[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                _handles[path] = None
+        return _handles[path]
+
+
+def _read_range(path: str, offset: int, size: int) -> bytes:
+    mm = _mapping(path)
+    if mm is not None:
+        return mm[offset : offset + size]
+    with open(path, "rb") as f:
+        return os.pread(f.fileno(), size, offset)
+
+
+def _read_member(ref: ImageRef) -> bytes:
+    # Compressed members can't be sliced; decompress through a per-process archive handle.
+    handle_key = f"{ref.codec}:{ref.path}"
+    with _handles_lock:
+        if handle_key not in _handles:
+            if ref.codec == "zip":
+                _handles[handle_key] = (zipfile.ZipFile(ref.path), threading.Lock())
+            else:
+                _handles[handle_key] = (tarfile.open(ref.path, "r:*"), threading.Lock())
+        archive, lock = _handles[handle_key]
+    with lock:
+        if ref.codec == "zip":
+            return archive.read(ref.member)
+        return archive.extractfile(ref.member).read()
+
+
+def read_image(ref) -> bytes:
+    """Bytes of the image at `ref` (an ImageRef or a plain file path)."""
+    if isinstance(ref, str):
+        ref = ImageRef(ref)
+    if ref.codec is not None:
+        return _read_member(ref)
+    if ref.member is None:
+        with open(ref.path, "rb") as f:
+            return f.read()
+    return _read_range(ref.path, ref.offset, ref.size)
+
+
+def image_nbytes(ref) -> int:
+    """Size of the (uncompressed) image at `ref` without reading it."""
+    if isinstance(ref, str) or ref.size < 0:
+        return os.path.getsize(str(ref) if isinstance(ref, str) else ref.path)
+    return ref.size
+
+
+# ---- Indexing ----
+
+
+def _index_tar(path: str) -> Iterator[Tuple[str, int, int, Optional[str]]]:
+    try:
+        tf = tarfile.open(path, "r:")
+        codec = None
+    except tarfile.ReadError:
+        # Compressed tar: members have no fixed byte range, so reads must decompress.
+        tf = tarfile.open(path, "r:*")
+        codec = "tar"
+    with tf:
+        for info in tf:
+            if info.isfile():
+                yield info.name, info.offset_data, info.size, codec
+
+
+def _index_zip(path: str) -> Iterator[Tuple[str, int, int, Optional[str]]]:
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                yield info.filename, 0, info.file_size, "zip"
+                continue
+            # Stored members (the usual case for PNG/JPEG) sit verbatim after their local header.
+            magic, name_len, extra_len = _ZIP_LOCAL_HEADER.unpack(os.pread(f.fileno(), _ZIP_LOCAL_HEADER.size, info.header_offset))
+            if magic != b"PK\x03\x04":
+                raise zipfile.BadZipFile(f"bad local header for {info.filename} in {path}")
+            yield info.filename, info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len, info.file_size, None
+
+
+def _archive_members(path: str, cache_index: bool) -> List:
+    """Member table of one archive, read from (or saved to) its `<archive>.idx.json` sidecar.
+
+    The sidecar is keyed by the archive's size and mtime, so a rewritten shard
+    is re-indexed. Listing a tar means reading every header; with the sidecar
+    that happens once per shard rather than once per run.
+    """
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    index_path = path + INDEX_SUFFIX
+    if cache_index:
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("version") == INDEX_VERSION and cached.get("stamp") == stamp:
+                return cached["members"]
+        except (OSError, ValueError):
+            pass
+
+    lister = _index_zip if path.lower().endswith(".zip") else _index_tar
+    members = [list(m) for m in lister(path)]
+    if cache_index:
+        try:
+            tmp = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "stamp": stamp, "members": members}, f)
+            os.replace(tmp, index_path)
+        except OSError:
+            # Read-only storage: the index is simply rebuilt next time.
+            pass
+    return members
+
+
+def _is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ImageSource:
+    """Index from prompt id to image location over directories and tar/zip/WebDataset shards.
+
+    Built once up front (one directory listing, one header scan per
+    archive), so evaluating a prompt needs no filesystem probing. Uncompressed
+    archive members are read through mmap; loose files are read directly.
+    """
+
+    def __init__(self, spec: str, cache_index: bool = True):
+        self.spec = spec
+        self.archives = 0
+        self.duplicates = 0
+        self._refs: Dict[int, Tuple[Tuple[bool, int], ImageRef]] = {}
+
+        if os.path.isdir(spec):
+            with os.scandir(spec) as it:
+                entries = sorted((e for e in it if e.is_file()), key=lambda e: e.name)
+            archives = [e.path for e in entries if _is_archive(e.path)]
+            for e in entries:
+                self._add(e.name, ImageRef(e.path), archived=False)
+        else:
+            if glob.has_magic(spec):
+                # e.g. "shards/*" also matches the .idx.json sidecars.
+                archives = [p for p in sorted(glob.glob(spec)) if _is_archive(p) and os.path.isfile(p)]
+            elif os.path.isfile(spec):
+                archives = [spec]
+            else:
+                raise FileNotFoundError(f"image source not found: {spec}")
+            if not archives or not all(map(_is_archive, archives)):
+                raise ValueError(f"{spec}: expected a directory or {'/'.join(ARCHIVE_EXTENSIONS)} shards")
+
+        for path in archives:
+            self.archives += 1
+            for name, offset, size, codec in _archive_members(path, cache_index):
+                self._add(name, ImageRef(path, offset, size, name, codec), archived=True)
+
+    def _add(self, name: str, ref: ImageRef, archived: bool):
+        found = prompt_id_for(name)
+        if found is None:
+            return
+        pid, ext_rank = found
+        # Loose files beat archive members whatever their extension; within a
+        # tier, the earlier extension in IMAGE_EXTENSIONS wins.
+        rank = (archived, ext_rank)
+        prev = self._refs.get(pid)
+        if prev is not None:
+            if prev[0][1] == ext_rank:
+                self.duplicates += 1
+            if prev[0] <= rank:
+                return
+        self._refs[pid] = (rank, ref)
+
+    def get(self, prompt_id: int) -> Optional[ImageRef]:
+        entry = self._refs.get(prompt_id)
+        return None if entry is None else entry[1]
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def describe(self) -> str:
+        kind = f"{self.archives} archive(s)" if self.archives else "directory"
+        dup = f", {self.duplicates} duplicate(s) ignored" if self.duplicates else ""
+        return f"{self.spec}: {len(self)} images from {kind}{dup}"
+
+
+def source_root(spec: str) -> str:
+    """Directory that per-source outputs (e.g. Results-qwen35/) go under: the directory itself, or the shards' directory."""
+    if os.path.isdir(spec):
+        return spec
+    matches = sorted(glob.glob(spec)) if glob.has_magic(spec) else [spec]
+    return os.path.dirname(os.path.abspath(matches[0] if matches else spec))
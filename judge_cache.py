@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+
+def request_cache_key(payload: Dict[str, Any]) -> str:
+    """Content address of a judge request.
+
+    The payload carries the judge model, the fully rendered messages (image
+    bytes included, as a data URL) and every decoding parameter, so identical
+    images under a different file name or output dir map to the same key.
+    """
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+ScoreProb = Union[float, Dict[int, float], None]
+
+
+class JudgeCache:
+    """Persistent judge response cache in SQLite with LRU size-bounded eviction.
+
+    Single-item entries keep P(score=1) in `score_prob`; batch entries keep
+    the per-position probabilities as JSON in `score_probs`. Safe to share
+    between worker threads; each get/put holds a lock for a single short
+    statement.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, accessed REAL,"
+            " score_prob REAL, score_probs TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "score_prob" not in columns:
+            # Caches written before the guided score mode existed.
+            self._conn.execute("ALTER TABLE responses ADD COLUMN score_prob REAL")
+        if "score_probs" not in columns:
+            # Caches written before batch entries kept their probabilities.
+            self._conn.execute("ALTER TABLE responses ADD COLUMN score_probs TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Tuple[str, ScoreProb]]:
+        """Returns (response, score probability), or None on a miss.
+
+        The probability is P(score=1) for a single-item entry, {position:
+        P(1)} for a batch entry, or None if the judge returned no logprobs.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response, score_prob, score_probs FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        if row[2] is not None:
+            return row[0], {int(pos): p for pos, p in json.loads(row[2]).items()}
+        return row[0], row[1]
+
+    def put(self, key: str, model: str, response: str, score_prob: ScoreProb = None):
+        score_probs = None
+        if isinstance(score_prob, dict):
+            score_probs = json.dumps({str(pos): p for pos, p in score_prob.items()})
+            score_prob = None
+        size = len(key) + len(response.encode("utf-8")) + len(score_probs or "")
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed, score_prob, score_probs)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now, score_prob, score_probs),
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries down to 90% of the cap so eviction isn't run on every put.
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._total <= target:
+                break
+            doomed.append((key,))
+            self._total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evicted += len(doomed)
+
+    def summary(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evicted": self.evicted,
+            "size_mb": round(self._total / 2**20, 2),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,335 @@
+import contextlib
+import json
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+from judge_pool import percentile
+from result_io import atomic_write_text
+
+# Prometheus-style cumulative latency buckets (seconds).
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class RunMetrics:
+    """Thread-safe counters, gauges and a latency histogram for one evaluation run.
+
+    Every judge HTTP request goes through request_started/request_finished,
+    every attempt outcome (ok, parse_fail, transient_error, error) through
+    record_attempt, how each image was sent (base64, file_url,
+    file_url_fallback) through record_media, and every finished item through
+    item_done. The same state is rendered as Prometheus text or as a JSON
+    snapshot.
+    """
+
+    def __init__(self, items_total: int = 0, window: int = 10000):
+        self.items_total = items_total
+        self.items_judged = 0
+        self.items_failed = 0
+        self.requests = 0
+        self.request_errors = 0
+        self.inflight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.attempts = Counter()
+        self.media = Counter()
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self._recent = deque(maxlen=window)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def request_started(self):
+        with self._lock:
+            self.inflight += 1
+
+    def request_finished(self, latency: float, ok: bool, usage: Optional[Dict[str, int]] = None):
+        with self._lock:
+            self.inflight -= 1
+            self.requests += 1
+            if not ok:
+                self.request_errors += 1
+                return
+            self.latency_sum += latency
+            self._recent.append(latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+            else:
+                self.bucket_counts[-1] += 1
+            if usage:
+                self.prompt_tokens += usage.get("prompt_tokens") or 0
+                self.completion_tokens += usage.get("completion_tokens") or 0
+
+    def request_cancelled(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def record_attempt(self, outcome: str):
+        with self._lock:
+            self.attempts[outcome] += 1
+
+    def record_media(self, transport: str):
+        with self._lock:
+            self.media[transport] += 1
+
+    def item_done(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.items_judged += 1
+            else:
+                self.items_failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            recent = list(self._recent)
+            ok_requests = self.requests - self.request_errors
+            done = self.items_judged + self.items_failed
+            rate = done / elapsed
+            remaining = max(self.items_total - done, 0)
+            cumulative, buckets = 0, {}
+            for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.bucket_counts):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else f"{bound:g}"] = cumulative
+            return {
+                "elapsed_s": round(elapsed, 3),
+                "items": {"total": self.items_total, "judged": self.items_judged, "failed": self.items_failed},
+                "items_per_s": round(rate, 3),
+                "eta_s": round(remaining / rate, 1) if rate > 0 else None,
+                "requests": self.requests,
+                "request_errors": self.request_errors,
+                "requests_per_s": round(self.requests / elapsed, 3),
+                "inflight": self.inflight,
+                "latency_s": {
+                    "count": ok_requests,
+                    "sum": round(self.latency_sum, 3),
+                    "mean": round(self.latency_sum / ok_requests, 4) if ok_requests else 0.0,
+                    # Over the most recent requests only, so a long run reflects current conditions.
+                    "p50": round(percentile(recent, 50), 4),
+                    "p95": round(percentile(recent, 95), 4),
+                    "p99": round(percentile(recent, 99), 4),
+                    "buckets": buckets,
+                },
+                "tokens": {"prompt": self.prompt_tokens, "completion": self.completion_tokens},
+                "attempts": dict(self.attempts),
+                "media": dict(self.media),
+            }
+
+    def prometheus_text(self) -> str:
+        snap = self.snapshot()
+        lines = [
+            "# TYPE wise_items_total counter",
+            f'wise_items_total{{status="judged"}} {snap["items"]["judged"]}',
+            f'wise_items_total{{status="failed"}} {snap["items"]["failed"]}',
+            "# TYPE wise_items_planned gauge",
+            f"wise_items_planned {snap['items']['total']}",
+            "# TYPE wise_judge_requests_total counter",
+            f'wise_judge_requests_total{{status="ok"}} {snap["requests"] - snap["request_errors"]}',
+            f'wise_judge_requests_total{{status="error"}} {snap["request_errors"]}',
+            "# TYPE wise_judge_inflight_requests gauge",
+            f"wise_judge_inflight_requests {snap['inflight']}",
+            "# TYPE wise_judge_tokens_total counter",
+            f'wise_judge_tokens_total{{kind="prompt"}} {snap["tokens"]["prompt"]}',
+            f'wise_judge_tokens_total{{kind="completion"}} {snap["tokens"]["completion"]}',
+            "# TYPE wise_judge_attempts_total counter",
+        ]
+        lines += [f'wise_judge_attempts_total{{outcome="{k}"}} {v}' for k, v in sorted(snap["attempts"].items())]
+        lines.append("# TYPE wise_images_sent_total counter")
+        lines += [f'wise_images_sent_total{{transport="{k}"}} {v}' for k, v in sorted(snap["media"].items())]
+        lines.append("# TYPE wise_judge_request_latency_seconds histogram")
+        lines += [f'wise_judge_request_latency_seconds_bucket{{le="{le}"}} {n}' for le, n in snap["latency_s"]["buckets"].items()]
+        lines.append(f"wise_judge_request_latency_seconds_sum {snap['latency_s']['sum']}")
+        lines.append(f"wise_judge_request_latency_seconds_count {snap['latency_s']['count']}")
+        return "\n".join(lines) + "\n"
+
+    def progress_line(self) -> str:
+        snap = self.snapshot()
+        items = snap["items"]
+        done = items["judged"] + items["failed"]
+        pct = done / items["total"] if items["total"] else 1.0
+        eta = "?" if snap["eta_s"] is None else time.strftime("%H:%M:%S", time.gmtime(snap["eta_s"]))
+        return (
+            f"[PROGRESS] {done}/{items['total']} ({pct:.1%}) failed={items['failed']} "
+            f"{snap['items_per_s']:.2f} items/s {snap['requests_per_s']:.2f} req/s "
+            f"inflight={snap['inflight']} p95={snap['latency_s']['p95']:.2f}s ETA {eta}"
+        )
+
+
+def serve_prometheus(metrics: RunMetrics, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves GET /metrics in a daemon thread; call .shutdown() on the returned server to stop it."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class PeriodicTask:
+    """Calls `fn` every `interval` seconds in a daemon thread, and once more on stop()."""
+
+    def __init__(self, interval: float, fn: Callable[[], None]):
+        self.interval = interval
+        self.fn = fn
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._done.wait(self.interval):
+            self.fn()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        self.fn()
+
+
+def write_metrics_json(metrics: RunMetrics, path: str):
+    snap = dict(metrics.snapshot(), time=time.time())
+    atomic_write_text(path, lambda f: json.dump(snap, f, indent=2))
+
+
+class StageProfiler:
+    """Per-item wall time of each pipeline stage (disk read, encode, message build, ...).
+
+    Disabled profilers cost one attribute check per stage, so the hooks stay
+    in the hot path unconditionally. Thread-safe.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._times = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._times.setdefault(stage, []).append(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def report(self, wall: float) -> Dict[str, Dict[str, float]]:
+        """Per stage: count, total/mean/percentiles, share of all stage time, and total / wall.
+
+        total / wall is the average number of workers busy in that stage, so
+        at high concurrency a client-side stage approaching 1.0 is a serial
+        bottleneck (e.g. the GIL or the event loop).
+        """
+        with self._lock:
+            times = {stage: list(values) for stage, values in self._times.items()}
+        grand_total = sum(sum(values) for values in times.values()) or 1e-9
+        report = {}
+        for stage, values in times.items():
+            total = sum(values)
+            report[stage] = {
+                "count": len(values),
+                "total_s": round(total, 3),
+                "mean_ms": round(1000 * total / len(values), 3),
+                "p50_ms": round(1000 * percentile(values, 50), 3),
+                "p95_ms": round(1000 * percentile(values, 95), 3),
+                "p99_ms": round(1000 * percentile(values, 99), 3),
+                "max_ms": round(1000 * max(values), 3),
+                "share": round(total / grand_total, 4),
+                "x_wall": round(total / wall, 3) if wall > 0 else 0.0,
+            }
+        return report
+
+
+def format_profile(report: Dict[str, Dict[str, float]]) -> str:
+    header = f"{'stage':<14}{'count':>8}{'total_s':>10}{'mean_ms':>10}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}{'share':>8}{'x_wall':>8}"
+    lines = [header]
+    for stage, r in sorted(report.items(), key=lambda kv: -kv[1]["total_s"]):
+        lines.append(
+            f"{stage:<14}{r['count']:>8}{r['total_s']:>10.2f}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}"
+            f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['share']:>8.1%}{r['x_wall']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+class BatchStats:
+    """Batched-judging outcomes, and agreement with single-item judging on the cross-checked items.
+
+    Agreement is broken down by position within the batch, since a judge that
+    drifts on later images (or copies its neighbour's answer) shows up there
+    first. Thread-safe.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.parsed = 0
+        self.failed_requests = 0
+        self._pairs = []
+        self._lock = threading.Lock()
+
+    def record_batch(self, size: int, parsed: int, request_ok: bool = True):
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.parsed += parsed
+            if not request_ok:
+                self.failed_requests += 1
+
+    def record_check(self, position: int, batch_score: float, single_score: float):
+        with self._lock:
+            self._pairs.append((position, int(batch_score), int(single_score)))
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            pairs = list(self._pairs)
+            out = {
+                "batches": self.batches,
+                "items": self.items,
+                "parsed": self.parsed,
+                "single_fallbacks": self.items - self.parsed,
+                "failed_requests": self.failed_requests,
+            }
+        n = len(pairs)
+        agree = sum(b == s for _, b, s in pairs)
+        by_position = {}
+        for pos, b, s in pairs:
+            hits = by_position.setdefault(pos, [0, 0])
+            hits[0] += b == s
+            hits[1] += 1
+        # Cohen's kappa: agreement beyond what the two marginal 1-rates give by chance.
+        p_batch = sum(b for _, b, _ in pairs) / n if n else 0.0
+        p_single = sum(s for _, _, s in pairs) / n if n else 0.0
+        chance = p_batch * p_single + (1 - p_batch) * (1 - p_single)
+        observed = agree / n if n else 0.0
+        out["agreement"] = {
+            "items": n,
+            "rate": round(observed, 4) if n else None,
+            "kappa": round((observed - chance) / (1 - chance), 4) if n and chance < 1 else None,
+            "batch_1_single_0": sum(b > s for _, b, s in pairs),
+            "batch_0_single_1": sum(b < s for _, b, s in pairs),
+            "by_position": {pos: round(hits[0] / hits[1], 4) for pos, hits in sorted(by_position.items())},
+        }
+        return out
@@ -0,0 +1,421 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight judge requests for the async engine.
+
+    Starts in slow start (+1 per success) until the first congestion signal,
+    then grows additively (+1 per window of successes). Timeouts and HTTP
+    429/503 halve the limit; only one such decrease is applied per window, so
+    a burst of failures caused by the same overload counts once.
+
+    Latency is judged per window (about one limit's worth of completions),
+    Vegas-style: the window's median latency is compared with a baseline that
+    follows lower medians at once but higher ones only slowly. A window whose
+    median exceeds `latency_tolerance` x baseline shrinks the limit gently, so
+    ordinary latency spread within a window never reads as congestion.
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        initial: Optional[int] = None,
+        backoff: float = 0.5,
+        latency_tolerance: float = 1.5,
+        latency_backoff: float = 0.9,
+        min_window: int = 20,
+        baseline_drift: float = 0.05,
+        log_interval: float = 10.0,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial or self.min_limit)))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.latency_backoff = latency_backoff
+        self.min_window = min_window
+        self.baseline_drift = baseline_drift
+        self.log_interval = log_interval
+
+        self.inflight = 0
+        self.slow_start = True
+        self._epoch = 0
+        self._cond = asyncio.Condition()
+        self._window: List[float] = []
+        self.baseline: Optional[float] = None
+        self._started = time.monotonic()
+        self._last_change = self._started
+        self._last_log = self._started
+        self._settle_start = None
+        self._settle_area = 0.0
+        self.decreases = 0
+
+    async def acquire(self) -> int:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+            return self._epoch
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free right now (e.g. for a hedge); pair with release_slot()."""
+        if self.inflight >= int(self.limit):
+            return False
+        self.inflight += 1
+        return True
+
+    async def release_slot(self):
+        """Frees a try_acquire() slot; it carries no latency or overload signal."""
+        async with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    async def release(self, epoch: int, latency: Optional[float], overloaded: bool = False):
+        async with self._cond:
+            self.inflight -= 1
+            if overloaded:
+                self._decrease(epoch, self.backoff, "timeout/overload")
+            elif latency is not None:
+                self._window.append(latency)
+                if self.slow_start:
+                    self._set_limit(self.limit + 1.0)
+                if len(self._window) >= max(self.min_window, int(self.limit)):
+                    self._end_window()
+            self._maybe_log()
+            self._cond.notify_all()
+
+    def _end_window(self):
+        recent = percentile(self._window, 50)
+        self._window = []
+        if self.baseline is None:
+            self.baseline = recent
+            return
+        if recent > self.latency_tolerance * self.baseline:
+            self._decrease(self._epoch, self.latency_backoff, f"p50 latency {recent:.2f}s > {self.latency_tolerance:g}x baseline {self.baseline:.2f}s")
+        elif not self.slow_start:
+            self._set_limit(self.limit + 1.0)
+        # Faster windows reset the baseline; slower ones raise it only gradually,
+        # so queueing we caused doesn't become the new normal, but a judge that
+        # really got slower (e.g. longer prompts) is accepted eventually.
+        if recent < self.baseline:
+            self.baseline = recent
+        else:
+            self.baseline += self.baseline_drift * (recent - self.baseline)
+
+    def _decrease(self, epoch: int, factor: float, reason: str):
+        if epoch != self._epoch:
+            # Request was issued before the last decrease; that overload is already accounted for.
+            return
+        self._epoch += 1
+        self.decreases += 1
+        if self.slow_start:
+            self.slow_start = False
+            self._settle_start = time.monotonic()
+            self._last_change = self._settle_start
+        old = int(self.limit)
+        self._set_limit(self.limit * factor)
+        if int(self.limit) != old:
+            print(f"[AIMD] limit {old} -> {int(self.limit)} ({reason})")
+
+    def _set_limit(self, value: float):
+        now = time.monotonic()
+        if self._settle_start is not None:
+            self._settle_area += self.limit * (now - self._last_change)
+        self._last_change = now
+        self.limit = min(float(self.max_limit), max(float(self.min_limit), value))
+
+    def _maybe_log(self):
+        now = time.monotonic()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            print(f"[AIMD] limit={int(self.limit)} inflight={self.inflight} decreases={self.decreases}")
+
+    def summary(self) -> Dict[str, float]:
+        now = time.monotonic()
+        if self._settle_start is None or now <= self._settle_start:
+            settled = self.limit
+        else:
+            area = self._settle_area + self.limit * (now - self._last_change)
+            settled = area / (now - self._settle_start)
+        return {
+            "final_limit": int(self.limit),
+            "settled_limit": round(settled, 1),
+            "decreases": self.decreases,
+            "baseline_latency_s": round(self.baseline, 3) if self.baseline is not None else None,
+        }
+
+
+class Replica:
+    def __init__(self, api_base: str):
+        self.api_base = api_base
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_errors = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.busy_time = 0.0
+
+
+class ReplicaPool:
+    """Least-outstanding-requests routing across vLLM judge replicas.
+
+    A replica is taken out of rotation after `max_consecutive_errors` failed
+    requests in a row, or when an active health check fails, and is put back
+    once a health check succeeds. If every replica is out, requests still go
+    to the least loaded one rather than failing outright. Thread-safe; every
+    method holds the lock only for bookkeeping, so it is also cheap to call
+    from the event loop.
+    """
+
+    def __init__(self, api_bases, max_consecutive_errors: int = 3):
+        self.replicas = [Replica(base) for base in api_bases]
+        self.max_consecutive_errors = max_consecutive_errors
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.latencies = []
+
+    def acquire(self, avoid: Optional[Replica] = None) -> Replica:
+        """Picks a replica; `avoid` (e.g. the one a hedged request is already on) is used only if it is the sole choice."""
+        with self._lock:
+            candidates = [r for r in self.replicas if r.healthy] or self.replicas
+            if avoid is not None:
+                candidates = [r for r in candidates if r is not avoid] or candidates
+            # A failing replica answers instantly and so always looks least loaded;
+            # route around it until it succeeds again or passes a health check.
+            replica = min(candidates, key=lambda r: (r.consecutive_errors > 0, r.outstanding))
+            replica.outstanding += 1
+            return replica
+
+    def release(self, replica: Replica, ok: bool, latency: float = 0.0, replica_fault: bool = True):
+        with self._lock:
+            replica.outstanding -= 1
+            replica.requests += 1
+            replica.busy_time += latency
+            if ok:
+                replica.consecutive_errors = 0
+                self.latencies.append(latency)
+                return
+            replica.errors += 1
+            if not replica_fault:
+                return
+            replica.consecutive_errors += 1
+            if replica.healthy and replica.consecutive_errors >= self.max_consecutive_errors:
+                self._set_health(replica, False, f"{replica.consecutive_errors} consecutive errors")
+
+    def abandon(self, replica: Replica):
+        """Releases a request that was cancelled (e.g. the loser of a hedge); counts as neither success nor error."""
+        with self._lock:
+            replica.outstanding -= 1
+
+    def mark_health(self, replica: Replica, healthy: bool, reason: str = "health check"):
+        with self._lock:
+            if healthy:
+                replica.consecutive_errors = 0
+            if replica.healthy != healthy:
+                self._set_health(replica, healthy, reason)
+
+    def _set_health(self, replica: Replica, healthy: bool, reason: str):
+        replica.healthy = healthy
+        if not healthy:
+            replica.ejections += 1
+        print(f"[REPLICA] {replica.api_base} {'back in rotation' if healthy else 'out of rotation'} ({reason})")
+
+    def summary(self) -> List[Dict]:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        with self._lock:
+            return [
+                {
+                    "api_base": r.api_base,
+                    "requests": r.requests,
+                    "errors": r.errors,
+                    "req_per_s": round(r.requests / elapsed, 2),
+                    "avg_latency_s": round(r.busy_time / (r.requests - r.errors), 2) if r.requests > r.errors else 0.0,
+                    "ejections": r.ejections,
+                    "healthy": r.healthy,
+                }
+                for r in self.replicas
+            ]
+
+
+class HedgePolicy:
+    """When to send a duplicate of a slow judge request, for the async engine.
+
+    A request still outstanding after the p95 of recently observed latencies
+    (but at least `min_delay`) gets one hedge, as long as hedges stay below
+    `max_rate` of all requests. Hedging waits until `min_samples` latencies
+    have been seen so that the first slow requests don't set the bar.
+    """
+
+    def __init__(self, max_rate: float = 0.05, min_delay: float = 1.0, quantile: float = 95, min_samples: int = 20, window: int = 500):
+        self.max_rate = max_rate
+        self.min_delay = min_delay
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._delay = None
+        self._stale = 0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def observe(self, latency: float):
+        self._latencies.append(latency)
+        self._stale += 1
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is not enough data."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        if self._delay is None or self._stale >= 20:
+            # Re-sorting the window on every request would be wasted work.
+            self._delay = max(self.min_delay, percentile(list(self._latencies), self.quantile))
+            self._stale = 0
+        return self._delay
+
+    def start(self):
+        self.requests += 1
+
+    def try_hedge(self) -> bool:
+        if self.hedges + 1 > self.max_rate * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+    def record_win(self):
+        self.wins += 1
+
+    def summary(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.wins,
+            "delay_s": round(self._delay, 3) if self._delay is not None else None,
+        }
+
+
+class ByteBudget:
+    """Caps the total size of encoded payloads held in memory by worker threads.
+
+    Independent of request concurrency: workers block in acquire() until the
+    bytes they need fit under `max_bytes`. A payload larger than the whole
+    budget is admitted when nothing else is in flight, so it cannot deadlock.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or float("inf")
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, n: int) -> bool:
+        return self.in_use == 0 or self.in_use + n <= self.max_bytes
+
+    def _take(self, n: int):
+        self.in_use += n
+        self.peak = max(self.peak, self.in_use)
+
+    def acquire(self, n: int):
+        with self._cond:
+            if not self._fits(n):
+                self.waits += 1
+                self._cond.wait_for(lambda: self._fits(n))
+            self._take(n)
+
+    def reserve(self, n: int):
+        """Counts n bytes that already exist (e.g. a serialized request body) without blocking."""
+        with self._cond:
+            self._take(n)
+
+    def resize(self, held: int, n: int) -> int:
+        """Replaces an estimate with the actual size without blocking; returns the new amount held."""
+        with self._cond:
+            self._take(n - held)
+            self._cond.notify_all()
+        return n
+
+    def release(self, n: int):
+        with self._cond:
+            self.in_use -= n
+            self._cond.notify_all()
+
+    def summary(self) -> Dict:
+        return {
+            "limit_mb": None if self.max_bytes == float("inf") else round(self.max_bytes / 2**20, 1),
+            "peak_mb": round(self.peak / 2**20, 1),
+            "waits": self.waits,
+        }
+
+
+class AsyncByteBudget(ByteBudget):
+    """ByteBudget for the async engine: acquire() waits on the event loop instead of blocking a thread."""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        super().__init__(max_bytes)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, n: int):
+        async with self._cond:
+            if not self._fits(n):
+                self.waits += 1
+                await self._cond.wait_for(lambda: self._fits(n))
+            self._take(n)
+
+    async def reserve(self, n: int):
+        async with self._cond:
+            self._take(n)
+
+    async def resize(self, held: int, n: int) -> int:
+        async with self._cond:
+            self._take(n - held)
+            self._cond.notify_all()
+        return n
+
+    async def release(self, n: int):
+        async with self._cond:
+            self.in_use -= n
+            self._cond.notify_all()
+
+
+class RetryPolicy:
+    """Backoff schedule for judge request retries.
+
+    The n-th retry after a transient failure waits a uniformly random time in
+    [0, min(max_delay, base_delay * 2**(n-1))] ("full jitter"), so workers
+    that failed together during an overload do not all come back at once.
+    Thread-safe.
+    """
+
+    def __init__(self, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0, seed: Optional[int] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep_time = 0.0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def backoff(self, retry: int) -> float:
+        with self._lock:
+            delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+            self.sleep_time += delay
+            return delay
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {"backoff_s": round(self.sleep_time, 3)}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in [0, 100]); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(q / 100 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
@@ -0,0 +1,458 @@
+"""Scores every model under a directory in one pass and writes the ranked WISE_Verified leaderboard.
+
+Each subdirectory of MODELS_DIR with a Results-qwen35/ folder is one model,
+named after the subdirectory. Its `*_scores_results.jsonl` files are scored
+with the same prompt index and weights as calculate_verified.py. Per-model
+aggregates are cached by the SHA-256 of the score files, so re-running after
+adding (or re-judging) a model only scores that model.
+
+    python leaderboard.py /data/wise_models --output leadboard.md leaderboard.csv
+"""
+
+import argparse
+import contextlib
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+from calculate_verified import (
+    CATEGORY_WEIGHTS,
+    DEFAULT_JSON_PATH,
+    ORDERED_CATEGORIES,
+    binomial_bootstrap_means,
+    category_means,
+    category_totals,
+    load_prompt_index,
+    overall_wiscore,
+    percentile_interval,
+    process_jsonl_file_segment,
+)
+from significance import holm, pair_matrix, paired_comparisons
+
+CACHE_NAME = ".leaderboard_cache.json"
+CACHE_VERSION = 2
+FORMATS = {".md": "md", ".csv": "csv", ".json": "json"}
+COLUMNS = ["Rank", "Model", "Overall"] + ORDERED_CATEGORIES + ["Samples", "Complete"]
+CI_COLUMNS = ["CI low", "CI high"]
+PAIR_COLUMNS = ["Model A", "Model B", "Category", "Diff", "A only", "B only", "McNemar p", "McNemar p (Holm)", "Permutation p", "Permutation p (Holm)"]
+# Per-prompt score strings in the cache: missing, 0, 1.
+SCORE_SYMBOLS = np.frombuffer(b".01", dtype=np.uint8)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Build the ranked WISE_Verified leaderboard from per-model result folders")
+    parser.add_argument("models_dir", help="Directory with one subdirectory per model, each holding <results_subdir>/.")
+    parser.add_argument("--results_subdir", default="Results-qwen35")
+    parser.add_argument("--pattern", default="*_scores_results.jsonl", help="Score files to read inside each results folder.")
+    parser.add_argument("--json_path", nargs="+", default=[DEFAULT_JSON_PATH], help="Prompt file(s) defining the categories.")
+    parser.add_argument("--soft", action="store_true", help="Rank by the average 'score_prob' instead of the binary score.")
+    parser.add_argument(
+        "--output",
+        nargs="+",
+        default=None,
+        help="Leaderboard file(s); the format follows the extension (.md, .csv, .json). Default: Markdown to stdout.",
+    )
+    parser.add_argument("--cache", default=None, help=f"Aggregate cache (default: <models_dir>/{CACHE_NAME}).")
+    parser.add_argument("--no_cache", action="store_true", help="Rescore every model and leave the cache untouched.")
+    parser.add_argument("--judge", default="Qwen3.5-35B-A3B", help="Judge model named in the Markdown header.")
+    parser.add_argument("--title", default="Qwen3.5-35B WISE Verified Batch Results")
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Add a stratified-bootstrap confidence interval of Overall from N resamples (e.g. 10000).",
+    )
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Also test every pair of models (McNemar and paired permutation tests, per category and overall) "
+        "and write the matrix report next to each output as <name>_pairs.<ext>.",
+    )
+    parser.add_argument("--permutations", type=int, default=10000, help="Sign flips for the paired permutation test.")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level, after Holm correction over all pairs.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.soft and (args.bootstrap or args.compare):
+        # Bootstrap and paired tests work on the 0/1 scores, which soft runs don't keep.
+        parser.error("--bootstrap and --compare need binary scores; use calculate_verified.py --soft --bootstrap N per model instead")
+    for path in args.output or []:
+        if os.path.splitext(path)[1].lower() not in FORMATS:
+            parser.error(f"--output {path}: expected one of {', '.join(FORMATS)}")
+    return args
+
+
+def find_models(models_dir, results_subdir, pattern):
+    """(model name, sorted score files) for each model folder that has results."""
+    models = []
+    with os.scandir(models_dir) as it:
+        entries = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+    for entry in entries:
+        files = sorted(glob.glob(os.path.join(entry.path, results_subdir, pattern)))
+        if files:
+            models.append((entry.name, files))
+    return models
+
+
+def file_sha256(path, known):
+    """SHA-256 of a file; `known` maps abspath -> {"stamp", "sha256"} so unchanged files aren't re-read."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    entry = known.get(path)
+    if entry is None or entry["stamp"] != stamp:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        entry = known[path] = {"stamp": stamp, "sha256": h.hexdigest()}
+    return entry["sha256"]
+
+
+def model_fingerprint(files, config_key, known):
+    h = hashlib.sha256(config_key.encode())
+    for path in files:
+        h.update(f"\0{os.path.basename(path)}\0{file_sha256(path, known)}".encode())
+    return h.hexdigest()
+
+
+def config_fingerprint(json_paths, soft):
+    # Cached aggregates are only valid for the same prompt index and score mode.
+    h = hashlib.sha256(b"soft" if soft else b"binary")
+    for path in json_paths:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def load_cache(path, config_key):
+    try:
+        if path is None:
+            raise OSError("no cache")
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION and cache.get("config") == config_key:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"version": CACHE_VERSION, "config": config_key, "files": {}, "models": {}}
+
+
+def save_cache(path, cache):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def score_models(models, index, soft):
+    """Per-model aggregates for `models` [(name, files)], from one bincount over all their samples."""
+    categories, scores, owners, present, vectors = [], [], [], [], []
+    for number, (name, files) in enumerate(models):
+        ids, scored_ids, model_scores = [], [], []
+        for path in files:
+            # Per-line warnings go to stderr so a leaderboard on stdout stays clean.
+            with contextlib.redirect_stdout(sys.stderr):
+                data = process_jsonl_file_segment(path, soft=soft, index=index)
+            if data is None:
+                print(f"[WARN] {name}: could not read {path}; it is left out of this model's scores.", file=sys.stderr)
+                continue
+            categories.append(data["categories"])
+            scores.append(data["scores"])
+            owners.append(np.full(len(data["scores"]), number))
+            ids.append(data["prompt_ids"])
+            scored_ids.append(data["scored_ids"])
+            model_scores.append(data["scores"])
+        present.append(np.concatenate(ids) if ids else np.empty(0, dtype=np.int64))
+        # Soft scores are not 0/1, so only binary runs keep per-prompt scores for --compare.
+        vectors.append(None if soft else encode_scores(index, np.concatenate(scored_ids or [[]]), np.concatenate(model_scores or [[]])))
+
+    if not models:
+        return {}
+    sums, counts = category_totals(
+        np.concatenate(categories) if categories else np.empty(0, dtype=np.int64),
+        np.concatenate(scores) if scores else np.empty(0),
+        groups=np.concatenate(owners) if owners else np.empty(0, dtype=np.int64),
+        num_groups=len(models),
+    )
+    return {
+        name: {
+            "sums": sums[number].tolist(),
+            "counts": counts[number].tolist(),
+            "missing": int(len(np.setdiff1d(index.prompt_ids, present[number]))),
+            "scores": vectors[number],
+        }
+        for number, (name, _) in enumerate(models)
+    }
+
+
+def encode_scores(index, prompt_ids, scores):
+    """Binary scores as one character per prompt in index.prompt_ids order ('.' where missing)."""
+    vector = np.full(len(index.prompt_ids), -1, dtype=np.int8)
+    vector[np.searchsorted(index.prompt_ids, np.asarray(prompt_ids, dtype=np.int64))] = scores
+    return SCORE_SYMBOLS[vector + 1].tobytes().decode("ascii")
+
+
+def decode_scores(text):
+    vector = np.frombuffer(text.encode("ascii"), dtype=np.uint8).astype(np.int8) - ord("0")
+    vector[vector < 0] = -1
+    return vector
+
+
+def build_rows(aggregates, bootstrap=0, confidence=0.95, seed=0):
+    """Leaderboard rows ranked by overall WiScore; models missing a category rank last.
+
+    With `bootstrap` > 0, every model's Overall gets a stratified-bootstrap
+    interval, drawn for all models at once from the cached per-category totals.
+    """
+    names = list(aggregates)
+    sums = np.array([aggregates[n]["sums"] for n in names], dtype=np.float64).reshape(-1, len(ORDERED_CATEGORIES))
+    counts = np.array([aggregates[n]["counts"] for n in names], dtype=np.int64).reshape(-1, len(ORDERED_CATEGORIES))
+    means = category_means(sums, counts)
+    # NaN (a category with no samples) propagates, so such models get no overall score.
+    overall = overall_wiscore(means)
+    order = sorted(range(len(names)), key=lambda i: (np.isnan(overall[i]), -np.nan_to_num(overall[i]), names[i]))
+    if bootstrap > 0:
+        replicates = binomial_bootstrap_means(sums, counts, bootstrap, seed)
+        ci_low, ci_high = percentile_interval(overall_wiscore(replicates), confidence, axis=1)
+
+    rows = []
+    for rank, i in enumerate(order, 1):
+        row = {"Rank": rank, "Model": names[i], "Overall": overall[i]}
+        if bootstrap > 0:
+            row.update(zip(CI_COLUMNS, (ci_low[i], ci_high[i])))
+        row.update(zip(ORDERED_CATEGORIES, means[i]))
+        row["Samples"] = int(counts[i].sum())
+        row["Complete"] = "yes" if aggregates[names[i]]["missing"] == 0 and counts[i].all() else "no"
+        rows.append(row)
+    return rows
+
+
+def _cell(value):
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else f"{value:.4f}"
+    return str(value)
+
+
+def table_columns(args):
+    if not args.bootstrap:
+        return COLUMNS
+    return COLUMNS[:3] + CI_COLUMNS + COLUMNS[3:]
+
+
+def render_markdown(rows, args):
+    columns = table_columns(args)
+    weights = " + ".join(f"{w:.2f} * {c}" for w, c in zip(CATEGORY_WEIGHTS, ORDERED_CATEGORIES))
+    field = "`score_prob` field (P(score=1), `--score_mode guided`)" if args.soft else "binary `score` field"
+    lines = [
+        f"# {args.title}",
+        "",
+        f"- Judge model: `{args.judge}`",
+        f"- Result directory per model: `{args.results_subdir}/`",
+        "",
+        "## Overall Ranking",
+        "",
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join("---" if c in ("Model", "Complete") else "---:" for c in columns) + " |",
+    ]
+    lines += ["| " + " | ".join(_cell(row[c]) for c in columns) + " |" for row in rows]
+    lines += [
+        "",
+        f"_Overall = {weights}._",
+        f"_Scores are averaged from the {field} produced by `vllm_eval.py`, using the same category boundaries and weights as `calculate_verified.py`._",
+    ]
+    if args.bootstrap:
+        lines.append(f"_CI low/high: {args.confidence:.0%} stratified-bootstrap interval of Overall ({args.bootstrap} resamples within each category)._")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def render_csv(rows, args):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    columns = table_columns(args)
+    writer.writerow(columns)
+    writer.writerows([_cell(row[c]) for c in columns] for row in rows)
+    return out.getvalue()
+
+
+def render_json(rows, args):
+    def plain(value):
+        if isinstance(value, (float, np.floating)):
+            return None if np.isnan(value) else round(float(value), 4)
+        return value
+
+    doc = {
+        "judge": args.judge,
+        "score": "soft" if args.soft else "binary",
+        "weights": dict(zip(ORDERED_CATEGORIES, CATEGORY_WEIGHTS.tolist())),
+        "rows": [{c: plain(row[c]) for c in table_columns(args)} for row in rows],
+    }
+    if args.bootstrap:
+        doc["bootstrap"] = {"resamples": args.bootstrap, "confidence": args.confidence, "seed": args.seed}
+    return json.dumps(doc, indent=2, ensure_ascii=False) + "\n"
+
+
+RENDERERS = {"md": render_markdown, "csv": render_csv, "json": render_json}
+
+
+def compare_models(rows, aggregates, index, args):
+    """Paired tests for all pairs of ranked models, on score vectors aligned by prompt_id."""
+    names = [row["Model"] for row in rows]
+    scores = np.stack([decode_scores(aggregates[name]["scores"]) for name in names])
+    result = paired_comparisons(
+        scores,
+        index.categories_of(index.prompt_ids),
+        CATEGORY_WEIGHTS,
+        n_permutations=args.permutations,
+        seed=args.seed,
+    )
+    # Holm over all pairs, separately for each category column.
+    result["mcnemar_holm"] = holm(result["mcnemar"])
+    result["perm_holm"] = holm(result["perm"])
+    result["names"] = names
+    return result
+
+
+# Column of each report section in the paired results, and the test its matrix shows.
+PAIR_SECTIONS = [("Overall", -1, "perm")] + [(c, code, "mcnemar") for code, c in enumerate(ORDERED_CATEGORIES)]
+TEST_NAMES = {"perm": "paired permutation test", "mcnemar": "exact McNemar test"}
+
+
+def pair_records(result):
+    for label, column, _ in PAIR_SECTIONS:
+        for i in range(len(result["a"])):
+            yield {
+                "Model A": result["names"][result["a"][i]],
+                "Model B": result["names"][result["b"][i]],
+                "Category": label,
+                "Diff": result["diff"][i, column],
+                "A only": int(result["b10"][i, column]),
+                "B only": int(result["b01"][i, column]),
+                "McNemar p": result["mcnemar"][i, column],
+                "McNemar p (Holm)": result["mcnemar_holm"][i, column],
+                "Permutation p": result["perm"][i, column],
+                "Permutation p (Holm)": result["perm_holm"][i, column],
+            }
+
+
+def render_pairs_markdown(result, args):
+    names = result["names"]
+    n = len(names)
+    lines = [
+        f"# {args.title}: Pairwise Comparisons",
+        "",
+        f"Each cell is row model minus column model on the prompts both have, with the Holm-adjusted p-value over all {n * (n - 1) // 2} pairs.",
+        f"Bold: significant at {args.alpha:g}. Columns are numbered by leaderboard rank.",
+        "",
+    ]
+    for label, column, test in PAIR_SECTIONS:
+        diff = pair_matrix(result["diff"][:, column], result["a"], result["b"], n, antisymmetric=True)
+        p = pair_matrix(result[f"{test}_holm"][:, column], result["a"], result["b"], n)
+        lines += [
+            f"## {label} ({TEST_NAMES[test]}{', weighted' if column == -1 else ''})",
+            "",
+            "| Model | " + " | ".join(str(j + 1) for j in range(n)) + " |",
+            "| --- | " + " | ".join(["---:"] * n) + " |",
+        ]
+        for i in range(n):
+            cells = []
+            for j in range(n):
+                if i == j:
+                    cells.append("—")
+                elif np.isnan(diff[i, j]):
+                    cells.append("")
+                else:
+                    cell = f"{diff[i, j]:+.3f} ({p[i, j]:.3f})"
+                    cells.append(f"**{cell}**" if p[i, j] < args.alpha else cell)
+            lines.append(f"| {i + 1}. {names[i]} | " + " | ".join(cells) + " |")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def render_pairs_csv(result, args):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(PAIR_COLUMNS)
+    writer.writerows([_cell(rec[c]) for c in PAIR_COLUMNS] for rec in pair_records(result))
+    return out.getvalue()
+
+
+def render_pairs_json(result, args):
+    def plain(value):
+        if isinstance(value, (float, np.floating)):
+            return None if np.isnan(value) else round(float(value), 6)
+        return value
+
+    doc = {
+        "models": result["names"],
+        "permutations": args.permutations,
+        "alpha": args.alpha,
+        "pairs": [{c: plain(rec[c]) for c in PAIR_COLUMNS} for rec in pair_records(result)],
+    }
+    return json.dumps(doc, indent=2, ensure_ascii=False) + "\n"
+
+
+PAIR_RENDERERS = {"md": render_pairs_markdown, "csv": render_pairs_csv, "json": render_pairs_json}
+
+
+def write_text(path, text):
+    if path is None:
+        sys.stdout.write(text)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    print(f"[SAVE] {path}", file=sys.stderr)
+
+
+def main():
+    args = parse_arguments()
+    index = load_prompt_index(tuple(args.json_path))
+    models = find_models(args.models_dir, args.results_subdir, args.pattern)
+    if not models:
+        raise SystemExit(f"No {args.results_subdir}/{args.pattern} files found under {args.models_dir}")
+
+    cache_path = args.cache or os.path.join(args.models_dir, CACHE_NAME)
+    config_key = config_fingerprint(args.json_path, args.soft)
+    cache = load_cache(None if args.no_cache else cache_path, config_key)
+
+    aggregates, stale = {}, []
+    for name, files in models:
+        fingerprint = model_fingerprint(files, config_key, cache["files"])
+        cached = cache["models"].get(name)
+        if cached is not None and cached["fingerprint"] == fingerprint:
+            aggregates[name] = cached
+        else:
+            stale.append((name, files, fingerprint))
+
+    print(f"[LEADERBOARD] {len(models)} models, {len(models) - len(stale)} cached, scoring {len(stale)}", file=sys.stderr)
+    scored = score_models([(name, files) for name, files, _ in stale], index, args.soft)
+    for name, _, fingerprint in stale:
+        aggregates[name] = dict(scored[name], fingerprint=fingerprint)
+
+    if not args.no_cache:
+        # Models whose folders are gone drop out of the cache, as do their file hashes.
+        live_files = {os.path.abspath(p) for _, files in models for p in files}
+        cache["models"] = aggregates
+        cache["files"] = {p: v for p, v in cache["files"].items() if p in live_files}
+        save_cache(cache_path, cache)
+
+    rows = build_rows(aggregates, args.bootstrap, args.confidence, args.seed)
+    pairs = compare_models(rows, aggregates, index, args) if args.compare else None
+    for path in args.output or [None]:
+        stem, ext = os.path.splitext(path) if path else (None, ".md")
+        fmt = FORMATS[ext.lower()]
+        write_text(path, RENDERERS[fmt](rows, args))
+        if pairs is not None:
+            write_text(f"{stem}_pairs{ext}" if path else None, ("\n" if path is None else "") + PAIR_RENDERERS[fmt](pairs, args))
+
+
+if __name__ == "__main__":
+    main()
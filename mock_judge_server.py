@@ -0,0 +1,295 @@
+"""OpenAI-compatible stand-in for the vLLM judge, for load tests without a GPU.
+
+Answers POST /v1/chat/completions with a `Score: 0|1` completion after a
+sampled latency, and can inject HTTP errors and a concurrency ceiling that
+makes extra requests queue like they would inside vLLM. Scores are a
+deterministic function of the request text, so repeated runs agree. Guided
+requests (`structured_outputs`/`guided_choice`) get the bare choice, and
+`logprobs` requests get top_logprobs for the score digit. `stream` requests
+are answered as server-sent events, one token per --token_latency, and
+clients that hang up mid-stream are counted as cancelled in /stats.
+file:// image URLs are read from disk like vLLM does, and only under
+--allowed_local_media_path. Requests with several PROMPT/EXPLANATION items
+(batched judging) get one `Image <n>: Score: <0|1>` line per item, each
+scored exactly as a single-item request for it would be unless
+--batch_flip_rate says otherwise.
+
+    python mock_judge_server.py --port 8000 --latency_dist lognormal --latency_mean 0.8 --error_rate 0.01
+
+Requires aiohttp.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import urllib.parse
+import urllib.request
+
+from aiohttp import web
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Mock vLLM judge server (OpenAI-compatible)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default="Qwen3.5-35B-A3B")
+    parser.add_argument("--latency_dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal")
+    parser.add_argument("--latency_mean", type=float, default=0.5, help="Mean service time in seconds.")
+    parser.add_argument("--latency_sigma", type=float, default=0.5, help="Shape of the lognormal distribution.")
+    parser.add_argument(
+        "--token_latency",
+        type=float,
+        default=0.0,
+        help="Decode time per completion token, added after the sampled latency.",
+    )
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with --error_status.")
+    parser.add_argument("--error_status", type=int, default=503)
+    parser.add_argument("--max_concurrency", type=int, default=0, help="Requests served at once; the rest queue (0 = unlimited).")
+    parser.add_argument("--score_one_rate", type=float, default=0.5, help="Fraction of prompts that get `Score: 1`.")
+    parser.add_argument(
+        "--response_template",
+        default="Score: {score}",
+        help="Completion text; {score} is replaced by 0 or 1.",
+    )
+    parser.add_argument(
+        "--parse_fail_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of unguided requests answered without a score (deterministic per request, like temperature 0).",
+    )
+    parser.add_argument(
+        "--batch_flip_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of batched items whose score is flipped relative to single-item judging.",
+    )
+    parser.add_argument(
+        "--allowed_local_media_path",
+        default=None,
+        help="Like vLLM's --allowed-local-media-path: file:// image URLs under this directory are accepted.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def sample_latency(args, rng: random.Random) -> float:
+    if args.latency_dist == "fixed":
+        return args.latency_mean
+    if args.latency_dist == "uniform":
+        return rng.uniform(0, 2 * args.latency_mean)
+    if args.latency_dist == "exponential":
+        return rng.expovariate(1 / args.latency_mean)
+    if args.latency_mean <= 0:
+        return 0.0
+    # Lognormal parameterized by its mean rather than by mu.
+    mu = math.log(args.latency_mean) - args.latency_sigma**2 / 2
+    return rng.lognormvariate(mu, args.latency_sigma)
+
+
+def request_text(messages) -> str:
+    parts = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for item in content or []:
+            if item.get("type") == "text":
+                parts.append(item["text"])
+    return "\n".join(parts)
+
+
+def load_file_urls(messages, allowed_root):
+    """Reads every file:// image like vLLM's MediaConnector; returns an error message, or None when all load."""
+    for msg in messages:
+        content = msg.get("content")
+        for item in content if isinstance(content, list) else []:
+            url = (item.get("image_url") or {}).get("url", "")
+            if not url.startswith("file:"):
+                continue
+            if allowed_root is None:
+                return "Cannot load local files without `--allowed-local-media-path`."
+            path = os.path.realpath(urllib.request.url2pathname(urllib.parse.urlparse(url).path))
+            if os.path.commonpath([path, os.path.realpath(allowed_root)]) != os.path.realpath(allowed_root):
+                return f"The file path {path} must be a subpath of `--allowed-local-media-path` {allowed_root}."
+            try:
+                with open(path, "rb") as f:
+                    f.read()
+            except OSError as e:
+                return f"Cannot read {path}: {e}"
+    return None
+
+
+ITEM_PATTERN = re.compile(r'PROMPT: "(.*?)"\nEXPLANATION: "(.*?)"(?=\n|$)', re.DOTALL)
+
+
+def judged_items(text: str):
+    """The PROMPT/EXPLANATION pairs in a request, which scores are derived from."""
+    return [f"{prompt}\n{explanation}" for prompt, explanation in ITEM_PATTERN.findall(text)]
+
+
+def deterministic_score(text: str, one_rate: float):
+    """Returns (hard score, P(score=1)); the probability is on the side of the hard score."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    score = int(int.from_bytes(digest[:8], "big") / 2**64 < one_rate)
+    margin = 0.5 * int.from_bytes(digest[8:16], "big") / 2**64
+    return score, 0.5 + margin if score else 0.5 - margin
+
+
+def score_logprobs(content: str, score: int, prob_one: float, top_n: int):
+    pieces = re.findall(r"\w+|\s+|[^\w\s]", content)
+    # The score is the last such digit; an earlier one is e.g. the "1" of "Image 1".
+    score_at = max((i for i, tok in enumerate(pieces) if tok == str(score)), default=-1)
+    tokens = []
+    for i, tok in enumerate(pieces):
+        if i == score_at:
+            top = [("1", prob_one), ("0", 1 - prob_one)]
+            if score == 0:
+                top.reverse()
+            alts = [{"token": t, "logprob": math.log(max(p, 1e-12))} for t, p in top[: max(top_n, 1)]]
+            tokens.append({"token": tok, "logprob": alts[0]["logprob"], "top_logprobs": alts})
+        else:
+            tokens.append({"token": tok, "logprob": 0.0, "top_logprobs": [{"token": tok, "logprob": 0.0}]})
+    return {"content": tokens}
+
+
+def make_app(args) -> web.Application:
+    rng = random.Random(args.seed)
+    slots = asyncio.Semaphore(args.max_concurrency) if args.max_concurrency > 0 else None
+    stats = {
+        "requests": 0,
+        "errors": 0,
+        "cancelled": 0,
+        "inflight": 0,
+        "max_inflight": 0,
+        "bytes_in": 0,
+        "media_errors": 0,
+        "completion_tokens": 0,
+        "started": time.time(),
+    }
+
+    async def stream_tokens(request: web.Request, body, tokens, usage, with_logprobs: bool) -> web.StreamResponse:
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        chunk = {"id": f"chatcmpl-mock-{stats['requests']}", "object": "chat.completion.chunk", "model": body.get("model", args.model)}
+        try:
+            for tok in tokens:
+                await asyncio.sleep(args.token_latency)
+                choice = {"index": 0, "delta": {"content": tok["token"]}, "finish_reason": None}
+                if with_logprobs:
+                    choice["logprobs"] = {"content": [tok]}
+                await resp.write(f"data: {json.dumps(dict(chunk, choices=[choice]))}\n\n".encode())
+                stats["completion_tokens"] += 1
+            final = dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            await resp.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            await resp.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            # The client closed the stream early, as vllm_eval.py --stream does once it has a score.
+            stats["cancelled"] += 1
+        return resp
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        raw = await request.read()
+        stats["requests"] += 1
+        stats["bytes_in"] += len(raw)
+        body = json.loads(raw)
+        media_error = load_file_urls(body.get("messages", []), args.allowed_local_media_path)
+        if media_error is not None:
+            stats["media_errors"] += 1
+            return web.json_response({"error": {"message": media_error}}, status=400)
+        text = request_text(body.get("messages", []))
+        items = judged_items(text)
+        score, prob_one = deterministic_score(items[0] if len(items) == 1 else text, args.score_one_rate)
+        # Sampling (temperature > 0) makes a formatting failure non-repeatable.
+        sample_seed = rng.random() if body.get("temperature") else 0
+        choices = (body.get("structured_outputs") or {}).get("choice") or body.get("guided_choice")
+        guided = bool(choices or (body.get("structured_outputs") or {}).get("regex") or body.get("guided_regex"))
+        if len(items) > 1:
+            tokens = []
+            for n, item in enumerate(items, 1):
+                item_score, item_prob = deterministic_score(item, args.score_one_rate)
+                if deterministic_score(f"flip\n{n}\n{item}", args.batch_flip_rate)[0]:
+                    item_score, item_prob = 1 - item_score, 1 - item_prob
+                if not guided and deterministic_score(f"unparseable\n{item}\n{sample_seed}", args.parse_fail_rate)[0]:
+                    continue
+                line = f"Image {n}: Score: {item_score}\n"
+                tokens += score_logprobs(line, item_score, item_prob, body.get("top_logprobs") or 0)["content"]
+            content = "".join(tok["token"] for tok in tokens).rstrip("\n")
+        elif choices:
+            content = next(c for c in choices if c.rstrip().endswith(str(score)))
+        elif deterministic_score(f"unparseable\n{text}\n{sample_seed}", args.parse_fail_rate)[0]:
+            content = "The image is difficult to assess."
+        else:
+            content = args.response_template.format(score=score)
+        if len(items) <= 1:
+            tokens = score_logprobs(content, score, prob_one, body.get("top_logprobs") or 0)["content"]
+        # Rough token estimate; the image is counted by payload size.
+        usage = {"prompt_tokens": len(raw) // 4, "completion_tokens": len(tokens), "total_tokens": len(raw) // 4 + len(tokens)}
+
+        stats["inflight"] += 1
+        stats["max_inflight"] = max(stats["max_inflight"], stats["inflight"])
+        try:
+            if slots is not None:
+                await slots.acquire()
+            try:
+                await asyncio.sleep(sample_latency(args, rng))
+                if rng.random() < args.error_rate:
+                    stats["errors"] += 1
+                    return web.json_response({"error": {"message": "injected error"}}, status=args.error_status)
+                if body.get("stream"):
+                    return await stream_tokens(request, body, tokens, usage, bool(body.get("logprobs")))
+                await asyncio.sleep(args.token_latency * len(tokens))
+                stats["completion_tokens"] += len(tokens)
+            finally:
+                if slots is not None:
+                    slots.release()
+
+            choice = {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            if body.get("logprobs"):
+                choice["logprobs"] = {"content": tokens}
+            return web.json_response(
+                {
+                    "id": f"chatcmpl-mock-{stats['requests']}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", args.model),
+                    "choices": [choice],
+                    "usage": usage,
+                }
+            )
+        finally:
+            stats["inflight"] -= 1
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": args.model, "object": "model"}]})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="OK")
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(stats, uptime_s=round(time.time() - stats["started"], 3)))
+
+    app = web.Application(client_max_size=256 * 2**20)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/v1/models", models)
+    app.router.add_get("/health", health)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    args = parse_arguments()
+    print(f"[MOCK] serving {args.model} on http://{args.host}:{args.port}/v1")
+    web.run_app(make_app(args), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
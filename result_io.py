@@ -0,0 +1,206 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import signal
+import threading
+import time
+from typing import Dict, Iterable, Iterator
+
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_FSYNC_INTERVAL = 2.0  # seconds
+JSONL_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+
+def journal_path_for(scores_path: str) -> str:
+    return scores_path + JOURNAL_SUFFIX
+
+
+def replay_journal(path: str) -> Iterator[Dict]:
+    """Yields the {"full": ..., "score": ...} records appended by ResultJournal.
+
+    A crash can leave a partially written last line; it is ignored, since that
+    item was never acknowledged and will simply be re-judged.
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[WARN] {path}:{line_num}: truncated journal record ignored")
+
+
+class ResultJournal:
+    """Append-only log of finished records, written as each result arrives.
+
+    Every record is flushed to the OS immediately; fsync is batched every
+    `fsync_every` records or JOURNAL_FSYNC_INTERVAL seconds, whichever comes
+    first. Only the collecting thread writes, so no locking is needed.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 32):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self._f = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, full_rec: Dict, score_rec: Dict):
+        self._f.write(json.dumps({"full": full_rec, "score": score_rec}, ensure_ascii=False) + "\n")
+        self._f.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= JOURNAL_FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        if self._unsynced:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.flush()
+            self.sync()
+            self._f.close()
+
+    def discard(self):
+        """Removes the journal once its records are in the final result files."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class GracefulStop:
+    """First SIGINT/SIGTERM stops admitting new items; the second aborts the run."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def install(self):
+        signal.signal(signal.SIGINT, self._handle)
+        signal.signal(signal.SIGTERM, self._handle)
+
+    def is_set(self) -> bool:
+        return self.event.is_set()
+
+    def _handle(self, signum, frame):
+        if self.event.is_set():
+            raise KeyboardInterrupt
+        self.event.set()
+        print(f"\n[STOP] {signal.Signals(signum).name} received: finishing in-flight requests, "
+              f"no new items will start. Send it again to abort immediately.")
+
+
+def atomic_write_text(path: str, write_fn):
+    """Writes through a temp file and renames it, so a crash never leaves a half-written result file."""
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def is_jsonl_path(path: str) -> bool:
+    return path.endswith(JSONL_SUFFIXES)
+
+
+def open_text(path: str, mode: str = "r"):
+    """Opens a (possibly gzip/zstd-compressed) text file for "r", "w" or "a".
+
+    Appending to a compressed file adds a new gzip member / zstd frame; both
+    formats decode concatenated members as one stream.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise SystemExit(f"Reading/writing {path} requires zstandard (pip install zstandard)") from e
+        raw = open(path, mode + "b")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor(level=10).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """Streams records from a result file without materializing the whole file.
+
+    JSONL files (plain, .gz, .zst) are decoded line by line; a truncated tail
+    left by a crash is reported and skipped. Legacy .json arrays have to be
+    parsed in one go.
+    """
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return
+    if not is_jsonl_path(path):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    line_num = 0
+    try:
+        with open_text(path, "r") as f:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[WARN] {path}:{line_num}: truncated record ignored")
+    except EOFError:
+        print(f"[WARN] {path}: compressed stream truncated after line {line_num}")
+
+
+def load_records(path: str) -> Dict[int, Dict]:
+    # Later records win, so re-judged prompts appended to a JSONL file override older ones.
+    return {item["prompt_id"]: item for item in iter_records(path)}
+
+
+def write_records(path: str, records: Iterable[Dict], append: bool = False):
+    """Writes records in the format implied by the extension.
+
+    JSONL targets can be appended to; full rewrites go through a temp file.
+    """
+    if is_jsonl_path(path):
+        if append:
+            with open_text(path, "a") as f:
+                for item in records:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                f.flush()
+            return
+        tmp = f"{path}.tmp.{os.getpid()}{path[path.index('.jsonl'):]}"
+        with open_text(tmp, "w") as f:
+            for item in records:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+        return
+    data = list(records)
+    atomic_write_text(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert WISE result files between .json, .jsonl, .jsonl.gz and .jsonl.zst. "
+        "Records are de-duplicated by prompt_id (last one wins) and sorted."
+    )
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    args = parser.parse_args()
+
+    records = load_records(args.src)
+    write_records(args.dst, (records[k] for k in sorted(records)))
+    print(f"[SAVE] {args.dst} ({len(records)} records)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""Columnar store of judged results across models and judges, with groupby queries.
+
+`import` consolidates every `<models_dir>/<model>/Results-<judge>/` folder
+(the `*_scores_results.jsonl` files plus the matching `*_full_results.*`
+transcripts) into one table keyed by (model, judge, prompt_id). The table is
+saved as a NumPy `.npz` file, or as Parquet when the path ends in `.parquet`
+(requires pyarrow). Queries then run on arrays instead of re-parsing JSON:
+
+    python results_store.py import /data/wise_models --store wise_results.npz
+    python results_store.py query wise_results.npz --by subcategory --where judge=qwen35 category=BIOLOGY,CHEMISTRY
+    python results_store.py agreement wise_results.npz qwen35 gpt4o --by model
+    python results_store.py failures wise_results.npz --where model=FLUX.1-dev subcategory=Chemistry
+"""
+
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from calculate_verified import DEFAULT_JSON_PATH, ORDERED_CATEGORIES, load_prompt_index
+from result_io import JSONL_SUFFIXES, load_records
+
+STORE_VERSION = 1
+CATEGORICAL = ("model", "judge", "category", "subcategory")
+NUMERIC = {"prompt_id": np.int32, "score": np.int8, "score_prob": np.float32, "attempts": np.int16}
+TEXT = ("image_path", "evaluation")
+COLUMNS = CATEGORICAL[:2] + ("prompt_id",) + CATEGORICAL[2:] + ("score", "score_prob", "attempts") + TEXT
+RESULTS_PREFIX = "Results-"
+FULL_EXTENSIONS = (".json",) + JSONL_SUFFIXES
+
+
+class ResultsStore:
+    """One row per (model, judge, prompt_id).
+
+    Categorical columns (model, judge, category, subcategory) are held as
+    integer codes into a per-column vocabulary, so filters and groupbys are
+    integer array operations. `score` is 0/1, `score_prob` is NaN where the
+    run had no logprobs, and `attempts` is -1 where no transcript was found.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]]):
+        self.columns = columns
+        self.vocab = vocab
+
+    @classmethod
+    def from_values(cls, values: Dict[str, Sequence]) -> "ResultsStore":
+        columns, vocab = {}, {}
+        for name in CATEGORICAL:
+            names = np.asarray(values[name], dtype=str)
+            # Categories keep report order; other vocabularies are sorted.
+            vocab[name] = list(ORDERED_CATEGORIES) if name == "category" else sorted(set(names.tolist()))
+            lookup = {v: code for code, v in enumerate(vocab[name])}
+            columns[name] = np.array([lookup.get(v, -1) for v in names.tolist()], dtype=np.int16)
+        for name, dtype in NUMERIC.items():
+            columns[name] = np.asarray(values[name], dtype=dtype)
+        for name in TEXT:
+            columns[name] = np.array(list(values[name]), dtype=object)
+        return cls(columns, vocab)
+
+    def __len__(self) -> int:
+        return len(self.columns["prompt_id"])
+
+    def values(self, name: str) -> np.ndarray:
+        """Column `name` as values (names for categorical columns; "" for an unknown category)."""
+        if name in CATEGORICAL:
+            return np.array(self.vocab[name] + [""], dtype=object)[self.columns[name]]
+        return self.columns[name]
+
+    def take(self, rows) -> "ResultsStore":
+        return ResultsStore({name: col[rows] for name, col in self.columns.items()}, self.vocab)
+
+    def mask(self, **where) -> np.ndarray:
+        """Boolean row mask for column == value (or value in a list/tuple) conditions, ANDed."""
+        keep = np.ones(len(self), dtype=bool)
+        for name, wanted in where.items():
+            if name not in self.columns:
+                raise KeyError(f"unknown column {name!r}; columns: {', '.join(COLUMNS)}")
+            wanted = list(wanted) if isinstance(wanted, (list, tuple, set)) else [wanted]
+            if name in CATEGORICAL:
+                wanted = [self.vocab[name].index(w) for w in wanted if w in self.vocab[name]]
+            keep &= np.isin(self.columns[name], np.asarray(wanted, dtype=self.columns[name].dtype))
+        return keep
+
+    def filter(self, **where) -> "ResultsStore":
+        return self.take(self.mask(**where))
+
+    def groupby(self, keys: Sequence[str], value: str = "score") -> List[Dict]:
+        """Count and mean of `value` for each distinct combination of `keys`, in key order.
+
+        `n` counts rows, `mean` averages the rows where `value` is present
+        (non-NaN); the grouping itself is one np.unique plus two bincounts.
+        """
+        if not keys:
+            inverse, groups = np.zeros(len(self), dtype=np.int64), np.zeros((0, 1), dtype=np.int64)
+            num_groups = 1 if len(self) else 0
+        else:
+            stacked = np.stack([self.columns[k].astype(np.int64) for k in keys])
+            groups, inverse = np.unique(stacked, axis=1, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            num_groups = groups.shape[1]
+        vals = self.columns[value].astype(np.float64)
+        present = ~np.isnan(vals)
+        n = np.bincount(inverse, minlength=num_groups)
+        n_present = np.bincount(inverse[present], minlength=num_groups)
+        sums = np.bincount(inverse[present], weights=vals[present], minlength=num_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / n_present
+
+        decoded = {k: (np.array(self.vocab[k] + [""], dtype=object)[groups[i]] if k in CATEGORICAL else groups[i]) for i, k in enumerate(keys)}
+        return [dict({k: decoded[k][g] for k in keys}, n=int(n[g]), mean=float(means[g])) for g in range(num_groups)]
+
+    def agreement(self, judge_a: str, judge_b: str, by: Sequence[str] = ("model",)) -> List[Dict]:
+        """Share of (model, prompt_id) rows on which two judges gave the same score, grouped by `by`."""
+        a, b = self.filter(judge=judge_a), self.filter(judge=judge_b)
+        # Model codes are shared, so (model, prompt_id) packs into one sortable key.
+        stride = int(max(a.columns["prompt_id"].max(initial=0), b.columns["prompt_id"].max(initial=0))) + 1
+        key_a = a.columns["model"].astype(np.int64) * stride + a.columns["prompt_id"]
+        key_b = b.columns["model"].astype(np.int64) * stride + b.columns["prompt_id"]
+        _, rows_a, rows_b = np.intersect1d(key_a, key_b, assume_unique=True, return_indices=True)
+        common = a.take(rows_a)
+        common.columns["agree"] = (a.columns["score"][rows_a] == b.columns["score"][rows_b]).astype(np.float64)
+        rows = common.groupby([k for k in by if k != "judge"], value="agree")
+        return [dict(row, agreement=row.pop("mean")) for row in rows]
+
+    # ---- Persistence ----
+
+    def save(self, path: str):
+        if path.endswith(".parquet"):
+            _save_parquet(self, path)
+        else:
+            _save_npz(self, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ResultsStore":
+        return _load_parquet(path) if path.endswith(".parquet") else _load_npz(path)
+
+    @classmethod
+    def concat(cls, stores: Iterable["ResultsStore"]) -> "ResultsStore":
+        stores = [s for s in stores if len(s)]
+        if not stores:
+            return cls.from_values({name: [] for name in COLUMNS})
+        return cls.from_values({name: np.concatenate([s.values(name) for s in stores]) for name in COLUMNS})
+
+
+def _pack_text(values: np.ndarray):
+    encoded = [("" if v is None else v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_text(blob: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    raw = blob.tobytes()
+    return np.array([raw[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)], dtype=object)
+
+
+def _save_npz(store: ResultsStore, path: str):
+    arrays = {"version": np.array(STORE_VERSION)}
+    for name in CATEGORICAL:
+        arrays[name] = store.columns[name]
+        arrays[f"{name}.vocab"] = np.array(store.vocab[name], dtype=str)
+    for name in NUMERIC:
+        arrays[name] = store.columns[name]
+    # Variable-length text as one UTF-8 blob plus offsets, so the file loads without pickle.
+    for name in TEXT:
+        arrays[f"{name}.blob"], arrays[f"{name}.offsets"] = _pack_text(store.columns[name])
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _load_npz(path: str) -> ResultsStore:
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["version"]) != STORE_VERSION:
+            raise SystemExit(f"{path}: store version {int(data['version'])}, expected {STORE_VERSION}; re-run the import")
+        columns = {name: data[name] for name in CATEGORICAL + tuple(NUMERIC)}
+        vocab = {name: data[f"{name}.vocab"].tolist() for name in CATEGORICAL}
+        for name in TEXT:
+            columns[name] = _unpack_text(data[f"{name}.blob"], data[f"{name}.offsets"])
+    return ResultsStore(columns, vocab)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise SystemExit("Parquet stores require pyarrow (pip install pyarrow); use a .npz path otherwise") from e
+    return pyarrow
+
+
+def _save_parquet(store: ResultsStore, path: str):
+    pa = _pyarrow()
+    table = {}
+    for name in COLUMNS:
+        if name in CATEGORICAL:
+            table[name] = pa.DictionaryArray.from_arrays(pa.array(store.columns[name], mask=store.columns[name] < 0), pa.array(store.vocab[name], pa.string()))
+        elif name in TEXT:
+            table[name] = pa.array(store.columns[name].tolist(), pa.string())
+        else:
+            table[name] = pa.array(store.columns[name])
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pa.parquet.write_table(pa.table(table), tmp)
+    os.replace(tmp, path)
+
+
+def _load_parquet(path: str) -> ResultsStore:
+    pa = _pyarrow()
+    table = pa.parquet.read_table(path)
+    values = {}
+    for name in COLUMNS:
+        col = table.column(name).to_pylist()
+        values[name] = ["" if v is None else v for v in col] if name in CATEGORICAL + TEXT else col
+    return ResultsStore.from_values(values)
+
+
+# ---- Import ----
+
+
+def _full_path_for(scores_path: str) -> Optional[str]:
+    """The `<group>_full_results.*` transcript next to `<group>_scores_results.jsonl`, if any."""
+    stem = os.path.basename(scores_path)
+    if "_scores_results" not in stem:
+        return None
+    prefix = os.path.join(os.path.dirname(scores_path), stem[: stem.index("_scores_results")] + "_full_results")
+    return next((prefix + ext for ext in FULL_EXTENSIONS if os.path.isfile(prefix + ext)), None)
+
+
+def find_result_dirs(models_dir: str, results_glob: str) -> List[tuple]:
+    """(model, judge, results dir) for every <model>/<results_glob> folder; the judge is the folder name minus "Results-"."""
+    found = []
+    for results_dir in sorted(glob.glob(os.path.join(models_dir, "*", results_glob))):
+        if os.path.isdir(results_dir):
+            name = os.path.basename(results_dir)
+            judge = name[len(RESULTS_PREFIX) :] if name.startswith(RESULTS_PREFIX) else name
+            found.append((os.path.basename(os.path.dirname(results_dir)), judge, results_dir))
+    return found
+
+
+def import_results(models_dir: str, results_glob: str = "Results-*", pattern: str = "*_scores_results.jsonl", json_paths=(DEFAULT_JSON_PATH,)) -> ResultsStore:
+    index = load_prompt_index(tuple(json_paths))
+    values = {name: [] for name in COLUMNS}
+    for model, judge, results_dir in find_result_dirs(models_dir, results_glob):
+        count = 0
+        for scores_path in sorted(glob.glob(os.path.join(results_dir, pattern))):
+            full_path = _full_path_for(scores_path)
+            full = load_records(full_path) if full_path else {}
+            for prompt_id, rec in load_records(scores_path).items():
+                if not isinstance(prompt_id, int) or rec.get("score") not in (0, 1):
+                    continue
+                transcript = full.get(prompt_id, {})
+                prob = rec.get("score_prob")
+                values["model"].append(model)
+                values["judge"].append(judge)
+                values["prompt_id"].append(prompt_id)
+                values["subcategory"].append(rec.get("Subcategory") or "")
+                values["score"].append(int(rec["score"]))
+                values["score_prob"].append(prob if isinstance(prob, (int, float)) else np.nan)
+                values["attempts"].append(len(transcript.get("attempts", [])) if transcript else -1)
+                values["image_path"].append(transcript.get("image_path", ""))
+                values["evaluation"].append(transcript.get("evaluation", ""))
+                count += 1
+        print(f"[STORE] {model} / {judge}: {count} records", file=sys.stderr)
+
+    prompt_ids = np.asarray(values["prompt_id"], dtype=np.int64)
+    categories = index.categories_of(prompt_ids)
+    values["category"] = np.array(ORDERED_CATEGORIES + [""], dtype=object)[categories]
+    # Older score files have no Subcategory; the prompt index has it for every known prompt.
+    known_sub = np.array(index.subcategories + [""], dtype=object)[index.subcategories_of(prompt_ids)]
+    values["subcategory"] = np.where(np.asarray(values["subcategory"], dtype=object) == "", known_sub, np.asarray(values["subcategory"], dtype=object))
+    return ResultsStore.from_values(values)
+
+
+def merge_into(existing: ResultsStore, imported: ResultsStore) -> ResultsStore:
+    """Replaces the (model, judge) runs present in `imported`; every other run in `existing` is kept."""
+    if not len(existing):
+        return imported
+    runs = set(zip(imported.values("model").tolist(), imported.values("judge").tolist()))
+    old_runs = np.array([run in runs for run in zip(existing.values("model").tolist(), existing.values("judge").tolist())], dtype=bool)
+    return ResultsStore.concat([existing.take(~old_runs), imported])
+
+
+# ---- Reports ----
+
+
+def _cell(value):
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else f"{value:.4f}"
+    return str(value)
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def render(rows: List[Dict], fmt: str) -> str:
+    if fmt == "json":
+        return json.dumps([{k: _plain(v) for k, v in row.items()} for row in rows], indent=2, ensure_ascii=False) + "\n"
+    columns = list(rows[0]) if rows else []
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows([_cell(row[c]) for c in columns] for row in rows)
+        return out.getvalue()
+    lines = ["| " + " | ".join(columns) + " |", "| " + " | ".join("---:" if isinstance(rows[0][c], (int, float, np.number)) else "---" for c in columns) + " |"]
+    lines += ["| " + " | ".join(_cell(row[c]).replace("|", "\\|").replace("\n", " ") for c in columns) + " |" for row in rows]
+    return "\n".join(lines) + "\n"
+
+
+def parse_where(conditions: List[str]) -> Dict[str, list]:
+    """["model=A,B", "score=0"] (or "model=A" "model=B") -> {"model": ["A", "B"], "score": [0.0]}."""
+    where = {}
+    for cond in conditions:
+        name, sep, value = cond.partition("=")
+        if not sep:
+            raise SystemExit(f"--where {cond!r}: expected column=value")
+        for item in value.split(","):
+            where.setdefault(name, []).append(item if name in CATEGORICAL or name in TEXT else float(item))
+    return where
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Columnar store of WISE results across models and judges")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="Consolidate <models_dir>/<model>/Results-<judge>/ folders into the store.")
+    p.add_argument("models_dir")
+    p.add_argument("--store", required=True, help="Store file (.npz, or .parquet with pyarrow).")
+    p.add_argument("--results_glob", default="Results-*", help="Results folders inside each model directory, one per judge.")
+    p.add_argument("--pattern", default="*_scores_results.jsonl")
+    p.add_argument("--json_path", nargs="+", default=[DEFAULT_JSON_PATH])
+    p.add_argument("--replace", action="store_true", help="Rebuild the store instead of replacing only the imported runs.")
+
+    for name, help_text in (
+        ("query", "Count and mean score grouped by columns."),
+        ("failures", "List score=0 rows with the judge's evaluation."),
+        ("agreement", "Score agreement between two judges on the same (model, prompt_id)."),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("store")
+        if name == "agreement":
+            p.add_argument("judge_a")
+            p.add_argument("judge_b")
+        p.add_argument("--where", nargs="+", default=[], metavar="COLUMN=VALUE", help="Row filter, e.g. model=A,B score=0; several values of one column are ORed.")
+        p.add_argument("--format", choices=["md", "csv", "json"], default="md")
+        if name == "failures":
+            p.add_argument("--limit", type=int, default=50)
+            p.add_argument("--width", type=int, default=160, help="Truncate evaluations to this many characters (0: no limit).")
+        else:
+            p.add_argument("--by", nargs="*", default=["model"], help=f"Group columns: {', '.join(CATEGORICAL + ('prompt_id',))}.")
+        if name == "query":
+            p.add_argument("--value", default="score", choices=["score", "score_prob"])
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == "import":
+        imported = import_results(args.models_dir, args.results_glob, args.pattern, args.json_path)
+        store = imported
+        if not args.replace and os.path.isfile(args.store):
+            store = merge_into(ResultsStore.load(args.store), imported)
+        store.save(args.store)
+        print(f"[SAVE] {args.store} ({len(store)} rows, {len(imported)} imported)", file=sys.stderr)
+        return
+
+    store = ResultsStore.load(args.store).filter(**parse_where(args.where))
+    if args.command == "query":
+        rows = store.groupby(args.by, value=args.value)
+    elif args.command == "agreement":
+        rows = store.agreement(args.judge_a, args.judge_b, by=args.by)
+    else:
+        failed = store.filter(score=0)
+        failed = failed.take(np.lexsort((failed.columns["prompt_id"], failed.columns["judge"], failed.columns["model"]))[: args.limit])
+        shown = {name: failed.values(name) for name in ("model", "judge", "prompt_id", "category", "subcategory", "evaluation")}
+        rows = [{name: col[i] for name, col in shown.items()} for i in range(len(failed))]
+        for row in rows:
+            if args.width and len(row["evaluation"]) > args.width:
+                row["evaluation"] = row["evaluation"][: args.width] + "..."
+    sys.stdout.write(render(rows, args.format))
+
+
+if __name__ == "__main__":
+    main()
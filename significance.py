@@ -0,0 +1,149 @@
+"""Vectorized paired significance tests between models judged on the same prompts.
+
+Scores are aligned as an (models, prompts) int8 matrix: 1/0 for a judged
+prompt, -1 where a model has no score. All model pairs are tested at once:
+discordant counts for McNemar come from one matrix product per category, and
+the paired permutation test applies one shared set of random sign flips to
+every pair's per-prompt differences, again as a matrix product.
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+def all_pairs(num_models: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row/column indices (a, b) of every unordered pair a < b."""
+    return np.triu_indices(num_models, k=1)
+
+
+def discordant_counts(scores: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """(models, models) matrix of prompts in `columns` that row model passed and column model failed.
+
+    The transpose gives the opposite discordance; prompts either model lacks
+    are not counted.
+    """
+    sub = scores[:, columns]
+    passed = (sub == 1).astype(np.float32)
+    failed = (sub == 0).astype(np.float32)
+    return np.rint(passed @ failed.T).astype(np.int64)
+
+
+def _binomial_half_cdf(n: np.ndarray, k: np.ndarray) -> np.ndarray:
+    """P(X <= k) for X ~ Binomial(n, 1/2), elementwise; one table row per distinct n."""
+    rows, inverse = np.unique(n, return_inverse=True)
+    width = int(k.max()) + 1 if k.size else 1
+    top = int(rows.max()) if rows.size else 0
+    log_fact = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, top + 1)))])
+    nn = rows[:, None]
+    kk = np.arange(width)[None, :]
+    valid = kk <= nn
+    log_pmf = log_fact[nn] - log_fact[np.minimum(kk, nn)] - log_fact[np.maximum(nn - kk, 0)] - nn * np.log(2.0)
+    cdf = np.cumsum(np.where(valid, np.exp(log_pmf), 0.0), axis=1)
+    return cdf[inverse.reshape(n.shape), k]
+
+
+def mcnemar_exact(b10: np.ndarray, b01: np.ndarray) -> np.ndarray:
+    """Two-sided exact McNemar p-values (binomial test of b10 against b01 at 1/2), elementwise."""
+    b10 = np.asarray(b10, dtype=np.int64)
+    b01 = np.asarray(b01, dtype=np.int64)
+    return np.minimum(1.0, 2.0 * _binomial_half_cdf(b10 + b01, np.minimum(b10, b01)))
+
+
+def holm(pvalues: np.ndarray, axis: int = 0) -> np.ndarray:
+    """Holm-Bonferroni adjusted p-values along `axis` (e.g. across all pairs of one category)."""
+    p = np.moveaxis(np.asarray(pvalues, dtype=np.float64), axis, 0)
+    m = p.shape[0]
+    order = np.argsort(p, axis=0)
+    ranked = np.take_along_axis(p, order, axis=0) * (m - np.arange(m)).reshape((m,) + (1,) * (p.ndim - 1))
+    ranked = np.minimum(1.0, np.maximum.accumulate(ranked, axis=0))
+    adjusted = np.empty_like(p)
+    np.put_along_axis(adjusted, order, ranked, axis=0)
+    return np.moveaxis(adjusted, 0, axis)
+
+
+def paired_comparisons(
+    scores: np.ndarray,
+    categories: np.ndarray,
+    weights: np.ndarray,
+    n_permutations: int = 10000,
+    seed: int = 0,
+    pair_block: int = 4096,
+    permutation_block: int = 1024,
+) -> Dict[str, np.ndarray]:
+    """Paired tests for every model pair, per category and for the weighted overall score.
+
+    `scores` is the aligned (models, prompts) matrix, `categories` the
+    category code of each prompt column and `weights` the overall weight per
+    category. Each pair is compared on the prompts both models have.
+
+    Returns arrays indexed by pair (see all_pairs), with a trailing category
+    axis where the last entry is the overall score:
+      diff     mean score of a minus b (weighted for overall)
+      b10/b01  prompts a passed and b failed / the reverse (overall: all prompts pooled)
+      mcnemar  exact McNemar p-value
+      perm     two-sided sign-flip permutation p-value
+    """
+    scores = np.asarray(scores, dtype=np.int8)
+    num_models, num_prompts = scores.shape
+    num_categories = len(weights)
+    a, b = all_pairs(num_models)
+    num_pairs = len(a)
+    columns = [np.flatnonzero(categories == code) for code in range(num_categories)]
+
+    b10 = np.zeros((num_pairs, num_categories + 1), dtype=np.int64)
+    b01 = np.zeros_like(b10)
+    for code, cols in enumerate(columns + [np.flatnonzero(categories >= 0)]):
+        counts = discordant_counts(scores, cols)
+        b10[:, code] = counts[a, b]
+        b01[:, code] = counts[b, a]
+    mcnemar = mcnemar_exact(b10, b01)
+
+    # Sign flips shared by all pairs: flipping prompt i swaps the two models' scores on it.
+    rng = np.random.default_rng(seed)
+    diff = np.full((num_pairs, num_categories + 1), np.nan)
+    exceed = np.zeros((num_pairs, num_categories + 1), dtype=np.int64)
+    for start in range(0, num_pairs, pair_block):
+        rows = slice(start, min(num_pairs, start + pair_block))
+        sa, sb = scores[a[rows]], scores[b[rows]]
+        both = (sa >= 0) & (sb >= 0)
+        d = np.where(both, sa.astype(np.float32) - sb, 0.0).astype(np.float32)
+
+        # Per-prompt contribution to each category mean, and its weighted share of the overall score.
+        scaled, observed = [], np.zeros((d.shape[0], num_categories + 1))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for code, cols in enumerate(columns):
+                n = both[:, cols].sum(axis=1)
+                part = d[:, cols] / np.where(n > 0, n, 1)[:, None].astype(np.float32)
+                part[n == 0] = 0.0
+                scaled.append(part)
+                observed[:, code] = np.where(n > 0, part.sum(axis=1), np.nan)
+        observed[:, -1] = observed[:, :num_categories] @ weights
+        diff[rows] = observed
+        # float32 products: a permuted statistic equal to the observed one must still count.
+        limit = np.abs(observed) * (1 - 1e-5)
+
+        block_rng = np.random.default_rng(rng.integers(2**63))
+        for done in range(0, n_permutations, permutation_block):
+            r = min(permutation_block, n_permutations - done)
+            signs = block_rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(r, num_prompts))
+            overall = np.zeros((d.shape[0], r), dtype=np.float32)
+            for code, cols in enumerate(columns):
+                stat = scaled[code] @ signs[:, cols].T
+                overall += weights[code] * stat
+                exceed[rows, code] += (np.abs(stat) >= limit[:, code, None]).sum(axis=1)
+            exceed[rows, -1] += (np.abs(overall) >= limit[:, -1, None]).sum(axis=1)
+
+    perm = (1 + exceed) / (1 + n_permutations)
+    # A pair that never differs (or has no common prompts) carries no evidence.
+    perm[~(np.abs(diff) > 0)] = 1.0
+    return {"a": a, "b": b, "diff": diff, "b10": b10, "b01": b01, "mcnemar": mcnemar, "perm": perm}
+
+
+def pair_matrix(values: np.ndarray, a: np.ndarray, b: np.ndarray, num_models: int, antisymmetric: bool = False) -> np.ndarray:
+    """Square (models, models) matrix from per-pair values; the lower triangle mirrors (or negates) the upper one."""
+    out = np.full((num_models, num_models), np.nan)
+    out[a, b] = values
+    out[b, a] = -values + 0.0 if antisymmetric else values  # + 0.0: no "-0.000" cells
+    return out
+
@@ -0,0 +1,63 @@
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vllm_eval import _batch_score_probabilities, _fallback_positions, extract_batch_scores  # noqa: E402
+
+
+def _choice(lines):
+    """A batched reply from (line, P(1)) pairs, with top logprobs at each line's score digit."""
+    tokens = []
+    for line, p in lines:
+        head, digit = line[:-1], line[-1]
+        tokens.append({"token": head, "logprob": 0.0})
+        alts = [{"token": "1", "logprob": math.log(p)}, {"token": "0", "logprob": math.log(1 - p)}]
+        tokens.append({"token": digit, "logprob": math.log(p if digit == "1" else 1 - p), "top_logprobs": alts})
+        tokens.append({"token": "\n", "logprob": 0.0})
+    return {"logprobs": {"content": tokens}}
+
+
+def test_all_lines_parsed():
+    txt = "Image 1: Score: 1\nImage 2: Score: 0\nImage 3: Score: 1"
+    assert extract_batch_scores(txt, 3) == {1: 1.0, 2: 0.0, 3: 1.0}
+
+
+def test_out_of_order_and_decorated_lines():
+    txt = "**Image 3** - Score: 0\n- Image 1: score 1\nImage 2 Score: 1"
+    assert extract_batch_scores(txt, 3) == {1: 1.0, 2: 1.0, 3: 0.0}
+
+
+def test_partial_reply_falls_back_for_missing_positions():
+    parsed = extract_batch_scores("Image 1: Score: 1\nImage 3: Score: 0", 4)
+    assert parsed == {1: 1.0, 3: 0.0}
+    assert _fallback_positions(parsed, 4, check=False) == [2, 4]
+
+
+def test_duplicate_and_out_of_range_lines_are_dropped():
+    txt = "Image 1: Score: 1\nImage 2: Score: 0\nImage 2: Score: 1\nImage 5: Score: 1"
+    parsed = extract_batch_scores(txt, 3)
+    assert parsed == {1: 1.0}
+    assert _fallback_positions(parsed, 3, check=False) == [2, 3]
+
+
+def test_check_judges_every_position_singly():
+    parsed = extract_batch_scores("Image 1: Score: 1\nImage 2: Score: 0", 2)
+    assert _fallback_positions(parsed, 2, check=True) == [1, 2]
+
+
+def test_probabilities_follow_image_numbers():
+    choice = _choice([("Image 2: Score: 1", 0.9), ("Image 1: Score: 0", 0.25)])
+    probs = _batch_score_probabilities(choice)
+    assert probs.keys() == {1, 2}
+    assert math.isclose(probs[1], 0.25) and math.isclose(probs[2], 0.9)
+
+
+def test_probabilities_keep_first_of_duplicate_lines():
+    choice = _choice([("Image 1: Score: 1", 0.8), ("Image 1: Score: 0", 0.3)])
+    assert math.isclose(_batch_score_probabilities(choice)[1], 0.8)
+
+
+def test_probabilities_without_logprobs():
+    assert _batch_score_probabilities({"message": {"content": "Image 1: Score: 1"}}) == {}
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vllm_eval import _cache_key, build_batch_messages, build_evaluation_messages  # noqa: E402
+
+PROMPT = {"prompt_id": 1, "Prompt": "A red apple", "Explanation": "An apple that is red."}
+
+
+def _cfg(**overrides):
+    cfg = {
+        "model": "judge",
+        "api_bases": ["http://127.0.0.1:8000/v1"],
+        "api_key": None,
+        "score_mode": "free",
+        "stream": False,
+    }
+    cfg.update(overrides)
+    return cfg
+
+
+def test_streamed_and_plain_requests_share_a_key():
+    msgs = build_evaluation_messages(PROMPT, image_url="sha256:abc")
+    for mode in ("free", "guided"):
+        assert _cache_key(msgs, _cfg(score_mode=mode, stream=True)) == _cache_key(msgs, _cfg(score_mode=mode))
+
+
+def test_streamed_and_plain_batches_share_a_key():
+    msgs = build_batch_messages([(PROMPT, "sha256:abc"), (PROMPT, "sha256:def")])
+    streamed = _cache_key(msgs, _cfg(stream=True, batch_items=2))
+    assert streamed == _cache_key(msgs, _cfg(batch_items=2))
+
+
+def test_decoding_changes_the_key():
+    msgs = build_evaluation_messages(PROMPT, image_url="sha256:abc")
+    assert _cache_key(msgs, _cfg(score_mode="guided")) != _cache_key(msgs, _cfg())
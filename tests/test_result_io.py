@@ -0,0 +1,61 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_io import iter_records, load_records, write_records  # noqa: E402
+
+SUFFIXES = [
+    ".jsonl",
+    ".jsonl.gz",
+    pytest.param(
+        ".jsonl.zst",
+        marks=pytest.mark.skipif(importlib.util.find_spec("zstandard") is None, reason="zstandard not installed"),
+    ),
+]
+
+
+def _recs(*pids, score=1):
+    return [{"prompt_id": pid, "score": score, "note": "ü"} for pid in pids]
+
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_append_round_trip(tmp_path, suffix):
+    path = str(tmp_path / f"full{suffix}")
+    write_records(path, _recs(1, 2))
+    write_records(path, _recs(3), append=True)
+    write_records(path, _recs(2, score=0), append=True)
+
+    assert [rec["prompt_id"] for rec in iter_records(path)] == [1, 2, 3, 2]
+    # Later records win, so a re-judged prompt replaces its earlier transcript.
+    records = load_records(path)
+    assert sorted(records) == [1, 2, 3]
+    assert records[2]["score"] == 0 and records[1]["note"] == "ü"
+
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_append_creates_missing_file(tmp_path, suffix):
+    path = str(tmp_path / f"full{suffix}")
+    write_records(path, _recs(5), append=True)
+    assert list(iter_records(path)) == _recs(5)
+
+
+def test_truncated_gzip_keeps_complete_records(tmp_path):
+    path = str(tmp_path / "full.jsonl.gz")
+    write_records(path, _recs(*range(1, 200)))
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[: len(data) - 8])  # drop the gzip trailer, as a crash mid-write would
+
+    pids = [rec["prompt_id"] for rec in iter_records(path)]
+    assert pids == list(range(1, len(pids) + 1))
+
+
+def test_legacy_json_array(tmp_path):
+    path = str(tmp_path / "full.json")
+    write_records(path, _recs(2, 1))
+    assert list(iter_records(path)) == _recs(2, 1)
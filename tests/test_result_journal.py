@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_io import ResultJournal, journal_path_for, replay_journal  # noqa: E402
+from vllm_eval import add_result, close_result_set, open_result_set  # noqa: E402
+
+
+def _records(pid, score):
+    return {"prompt_id": pid, "evaluation": f"Score: {score}"}, {"prompt_id": pid, "score": score}
+
+
+def _cfg(output_dir, full="full.json"):
+    return {
+        "output_dir": str(output_dir),
+        "result_files": {"full": full, "scores": "scores.jsonl"},
+        "fsync_every": 1,
+    }
+
+
+def _write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def test_replay_skips_torn_last_line(tmp_path):
+    path = str(tmp_path / "scores.jsonl.journal")
+    journal = ResultJournal(path)
+    for pid in (1, 2):
+        journal.append(*_records(pid, 1))
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"full": {"prompt_id": 3}, "sco')
+
+    assert [rec["score"]["prompt_id"] for rec in replay_journal(path)] == [1, 2]
+
+
+def test_replay_of_missing_journal_is_empty(tmp_path):
+    assert list(replay_journal(str(tmp_path / "none.journal"))) == []
+
+
+def test_resume_merges_journal_over_existing_outputs(tmp_path):
+    _write_jsonl(tmp_path / "scores.jsonl", [_records(1, 0)[1], _records(2, 0)[1]])
+    with open(tmp_path / "full.json", "w", encoding="utf-8") as f:
+        json.dump([_records(1, 0)[0], _records(2, 0)[0]], f)
+    journal = ResultJournal(journal_path_for(str(tmp_path / "scores.jsonl")))
+    journal.append(*_records(2, 1))  # re-judged: the journal's record wins
+    journal.append(*_records(3, 1))
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"full": {"prompt_id": 4')
+
+    rs = open_result_set("all", _cfg(tmp_path))
+    assert {pid: rec["score"] for pid, rec in rs["exist_scores"].items()} == {1: 0, 2: 1, 3: 1}
+    assert sorted(rs["exist_full"]) == [1, 2, 3]
+
+    add_result(rs, {"status": "ok", "full": _records(4, 0)[0], "score": _records(4, 0)[1]})
+    close_result_set(rs)
+
+    with open(tmp_path / "scores.jsonl", encoding="utf-8") as f:
+        scores = [json.loads(line) for line in f]
+    assert [(rec["prompt_id"], rec["score"]) for rec in scores] == [(1, 0), (2, 1), (3, 1), (4, 0)]
+    with open(tmp_path / "full.json", encoding="utf-8") as f:
+        assert [rec["prompt_id"] for rec in json.load(f)] == [1, 2, 3, 4]
+    assert not os.path.exists(journal.path)
@@ -2,30 +2,273 @@ import json
 import os
 import base64
 import re
+import shutil
+import signal
+import subprocess
+import sys
 import argparse
+import asyncio
+import bisect
 import concurrent.futures
+import functools
+import hashlib
+import itertools
+import math
+import threading
+import time
+import urllib.request
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 import requests
 
+from judge_cache import JudgeCache, request_cache_key
+from judge_metrics import (
+    BatchStats,
+    PeriodicTask,
+    RunMetrics,
+    StageProfiler,
+    format_profile,
+    serve_prometheus,
+    write_metrics_json,
+)
+from image_prep import PrepStats, prepare_image
+from image_source import ImageRef, ImageSource, image_nbytes, read_image, source_root
+from judge_pool import AdaptiveLimiter, AsyncByteBudget, ByteBudget, HedgePolicy, ReplicaPool, RetryPolicy, percentile
+from result_io import (
+    GracefulStop,
+    ResultJournal,
+    is_jsonl_path,
+    journal_path_for,
+    replay_journal,
+    write_records,
+)
+
 REQUIRED_SCORE_KEYS = {"score"}
 MAX_EXTRACT_RETRIES = 3
+# At temperature 0 an unparseable answer comes back identical if resent, so
+# parse retries ask for a repair and, on the last try, sample instead.
+REPAIR_PROMPT = "Your reply did not contain a valid score. Reply with exactly one line: `Score: 0` or `Score: 1`."
+PARSE_RETRY_DECODING = [{}, {"temperature": 0.7, "top_p": 0.95}]
+# Guided score mode: the only completions the judge may produce.
+SCORE_CHOICES = ["Score: 0", "Score: 1"]
+GUIDED_MAX_TOKENS = 8
+SCORE_TOP_LOGPROBS = 10
+SCORE_PATTERN = re.compile(r"\*{0,2}Score\*{0,2}\s*[::]?\s*([01])\b", re.IGNORECASE)
+# Batched judging: one `Image <n>: Score: <0|1>` line per image, markdown tolerated.
+BATCH_SCORE_PATTERN = re.compile(r"(?im)^[^\w\n]*Image\s*(\d+)[^\w\n]*Score[^\w\n]*([01])\b")
+BATCH_LINE_MAX_TOKENS = 12
+
+# Output file group for each dataset Category, matching the per-category files
+# in data_verified/ that calculate_verified.py expects.
+CATEGORY_GROUPS = {
+    "Cultural knowledge": "cultural_common_sense",
+    "time": "spatio-temporal_reasoning",
+    "Space": "spatio-temporal_reasoning",
+    "Biology": "natural_science",
+    "Physical Knowledge": "natural_science",
+    "Chemistry": "natural_science",
+}
+GROUP_PLACEHOLDER = "{category}"
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Image Quality Assessment Tool (vLLM)")
-    parser.add_argument("--json_path", required=True)
-    parser.add_argument("--image_dir", required=True)
-    parser.add_argument("--output_dir", required=True)
+    parser.add_argument(
+        "--json_path",
+        required=True,
+        nargs="+",
+        help="One or more prompt files (e.g. data_verified/merge.json); all prompts share one worker pool.",
+    )
+    parser.add_argument(
+        "--image_dir",
+        default=None,
+        help="Directory of <prompt_id>.png/.jpg/.webp images, or tar/zip (WebDataset) shards: "
+        "one archive, a directory of them, or a glob such as 'shards/*.tar'.",
+    )
+    parser.add_argument("--output_dir", default=None)
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Batch mode: JSON {model_name: image_dir} (or a TSV of name<TAB>image_dir). "
+        "All models share one fairly interleaved pool; outputs go to <image_dir>/<results_subdir> "
+        "(next to the shards when image_dir is an archive or glob).",
+    )
+    parser.add_argument("--results_subdir", default="Results-qwen35")
     parser.add_argument("--api_key", default="", type=str)
     parser.add_argument("--model", required=True)
-    parser.add_argument("--result_full", required=True)  # .json
+    # Both may contain "{category}" to write one file per category group
+    # (cultural_common_sense, spatio-temporal_reasoning, natural_science).
+    parser.add_argument("--result_full", required=True)  # .json, or .jsonl[.gz|.zst] (appended, not rewritten)
     parser.add_argument("--result_scores", required=True)  # .jsonl
-    parser.add_argument("--api_base", default="http://127.0.0.1:8000/v1", type=str)
+    parser.add_argument(
+        "--api_base",
+        default=["http://127.0.0.1:8000/v1"],
+        nargs="+",
+        help="One or more vLLM endpoints; requests go to the replica with the fewest outstanding requests.",
+    )
+    parser.add_argument(
+        "--health_interval",
+        type=float,
+        default=15.0,
+        help="Seconds between replica health checks (GET <api_base>/models); 0 disables them.",
+    )
+    parser.add_argument(
+        "--score_mode",
+        choices=["free", "guided", "guided_legacy"],
+        default="free",
+        help="free: parse `Score: 0|1` from free text; guided: constrain the output to `Score: 0|1` with vLLM "
+        "structured outputs and record P(score=1) from logprobs; guided_legacy: same via `guided_choice` (vLLM < 0.10).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions and close the request as soon as a `Score: 0|1` line has been emitted.",
+    )
     parser.add_argument("--max_workers", type=int, default=10)
     parser.add_argument("--timeout", type=int, default=300)
-    return parser.parse_args()
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=4,
+        help="Retries after transient errors (connection errors, timeouts, HTTP 408/429/5xx), with jittered exponential backoff.",
+    )
+    parser.add_argument("--retry_backoff", type=float, default=1.0, help="Base backoff delay in seconds (doubles per retry).")
+    parser.add_argument("--retry_max_delay", type=float, default=30.0)
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "async"],
+        default="threads",
+        help="threads: one OS thread per worker; async: single event loop with a pooled keep-alive HTTP client (requires aiohttp).",
+    )
+    parser.add_argument(
+        "--adaptive_concurrency",
+        action="store_true",
+        help="Tune the in-flight request limit with AIMD between --min_workers and --max_workers (async engine only).",
+    )
+    parser.add_argument("--min_workers", type=int, default=4)
+    parser.add_argument(
+        "--max_inflight_mb",
+        type=float,
+        default=0,
+        help="Budget for encoded image payloads held in memory at once, independent of --max_workers (0 = unlimited).",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate of any request outstanding longer than the observed p95 latency, preferably to "
+        "another replica, and keep the first answer (async engine only).",
+    )
+    parser.add_argument("--hedge_max_rate", type=float, default=5.0, help="Cap on hedged requests, in percent of all requests.")
+    parser.add_argument("--hedge_min_delay", type=float, default=1.0, help="Never hedge a request younger than this (seconds).")
+    parser.add_argument(
+        "--fsync_every",
+        type=int,
+        default=32,
+        help="fsync the results journal after this many records (it is also synced at least every 2s).",
+    )
+    parser.add_argument(
+        "--cache_path",
+        default=None,
+        help="SQLite file for the content-addressed judge response cache (disabled if unset).",
+    )
+    parser.add_argument("--cache_max_mb", type=int, default=1024)
+    parser.add_argument("--summary_json", default=None, help="Write a machine-readable run summary (throughput, latency, ...) here.")
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Don't print every judge response; print a progress/ETA line every --progress_interval seconds instead.",
+    )
+    parser.add_argument("--progress_interval", type=float, default=10.0)
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=0,
+        help="Serve live metrics in Prometheus text format on http://0.0.0.0:PORT/metrics (0 = off).",
+    )
+    parser.add_argument("--metrics_json", default=None, help="Periodically rewrite a JSON snapshot of the live metrics here.")
+    parser.add_argument("--metrics_interval", type=float, default=10.0)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time each pipeline stage per item (disk read, encode, message build, cache lookup, JSON serialize, "
+        "network, extract_scores) and print a breakdown at the end (also added to --summary_json).",
+    )
+    parser.add_argument(
+        "--cprofile",
+        default=None,
+        help="Run cProfile over the evaluation and dump stats here (main thread only: covers the async engine "
+        "fully, but only dispatch for --engine threads).",
+    )
+    parser.add_argument(
+        "--py_spy",
+        default=None,
+        help="Attach the py-spy sampling profiler (all threads and prep processes) and write a flame graph here.",
+    )
+    parser.add_argument(
+        "--max_pixels",
+        type=int,
+        default=None,
+        help="Downscale images above this many pixels before sending (set it to the judge processor's max_pixels).",
+    )
+    parser.add_argument(
+        "--image_format",
+        choices=["png", "jpeg", "webp"],
+        default=None,
+        help="Transcode images to this format before sending (default: keep the source format).",
+    )
+    parser.add_argument("--image_quality", type=int, default=90, help="JPEG/WebP quality for --image_format.")
+    parser.add_argument(
+        "--judge_batch",
+        type=int,
+        default=1,
+        help="Judge this many images per request, with one numbered score line per image; the protocol text is "
+        "prefilled once per batch. Items whose line can't be parsed are re-judged singly.",
+    )
+    parser.add_argument(
+        "--batch_agreement",
+        type=int,
+        default=0,
+        help="With --judge_batch: also judge about this many items (whole batches spread over the run) singly, "
+        "and report how often the batched and single verdicts agree. The single verdict is kept for them.",
+    )
+    parser.add_argument(
+        "--image_url_mode",
+        choices=["base64", "file"],
+        default="base64",
+        help="How images reach the judge: inlined as base64 data URLs, or as file:// URLs that a vLLM server started "
+        "with --allowed-local-media-path reads itself (shared filesystem). file mode is checked at startup per "
+        "image source and falls back to base64 where the server can't read the path.",
+    )
+    parser.add_argument(
+        "--media_path_map",
+        action="append",
+        default=[],
+        metavar="CLIENT_PREFIX=SERVER_PREFIX",
+        help="For --image_url_mode file when the server mounts the images elsewhere; may be repeated.",
+    )
+    parser.add_argument(
+        "--prep_workers",
+        type=int,
+        default=0,
+        help="Processes for image reading/resizing/base64 (default: in-thread, or one per CPU when resizing/transcoding).",
+    )
+    args = parser.parse_args()
+    if args.manifest is None and (args.image_dir is None or args.output_dir is None):
+        parser.error("--image_dir and --output_dir are required unless --manifest is given")
+    if args.adaptive_concurrency and args.engine != "async":
+        parser.error("--adaptive_concurrency requires --engine async")
+    if args.hedge and args.engine != "async":
+        parser.error("--hedge requires --engine async")
+    if args.image_url_mode == "file" and (args.max_pixels or args.image_format):
+        parser.error("--image_url_mode file sends the original files; it cannot be combined with --max_pixels/--image_format")
+    if args.judge_batch < 1:
+        parser.error("--judge_batch must be at least 1")
+    if args.batch_agreement and args.judge_batch == 1:
+        parser.error("--batch_agreement requires --judge_batch > 1")
+    if any("=" not in m for m in args.media_path_map):
+        parser.error("--media_path_map expects CLIENT_PREFIX=SERVER_PREFIX")
+    return args
 
 
 def get_config(args):
@@ -33,12 +276,47 @@ def get_config(args):
         "json_path": args.json_path,
         "image_dir": args.image_dir,
         "output_dir": args.output_dir,
+        "manifest": args.manifest,
+        "results_subdir": args.results_subdir,
         "api_key": args.api_key,
-        "api_base": args.api_base.rstrip("/"),
+        "api_bases": [base.rstrip("/") for base in args.api_base],
+        "health_interval": args.health_interval,
         "model": args.model,
         "result_files": {"full": args.result_full, "scores": args.result_scores},
+        "score_mode": args.score_mode,
+        "stream": args.stream,
         "max_workers": args.max_workers,
         "timeout": args.timeout,
+        "max_retries": args.max_retries,
+        "retry_backoff": args.retry_backoff,
+        "retry_max_delay": args.retry_max_delay,
+        "engine": args.engine,
+        "adaptive_concurrency": args.adaptive_concurrency,
+        "min_workers": args.min_workers,
+        "max_inflight_bytes": int(args.max_inflight_mb * 2**20),
+        "hedge": args.hedge,
+        "hedge_max_rate": args.hedge_max_rate,
+        "hedge_min_delay": args.hedge_min_delay,
+        "fsync_every": args.fsync_every,
+        "cache_path": args.cache_path,
+        "cache_max_mb": args.cache_max_mb,
+        "summary_json": args.summary_json,
+        "quiet": args.quiet,
+        "progress_interval": args.progress_interval,
+        "metrics_port": args.metrics_port,
+        "metrics_json": args.metrics_json,
+        "metrics_interval": args.metrics_interval,
+        "profile": args.profile,
+        "cprofile": args.cprofile,
+        "py_spy": args.py_spy,
+        "max_pixels": args.max_pixels,
+        "image_format": args.image_format,
+        "image_quality": args.image_quality,
+        "judge_batch": args.judge_batch,
+        "batch_agreement": args.batch_agreement,
+        "image_url_mode": args.image_url_mode,
+        "media_path_map": [tuple(os.path.normpath(p) for p in m.split("=", 1)) for m in args.media_path_map],
+        "prep_workers": args.prep_workers or (os.cpu_count() if args.max_pixels or args.image_format else 0),
     }
 
 
@@ -62,7 +340,7 @@ def load_json(path: str) -> Dict[int, Dict]:
 
 
 def extract_scores(txt: str) -> Dict[str, float]:
-    match = re.search(r"\*{0,2}Score\*{0,2}\s*[::]?\s*([01])\b", txt, re.IGNORECASE)
+    match = SCORE_PATTERN.search(txt)
     if match:
         return {"score": float(match.group(1))}
 
@@ -85,25 +363,36 @@ def load_prompts(path: str) -> Dict[int, Dict[str, Any]]:
     return {item["prompt_id"]: item for item in data}
 
 
-def build_evaluation_messages(prompt_data: Dict, image_base64: str) -> list:
-    return [
-        {
-            "role": "system",
-            "content": [
-                {
-                    "type": "text",
-                    "text": "You are a professional text-to-image quality auditor. Evaluate the image strictly according to the protocol.",
-                }
-            ],
-        },
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": f"""Please evaluate this generated image for the WISE benchmark and return ONLY one binary score.
+def load_grouped_prompts(paths: List[str], split_groups: bool) -> Dict[int, Tuple[str, Dict[str, Any]]]:
+    """Maps prompt_id -> (output group, prompt) across all prompt files.
+
+    A per-category file such as cultural_common_sense_verified.json is one
+    group; prompts from a merged file are grouped by their Category.
+    """
+    grouped = {}
+    known_groups = set(CATEGORY_GROUPS.values())
+    for path in paths:
+        stem = Path(path).stem
+        if stem.endswith("_verified"):
+            stem = stem[: -len("_verified")]
+        for pid, pdata in load_prompts(path).items():
+            if not split_groups:
+                group = ""
+            elif stem in known_groups:
+                group = stem
+            else:
+                group = CATEGORY_GROUPS.get(pdata.get("Category"), stem)
+            if pid in grouped:
+                print(f"[WARN] prompt_id {pid} appears in several prompt files; using the one from {path}")
+            grouped[pid] = (group, pdata)
+    return grouped
+
+
+JUDGE_SYSTEM_PROMPT = "You are a professional text-to-image quality auditor. Evaluate the image strictly according to the protocol."
+BATCH_SYSTEM_PROMPT = "You are a professional text-to-image quality auditor. Evaluate each image strictly according to the protocol."
 
-# WISE Text-to-Image Evaluation Protocol
+# Shared by the single-image and the batched judge prompts.
+JUDGE_PROTOCOL = """# WISE Text-to-Image Evaluation Protocol
 
 ## What WISE Is Evaluating
 WISE is a knowledge-intensive text-to-image benchmark. Many prompts do not directly state the final visual answer. Instead, the model must use commonsense, cultural, scientific, spatial, or temporal knowledge to infer what should appear in the image.
@@ -149,7 +438,33 @@ Give 0 if any of the following applies:
 - The main visual evidence is ambiguous enough that a human judge could not confidently verify correctness.
 - The image has obvious visual collapse, severe deformation, garbled main objects, impossible structure, or artifacts that interfere with evaluation.
 
-If there is serious doubt, return 0.
+If there is serious doubt, return 0."""
+
+
+def build_evaluation_messages(
+    prompt_data: Dict, image_base64: Optional[str] = None, mime: str = "image/png", image_url: Optional[str] = None
+) -> list:
+    """Judge messages for one image, inlined as a data URL or referenced by `image_url` (e.g. file://)."""
+    if image_url is None:
+        image_url = f"data:{mime};base64,{image_base64}"
+    return [
+        {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": JUDGE_SYSTEM_PROMPT,
+                }
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"""Please evaluate this generated image for the WISE benchmark and return ONLY one binary score.
+
+{JUDGE_PROTOCOL}
 
 ## Output Format
 
@@ -170,127 +485,1421 @@ Return only `Score: 0` or `Score: 1`.""",
                 },
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{image_base64}"},
+                    "image_url": {"url": image_url},
                 },
             ],
         },
     ]
 
 
-def _chat_completion_via_vllm(messages: List[Dict[str, Any]], cfg: Dict) -> str:
-    endpoint = f"{cfg['api_base']}/chat/completions"
+def build_batch_messages(items: List[Tuple[Dict, str]]) -> list:
+    """Judge messages for several (prompt_data, image_url) pairs at once, answered with one numbered line per image.
+
+    The protocol text is sent once instead of once per image, so its tokens are
+    prefilled once per batch.
+    """
+    n = len(items)
+    content = [
+        {
+            "type": "text",
+            "text": f"""Please evaluate the following {n} generated images for the WISE benchmark and return ONLY one binary score per image.
+
+Each image comes with its own PROMPT and EXPLANATION. Judge every image independently against its own PROMPT and EXPLANATION only; the other images must not influence its score.
+
+{JUDGE_PROTOCOL}
+
+## Output Format
+
+Return exactly {n} lines and nothing else, one per image in the order given:
+
+""" + "\n".join(f"Image {i}: Score: <0 or 1>" for i in range(1, n + 1)),
+        }
+    ]
+    for i, (prompt_data, image_url) in enumerate(items, 1):
+        content.append(
+            {
+                "type": "text",
+                "text": f'---\n\nImage {i}\nPROMPT: "{prompt_data["Prompt"]}"\nEXPLANATION: "{prompt_data["Explanation"]}"',
+            }
+        )
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    content.append({"type": "text", "text": f"---\n\nReturn only the {n} lines `Image <n>: Score: 0` or `Image <n>: Score: 1`."})
+    return [
+        {"role": "system", "content": [{"type": "text", "text": BATCH_SYSTEM_PROMPT}]},
+        {"role": "user", "content": content},
+    ]
+
+
+def extract_batch_scores(txt: str, n: int) -> Dict[int, float]:
+    """{image number: score} for a batched reply; a number that is missing, out of range or answered twice is left out."""
+    found = {}
+    for match in BATCH_SCORE_PATTERN.finditer(txt):
+        pos = int(match.group(1))
+        if 1 <= pos <= n:
+            found.setdefault(pos, []).append(float(match.group(2)))
+    return {pos: scores[0] for pos, scores in found.items() if len(scores) == 1}
+
+
+_thread_local = threading.local()
+
+
+def _get_session() -> requests.Session:
+    # One keep-alive session per worker thread; requests.Session is not thread-safe.
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+
+def _auth_headers(cfg: Dict) -> Dict[str, str]:
     headers = {"Content-Type": "application/json"}
     if cfg["api_key"]:
         headers["Authorization"] = f"Bearer {cfg['api_key']}"
+    return headers
+
+
+def _build_chat_request(messages: List[Dict[str, Any]], cfg: Dict, api_base: str = None):
+    endpoint = f"{api_base or cfg['api_bases'][0]}/chat/completions"
+    headers = _auth_headers(cfg)
 
     payload = {
         "model": cfg["model"],
         "messages": messages,
         "temperature": 0.0,
         "max_tokens": 500,
-        # NOTE: using raw requests here, so parameters must be top-level.
+        # NOTE: using raw HTTP here, so parameters must be top-level.
         "chat_template_kwargs": {"enable_thinking": False},
     }
-    resp = requests.post(endpoint, headers=headers, json=payload, timeout=cfg["timeout"])
-    resp.raise_for_status()
-    body = resp.json()
-    content = body["choices"][0]["message"]["content"]
+    batch_items = cfg.get("batch_items", 0)
+    if batch_items:
+        payload["max_tokens"] = max(payload["max_tokens"], BATCH_LINE_MAX_TOKENS * batch_items)
+    if cfg["score_mode"] != "free":
+        # A few tokens of `Score: 0|1` instead of up to 500 free-form ones; the
+        # logprobs at the digit give the soft score.
+        payload["max_tokens"] = GUIDED_MAX_TOKENS
+        constraint = ("choice", SCORE_CHOICES)
+        if batch_items:
+            payload["max_tokens"] = BATCH_LINE_MAX_TOKENS * batch_items
+            constraint = ("regex", "\n".join(f"Image {i}: Score: [01]" for i in range(1, batch_items + 1)))
+        if cfg["score_mode"] == "guided":
+            payload["structured_outputs"] = {constraint[0]: constraint[1]}
+        else:
+            payload[f"guided_{constraint[0]}"] = constraint[1]
+        payload["logprobs"] = True
+        payload["top_logprobs"] = SCORE_TOP_LOGPROBS
+    if cfg["stream"]:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    # Set on parse retries only (see PARSE_RETRY_DECODING).
+    payload.update(cfg.get("decoding_overrides") or {})
+    return endpoint, headers, payload
+
+
+def _digit_probability(tok: Dict[str, Any]) -> Optional[float]:
+    """P(1) at one `0`/`1` score token, renormalized over {0, 1}."""
+    mass = {"0": 0.0, "1": 0.0}
+    for alt in tok.get("top_logprobs") or [tok]:
+        digit = alt["token"].strip()
+        if digit in mass:
+            mass[digit] += math.exp(alt["logprob"])
+    total = mass["0"] + mass["1"]
+    return mass["1"] / total if total > 0 else None
+
+
+def _score_probability(choice: Dict[str, Any]) -> Optional[float]:
+    """P(score=1) from the logprobs of the first `0`/`1` token."""
+    for tok in (choice.get("logprobs") or {}).get("content") or []:
+        if tok["token"].strip() in ("0", "1"):
+            return _digit_probability(tok)
+    return None
+
+
+def _batch_score_probabilities(choice: Dict[str, Any]) -> Dict[int, float]:
+    """P(score=1) per image number of a batched reply, from the token holding each line's score digit."""
+    tokens = (choice.get("logprobs") or {}).get("content") or []
+    starts, offset = [], 0
+    for tok in tokens:
+        starts.append(offset)
+        offset += len(tok["token"])
+    text = "".join(tok["token"] for tok in tokens)
+    probs = {}
+    for match in BATCH_SCORE_PATTERN.finditer(text):
+        i = bisect.bisect_right(starts, match.start(2)) - 1
+        if tokens[i]["token"].strip() == match.group(2):
+            prob = _digit_probability(tokens[i])
+            if prob is not None:
+                probs.setdefault(int(match.group(1)), prob)
+    return probs
+
+
+def _strip_think(content: str) -> str:
     # Fallback cleanup: some models may still output think tags.
     content = re.sub(r"<think>.*?</think>\s*", "", content, flags=re.DOTALL)
-    content = re.sub(r"</think>\s*", "", content)
-    return content.strip()
+    return re.sub(r"</think>\s*", "", content)
+
+
+def _parse_chat_response(body: Dict[str, Any], batch_items: int = 0):
+    """Returns (completion text, P(score=1), token usage).
+
+    P(score=1) is None when logprobs were not requested; for a batched request
+    it is a {image number: P(score=1)} dict instead.
+    """
+    choice = body["choices"][0]
+    score_prob = _batch_score_probabilities(choice) if batch_items else _score_probability(choice)
+    return _strip_think(choice["message"]["content"]).strip(), score_prob, body.get("usage")
+
+
+def _score_settled(text: str, expect: int = 1) -> bool:
+    """True once a partial completion already contains the score extract_scores would pick (the last of `expect`, for batches)."""
+    if text.count("<think>") > text.count("</think>"):
+        return False
+    text = _strip_think(text)
+    match = next(itertools.islice(SCORE_PATTERN.finditer(text), expect - 1, None), None)
+    # The digit must be followed by something, otherwise the next token could still extend it.
+    return match is not None and match.end() < len(text)
+
+
+def _new_stream_state(expect: int = 1) -> Dict[str, Any]:
+    return {"parts": [], "logprobs": [], "usage": None, "expect": expect}
+
+
+def _stream_step(state: Dict[str, Any], raw_line: bytes) -> bool:
+    """Consumes one SSE line; returns True when the rest of the stream is not needed."""
+    line = raw_line.strip()
+    if not line.startswith(b"data:"):
+        return False
+    data = line[len(b"data:"):].strip()
+    if data == b"[DONE]":
+        return False
+    chunk = json.loads(data)
+    if chunk.get("usage"):
+        # Only sent in the final chunk, so a stream closed early has no usage.
+        state["usage"] = chunk["usage"]
+    for choice in chunk.get("choices") or []:
+        state["parts"].append((choice.get("delta") or {}).get("content") or "")
+        state["logprobs"].extend((choice.get("logprobs") or {}).get("content") or [])
+    return _score_settled("".join(state["parts"]), state["expect"])
+
+
+def _stream_body(state: Dict[str, Any]) -> Dict[str, Any]:
+    # Same shape as a non-streamed response, so _parse_chat_response handles both.
+    choice = {"message": {"content": "".join(state["parts"])}, "logprobs": {"content": state["logprobs"]}}
+    return {"choices": [choice], "usage": state["usage"]}
+
+
+def _chat_completion_via_vllm(
+    messages: List[Dict[str, Any]], cfg: Dict, api_base: str = None, profiler: StageProfiler = None, budget: ByteBudget = None
+):
+    profiler = profiler or StageProfiler()
+    endpoint, headers, payload = _build_chat_request(messages, cfg, api_base)
+    with profiler.stage("serialize"):
+        data = json.dumps(payload)
+    del payload
+    # The body is a second copy of the image(s); it counts against the payload
+    # budget only while this request is in flight, not during retry waits.
+    if budget is not None:
+        budget.reserve(len(data))
+    try:
+        with profiler.stage("network"):
+            if not cfg["stream"]:
+                resp = _get_session().post(endpoint, headers=headers, data=data, timeout=cfg["timeout"])
+                resp.raise_for_status()
+                return _parse_chat_response(resp.json(), cfg.get("batch_items", 0))
+
+            state = _new_stream_state(cfg.get("batch_items") or 1)
+            resp = _get_session().post(endpoint, headers=headers, data=data, timeout=cfg["timeout"], stream=True)
+            try:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if _stream_step(state, line):
+                        break
+            finally:
+                # After an early stop this drops the connection, which makes vLLM abort the generation.
+                resp.close()
+    finally:
+        if budget is not None:
+            budget.release(len(data))
+    return _parse_chat_response(_stream_body(state), cfg.get("batch_items", 0))
+
+
+async def _chat_completion_via_vllm_async(
+    session, messages: List[Dict[str, Any]], cfg: Dict, api_base: str = None, profiler: StageProfiler = None,
+    budget: AsyncByteBudget = None,
+):
+    profiler = profiler or StageProfiler()
+    endpoint, headers, payload = _build_chat_request(messages, cfg, api_base)
+    with profiler.stage("serialize"):
+        # Serializing a multi-megabyte payload would stall the event loop.
+        data = await asyncio.to_thread(json.dumps, payload)
+    del payload
+    # As in _chat_completion_via_vllm: the body is reserved only while in flight.
+    if budget is not None:
+        await budget.reserve(len(data))
+    try:
+        with profiler.stage("network"):
+            async with session.post(endpoint, headers=headers, data=data) as resp:
+                resp.raise_for_status()
+                if not cfg["stream"]:
+                    body = await resp.json(content_type=None)
+                else:
+                    state = _new_stream_state(cfg.get("batch_items") or 1)
+                    async for line in resp.content:
+                        if _stream_step(state, line):
+                            # Drop the connection (instead of returning it to the pool) so vLLM aborts the generation.
+                            resp.close()
+                            break
+                    body = _stream_body(state)
+    finally:
+        if budget is not None:
+            await budget.release(len(data))
+    return _parse_chat_response(body, cfg.get("batch_items", 0))
+
+
+def _error_status(e: Exception):
+    # aiohttp errors carry .status; requests' HTTPError carries .response.status_code.
+    status = getattr(e, "status", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = e.response.status_code
+    return status
+
+
+def _is_overload_error(e: Exception) -> bool:
+    # Signals that the judge is saturated rather than that the request itself is bad.
+    return isinstance(e, asyncio.TimeoutError) or _error_status(e) in (429, 503)
+
+
+def _is_transient_error(e: Exception) -> bool:
+    # The same request may well succeed after a pause; any other 4xx will not.
+    status = _error_status(e)
+    return status is None or status in (408, 429) or status >= 500
+
+
+def _is_replica_fault(e: Exception) -> bool:
+    # A 4xx (other than 429) means the request was rejected, not that the replica is unwell.
+    status = _error_status(e)
+    return status is None or status >= 500 or status == 429
+
+
+def _judge_call(rt: Dict, messages: List[Dict[str, Any]], cfg: Dict) -> Tuple[str, Optional[float]]:
+    pool = rt["replicas"]
+    replica = pool.acquire()
+    rt["metrics"].request_started()
+    start = time.monotonic()
+    try:
+        eval_txt, score_prob, usage = _chat_completion_via_vllm(
+            messages, cfg, replica.api_base, rt["profiler"], rt.get("payload_budget")
+        )
+    except Exception as e:
+        pool.release(replica, ok=False, replica_fault=_is_replica_fault(e))
+        rt["metrics"].request_finished(time.monotonic() - start, ok=False)
+        raise
+    latency = time.monotonic() - start
+    pool.release(replica, ok=True, latency=latency)
+    rt["metrics"].request_finished(latency, ok=True, usage=usage)
+    return eval_txt, score_prob
+
+
+async def _replica_call_async(rt: Dict, replica, messages: List[Dict[str, Any]], cfg: Dict) -> Tuple[str, Optional[float]]:
+    pool = rt["replicas"]
+    rt["metrics"].request_started()
+    start = time.monotonic()
+    try:
+        eval_txt, score_prob, usage = await _chat_completion_via_vllm_async(
+            rt["session"], messages, cfg, replica.api_base, rt["profiler"], rt.get("payload_budget")
+        )
+    except asyncio.CancelledError:
+        # Lost a hedge race; closing the connection makes vLLM drop the generation.
+        pool.abandon(replica)
+        rt["metrics"].request_cancelled()
+        raise
+    except Exception as e:
+        pool.release(replica, ok=False, replica_fault=_is_replica_fault(e))
+        rt["metrics"].request_finished(time.monotonic() - start, ok=False)
+        raise
+    latency = time.monotonic() - start
+    pool.release(replica, ok=True, latency=latency)
+    rt["metrics"].request_finished(latency, ok=True, usage=usage)
+    if rt.get("hedge") is not None:
+        rt["hedge"].observe(latency)
+    return eval_txt, score_prob
+
 
+async def _first_success(tasks: List[asyncio.Future]):
+    """Returns (result, task) of the first task to succeed; re-raises the last error if all fail."""
+    pending = set(tasks)
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                error = task.exception()
+        winners = [task for task in tasks if task in done and task.exception() is None]
+        if winners:
+            return winners[0].result(), winners[0]
+    raise error
+
+
+async def _hedge_call_async(rt: Dict, avoid, messages: List[Dict[str, Any]], cfg: Dict) -> Tuple[str, Optional[float]]:
+    """A hedge duplicate, preferably on another replica; frees its limiter slot when done or cancelled."""
+    try:
+        return await _replica_call_async(rt, rt["replicas"].acquire(avoid=avoid), messages, cfg)
+    finally:
+        if rt.get("limiter") is not None:
+            await rt["limiter"].release_slot()
+
+
+async def _routed_call_async(rt: Dict, messages: List[Dict[str, Any]], cfg: Dict) -> Tuple[str, Optional[float]]:
+    pool = rt["replicas"]
+    hedge = rt.get("hedge")
+    limiter = rt.get("limiter")
+    if hedge is None:
+        return await _replica_call_async(rt, pool.acquire(), messages, cfg)
+
+    hedge.start()
+    replica = pool.acquire()
+    tasks = [asyncio.ensure_future(_replica_call_async(rt, replica, messages, cfg))]
+    try:
+        delay = hedge.delay()
+        if delay is not None:
+            await asyncio.wait(tasks, timeout=delay)
+            # A hedge is an extra in-flight request: it needs a free limiter slot,
+            # and is skipped rather than queued when the judge is at its limit.
+            if not tasks[0].done() and (limiter is None or limiter.try_acquire()):
+                if hedge.try_hedge():
+                    tasks.append(asyncio.ensure_future(_hedge_call_async(rt, replica, messages, cfg)))
+                elif limiter is not None:
+                    await limiter.release_slot()
+        reply, winner = await _first_success(tasks)
+        if winner is not tasks[0]:
+            hedge.record_win()
+        return reply
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # Let the losers hand back their replica and limiter slots before we return ours.
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _judge_call_async(rt: Dict, messages: List[Dict[str, Any]], cfg: Dict) -> Tuple[str, Optional[float]]:
+    limiter = rt.get("limiter")
+    if limiter is None:
+        return await _routed_call_async(rt, messages, cfg)
+
+    epoch = await limiter.acquire()
+    start = time.monotonic()
+    try:
+        reply = await _routed_call_async(rt, messages, cfg)
+    except Exception as e:
+        await limiter.release(epoch, None, overloaded=_is_overload_error(e))
+        raise
+    await limiter.release(epoch, time.monotonic() - start)
+    return reply
+
+
+def _health_check_loop(rt: Dict, cfg: Dict, done: threading.Event):
+    session = requests.Session()
+    while not done.wait(cfg["health_interval"]):
+        for replica in rt["replicas"].replicas:
+            try:
+                resp = session.get(f"{replica.api_base}/models", headers=_auth_headers(cfg), timeout=10)
+                rt["replicas"].mark_health(replica, resp.ok, f"health check HTTP {resp.status_code}")
+            except Exception as e:
+                rt["replicas"].mark_health(replica, False, f"health check failed: {e}")
+
+
+async def _health_check_loop_async(rt: Dict, cfg: Dict):
+    import aiohttp
+
+    timeout = aiohttp.ClientTimeout(total=10)
+    while True:
+        await asyncio.sleep(cfg["health_interval"])
+        for replica in rt["replicas"].replicas:
+            try:
+                async with rt["session"].get(f"{replica.api_base}/models", headers=_auth_headers(cfg), timeout=timeout) as resp:
+                    rt["replicas"].mark_health(replica, resp.ok, f"health check HTTP {resp.status}")
+            except Exception as e:
+                rt["replicas"].mark_health(replica, False, f"health check failed: {e!r}")
+
+
+def _ok_result(
+    prompt_id: int,
+    prompt: Dict,
+    img_path: ImageRef,
+    eval_txt: str,
+    scores: Dict[str, float],
+    score_prob: Optional[float] = None,
+    attempts: Optional[List[Dict]] = None,
+) -> Dict:
+    res = {
+        "status": "ok",
+        "full": {
+            "prompt_id": prompt_id,
+            "prompt": prompt["Prompt"],
+            "key": prompt["Explanation"],
+            "image_path": str(img_path),
+            "evaluation": eval_txt,
+        },
+        "score": {
+            "prompt_id": prompt_id,
+            "Subcategory": prompt["Subcategory"],
+            "score": scores["score"],
+        },
+    }
+    if score_prob is not None:
+        res["score"]["score_prob"] = round(score_prob, 6)
+    if attempts is not None:
+        res["full"]["attempts"] = attempts
+    return res
+
+
+def _repair_messages(msgs: List[Dict[str, Any]], eval_txt: str) -> List[Dict[str, Any]]:
+    return msgs + [
+        {"role": "assistant", "content": eval_txt},
+        {"role": "user", "content": [{"type": "text", "text": REPAIR_PROMPT}]},
+    ]
+
+
+def _plan_retry(rt: Dict, prompt_id: int, attempts: List[Dict], msgs, cfg: Dict, call, start: float, eval_txt=None, error=None):
+    """Records a failed attempt; returns (delay, messages, cfg) for the next one, or None to give up.
+
+    Transient transport errors resend the same request after a jittered
+    backoff. Parse failures are retried at once with a repair prompt and,
+    from the second one, changed decoding settings.
+    """
+    policy = rt["retry"]
+    if error is None:
+        outcome = "parse_fail"
+    else:
+        outcome = "transient_error" if _is_transient_error(error) else "error"
+    attempt = {"attempt": len(attempts) + 1, "outcome": outcome, "latency_s": round(time.monotonic() - start, 3)}
+    if error is not None:
+        attempt["error"] = str(error)[:200]
+    attempts.append(attempt)
+    rt["metrics"].record_attempt(outcome)
+
+    if outcome == "error":
+        print(f"[ERR] {prompt_id}: attempt={attempt['attempt']}, err={error} (not retryable)")
+        return None
+    if outcome == "transient_error":
+        retries = sum(a["outcome"] == "transient_error" for a in attempts)
+        if retries > policy.max_retries:
+            print(f"[ERR] {prompt_id}: attempt={attempt['attempt']}, err={error} (giving up after {policy.max_retries} retries)")
+            return None
+        delay = policy.backoff(retries)
+        if not cfg["quiet"]:
+            print(f"[RETRY] {prompt_id}: attempt={attempt['attempt']}, err={error}; retrying in {delay:.1f}s")
+        return (delay,) + tuple(call)
+
+    parse_fails = sum(a["outcome"] == "parse_fail" for a in attempts)
+    missing = sorted(REQUIRED_SCORE_KEYS - set(extract_scores(eval_txt).keys()))
+    print(f"[WARN] {prompt_id}: score parse incomplete, missing={missing}, attempt={parse_fails}/{MAX_EXTRACT_RETRIES}")
+    if parse_fails >= MAX_EXTRACT_RETRIES:
+        return None
+    decoding = PARSE_RETRY_DECODING[min(parse_fails, len(PARSE_RETRY_DECODING)) - 1]
+    return 0.0, _repair_messages(msgs, eval_txt), dict(cfg, decoding_overrides=decoding)
+
+
+def _prepare_args(img_path: ImageRef, cfg: Dict):
+    return img_path, cfg["max_pixels"], cfg["image_format"], cfg["image_quality"]
+
+
+def _load_image(rt: Dict, img_path: ImageRef, cfg: Dict):
+    pool = rt.get("prep_pool")
+    if pool is None:
+        img64, mime, original, sent, timing = prepare_image(*_prepare_args(img_path, cfg))
+    else:
+        img64, mime, original, sent, timing = pool.submit(prepare_image, *_prepare_args(img_path, cfg)).result()
+    _record_prep(rt, original, sent, timing)
+    return img64, mime
 
-def evaluate_image(prompt_id: int, prompt: Dict, img_path: str, cfg: Dict):
-    print(f"Evaluating {prompt_id} ...")
-    img64 = encode_image(img_path)
-    msgs = build_evaluation_messages(prompt, img64)
 
-    for attempt in range(1, MAX_EXTRACT_RETRIES + 1):
+def _record_prep(rt: Dict, original: int, sent: int, timing: Tuple[float, float]):
+    rt["prep_stats"].add(original, sent)
+    rt["profiler"].add("disk_read", timing[0])
+    rt["profiler"].add("encode", timing[1])
+
+
+async def _load_image_async(rt: Dict, img_path: ImageRef, cfg: Dict):
+    pool = rt.get("prep_pool")
+    if pool is None:
+        img64, mime, original, sent, timing = await asyncio.to_thread(prepare_image, *_prepare_args(img_path, cfg))
+    else:
+        loop = asyncio.get_running_loop()
+        img64, mime, original, sent, timing = await loop.run_in_executor(
+            pool, functools.partial(prepare_image, *_prepare_args(img_path, cfg))
+        )
+    _record_prep(rt, original, sent, timing)
+    return img64, mime
+
+
+def _cache_key(msgs: List[Dict[str, Any]], cfg: Dict) -> str:
+    payload = _build_chat_request(msgs, cfg)[2]
+    # Streamed and non-streamed requests yield the same score, so they share entries.
+    payload.pop("stream", None)
+    payload.pop("stream_options", None)
+    return request_cache_key(payload)
+
+
+def _cached_scores(rt: Dict, key: str):
+    cached = rt["cache"].get(key)
+    if cached is None:
+        return None, None, None
+    eval_txt, score_prob = cached
+    scores = extract_scores(eval_txt)
+    if not REQUIRED_SCORE_KEYS.issubset(scores.keys()):
+        return None, None, None
+    return eval_txt, scores, score_prob
+
+
+def _request_key(msgs: List[Dict[str, Any]], cfg: Dict, prompt: Dict, img_path: ImageRef, url: Optional[str]) -> str:
+    if url is not None:
+        # A file:// URL says nothing about the bytes behind it; key on the content
+        # instead, so a regenerated image is not served a stale verdict.
+        digest = hashlib.sha256(read_image(img_path)).hexdigest()
+        msgs = build_evaluation_messages(prompt, image_url=f"sha256:{digest}")
+    return _cache_key(msgs, cfg)
+
+
+def _file_url(path: str, cfg: Dict) -> str:
+    path = os.path.abspath(path)
+    for client, server in cfg["media_path_map"]:
+        if path == client or path.startswith(client + os.sep):
+            path = server + path[len(client) :]
+            break
+    return "file://" + urllib.request.pathname2url(path)
+
+
+def _media_url(rt: Dict, img_path: ImageRef, cfg: Dict) -> Optional[str]:
+    """file:// URL to send instead of the image bytes, or None to inline them as base64."""
+    if cfg["image_url_mode"] != "file" or img_path.member is not None:
+        return None
+    if os.path.dirname(img_path.path) not in rt["file_media_dirs"]:
+        return None
+    return _file_url(img_path.path, cfg)
+
+
+def _is_media_rejection(e: Exception) -> bool:
+    # vLLM answers 400 when a file:// URL is outside --allowed-local-media-path or unreadable.
+    status = _error_status(e)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+def probe_file_media(img_path: ImageRef, cfg: Dict) -> Optional[str]:
+    """Asks every replica to load `img_path` by file:// URL; returns why one couldn't, or None if all could."""
+    content = [
+        {"type": "text", "text": "Reply with OK."},
+        {"type": "image_url", "image_url": {"url": _file_url(img_path.path, cfg)}},
+    ]
+    payload = {
+        "model": cfg["model"],
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": 1,
+        "temperature": 0.0,
+        "chat_template_kwargs": {"enable_thinking": False},
+    }
+    for api_base in cfg["api_bases"]:
         try:
-            eval_txt = _chat_completion_via_vllm(msgs, cfg)
-            scores = extract_scores(eval_txt)
-            print(f"\n--- {prompt_id} (attempt {attempt}) ---\n{eval_txt}\n--------------\n")
-
-            if REQUIRED_SCORE_KEYS.issubset(scores.keys()):
-                return {
-                    "status": "ok",
-                    "full": {
-                        "prompt_id": prompt_id,
-                        "prompt": prompt["Prompt"],
-                        "key": prompt["Explanation"],
-                        "image_path": img_path,
-                        "evaluation": eval_txt,
-                    },
-                    "score": {
-                        "prompt_id": prompt_id,
-                        "Subcategory": prompt["Subcategory"],
-                        "score": scores["score"],
-                    },
-                }
+            resp = requests.post(f"{api_base}/chat/completions", headers=_auth_headers(cfg), json=payload, timeout=cfg["timeout"])
+        except requests.RequestException as e:
+            return f"{api_base}: {e!r}"
+        if resp.status_code != 200:
+            return f"{api_base}: HTTP {resp.status_code} {resp.text[:200]}"
+    return None
+
+
+def _inline_messages(rt: Dict, prompt: Dict, img_path: ImageRef, cfg: Dict, held: int):
+    img64, mime = _load_image(rt, img_path, cfg)
+    held = rt["payload_budget"].resize(held, len(img64))
+    with rt["profiler"].stage("build_messages"):
+        msgs = build_evaluation_messages(prompt, img64, mime)
+    rt["metrics"].record_media("base64")
+    return msgs, held
+
+
+async def _inline_messages_async(rt: Dict, prompt: Dict, img_path: ImageRef, cfg: Dict, held: int):
+    img64, mime = await _load_image_async(rt, img_path, cfg)
+    held = await rt["payload_budget"].resize(held, len(img64))
+    with rt["profiler"].stage("build_messages"):
+        msgs = build_evaluation_messages(prompt, img64, mime)
+    rt["metrics"].record_media("base64")
+    return msgs, held
+
+
+def _payload_estimate(img_path: ImageRef) -> int:
+    # Before encoding, assume no downscaling: base64 is 4/3 of the file size.
+    return _payload_bytes(image_nbytes(img_path) * 4 // 3 + 4)
+
+
+def _payload_bytes(b64_len: int) -> int:
+    # Admission counts the base64 image twice: once in the message list, which
+    # the item keeps for retries, and once in the serialized request body,
+    # which the chat helpers reserve only while the request is in flight.
+    return 2 * b64_len
 
-            missing = sorted(REQUIRED_SCORE_KEYS - set(scores.keys()))
-            print(f"[WARN] {prompt_id}: score parse incomplete, missing={missing}, attempt={attempt}/{MAX_EXTRACT_RETRIES}")
-        except Exception as e:
-            print(f"[ERR] {prompt_id}: attempt={attempt}/{MAX_EXTRACT_RETRIES}, err={e}")
 
-    return {"status": "extract_fail", "prompt_id": prompt_id}
+def evaluate_image(rt: Dict, prompt_id: int, prompt: Dict, img_path: ImageRef, cfg: Dict):
+    if not cfg["quiet"]:
+        print(f"Evaluating {prompt_id} ...")
+    budget = rt["payload_budget"]
+    url = _media_url(rt, img_path, cfg)
+    held = _payload_estimate(img_path) if url is None else _payload_bytes(len(url))
+    budget.acquire(held)
+    try:
+        if url is None:
+            msgs, held = _inline_messages(rt, prompt, img_path, cfg, held)
+        else:
+            with rt["profiler"].stage("build_messages"):
+                msgs = build_evaluation_messages(prompt, image_url=url)
+            rt["metrics"].record_media("file_url")
+
+        key = None
+        if rt.get("cache") is not None:
+            with rt["profiler"].stage("cache_lookup"):
+                key = _request_key(msgs, cfg, prompt, img_path, url)
+                eval_txt, scores, score_prob = _cached_scores(rt, key)
+            if scores is not None:
+                return _ok_result(prompt_id, prompt, img_path, eval_txt, scores, score_prob)
+
+        attempts = []
+        call = (msgs, cfg)
+        while True:
+            start = time.monotonic()
+            try:
+                eval_txt, score_prob = _judge_call(rt, *call)
+            except Exception as e:
+                if url is not None and _is_media_rejection(e):
+                    print(f"[WARN] {prompt_id}: judge could not load {url} ({e}); sending it as base64")
+                    rt["metrics"].record_media("file_url_fallback")
+                    url = None
+                    msgs, held = _inline_messages(rt, prompt, img_path, cfg, held)
+                    call = (msgs, cfg)
+                    continue
+                plan = _plan_retry(rt, prompt_id, attempts, msgs, cfg, call, start, error=e)
+            else:
+                with rt["profiler"].stage("extract_scores"):
+                    scores = extract_scores(eval_txt)
+                if not cfg["quiet"]:
+                    print(f"\n--- {prompt_id} (attempt {len(attempts) + 1}) ---\n{eval_txt}\n--------------\n")
+                if REQUIRED_SCORE_KEYS.issubset(scores.keys()):
+                    attempts.append({"attempt": len(attempts) + 1, "outcome": "ok", "latency_s": round(time.monotonic() - start, 3)})
+                    rt["metrics"].record_attempt("ok")
+                    if key is not None:
+                        rt["cache"].put(key, cfg["model"], eval_txt, score_prob)
+                    return _ok_result(prompt_id, prompt, img_path, eval_txt, scores, score_prob, attempts)
+                plan = _plan_retry(rt, prompt_id, attempts, msgs, cfg, call, start, eval_txt=eval_txt)
+            if plan is None:
+                return {"status": "extract_fail", "prompt_id": prompt_id, "attempts": attempts}
+            delay, *call = plan
+            time.sleep(delay)
+    finally:
+        # The messages are dropped on return, so their bytes can be admitted for the next item.
+        budget.release(held)
+
+
+async def evaluate_image_async(rt: Dict, prompt_id: int, prompt: Dict, img_path: ImageRef, cfg: Dict):
+    if not cfg["quiet"]:
+        print(f"Evaluating {prompt_id} ...")
+    budget = rt["payload_budget"]
+    url = _media_url(rt, img_path, cfg)
+    held = _payload_estimate(img_path) if url is None else _payload_bytes(len(url))
+    await budget.acquire(held)
+    try:
+        if url is None:
+            msgs, held = await _inline_messages_async(rt, prompt, img_path, cfg, held)
+        else:
+            with rt["profiler"].stage("build_messages"):
+                msgs = build_evaluation_messages(prompt, image_url=url)
+            rt["metrics"].record_media("file_url")
+
+        key = None
+        if rt.get("cache") is not None:
+            with rt["profiler"].stage("cache_lookup"):
+                key = await asyncio.to_thread(_request_key, msgs, cfg, prompt, img_path, url)
+                eval_txt, scores, score_prob = _cached_scores(rt, key)
+            if scores is not None:
+                return _ok_result(prompt_id, prompt, img_path, eval_txt, scores, score_prob)
+
+        attempts = []
+        call = (msgs, cfg)
+        while True:
+            start = time.monotonic()
+            try:
+                eval_txt, score_prob = await _judge_call_async(rt, *call)
+            except Exception as e:
+                if url is not None and _is_media_rejection(e):
+                    print(f"[WARN] {prompt_id}: judge could not load {url} ({e}); sending it as base64")
+                    rt["metrics"].record_media("file_url_fallback")
+                    url = None
+                    msgs, held = await _inline_messages_async(rt, prompt, img_path, cfg, held)
+                    call = (msgs, cfg)
+                    continue
+                plan = _plan_retry(rt, prompt_id, attempts, msgs, cfg, call, start, error=e)
+            else:
+                with rt["profiler"].stage("extract_scores"):
+                    scores = extract_scores(eval_txt)
+                if not cfg["quiet"]:
+                    print(f"\n--- {prompt_id} (attempt {len(attempts) + 1}) ---\n{eval_txt}\n--------------\n")
+                if REQUIRED_SCORE_KEYS.issubset(scores.keys()):
+                    attempts.append({"attempt": len(attempts) + 1, "outcome": "ok", "latency_s": round(time.monotonic() - start, 3)})
+                    rt["metrics"].record_attempt("ok")
+                    if key is not None:
+                        rt["cache"].put(key, cfg["model"], eval_txt, score_prob)
+                    return _ok_result(prompt_id, prompt, img_path, eval_txt, scores, score_prob, attempts)
+                plan = _plan_retry(rt, prompt_id, attempts, msgs, cfg, call, start, eval_txt=eval_txt)
+            if plan is None:
+                return {"status": "extract_fail", "prompt_id": prompt_id, "attempts": attempts}
+            delay, *call = plan
+            # The limiter slot was released with the failed call, so waiting here costs no judge capacity.
+            await asyncio.sleep(delay)
+    finally:
+        await budget.release(held)
+
+
+def _evaluate_unless_stopped(stop: GracefulStop, rt: Dict, prompt_id: int, prompt: Dict, img_path: ImageRef, cfg: Dict):
+    if stop.is_set():
+        return None
+    return evaluate_image(rt, prompt_id, prompt, img_path, cfg)
+
+
+def plan_batches(tasks: List, size: int, check_items: int = 0) -> List[Tuple[List, bool]]:
+    """Splits tasks into judge batches of `size`; returns [(batch, cross_check)].
+
+    About `check_items` items, in whole batches spread evenly over the run
+    (tasks are ordered by prompt id, so the first batches would all come from
+    one category), are also judged singly for the agreement check.
+    """
+    batches = [tasks[i : i + size] for i in range(0, len(tasks), size)]
+    n_check = min(len(batches), math.ceil(check_items / size)) if check_items else 0
+    checked = {j * len(batches) // n_check for j in range(n_check)}
+    return [(batch, i in checked) for i, batch in enumerate(batches)]
+
+
+def _batch_key(tasks: List, image_urls: List[str], cfg: Dict) -> str:
+    # As in _request_key: a file:// URL is keyed on the file's content.
+    key_urls = [
+        f"sha256:{hashlib.sha256(read_image(t[2])).hexdigest()}" if url.startswith("file:") else url
+        for t, url in zip(tasks, image_urls)
+    ]
+    return _cache_key(build_batch_messages([(t[1], url) for t, url in zip(tasks, key_urls)]), cfg)
+
+
+def _fallback_positions(parsed: Dict[int, float], n: int, check: bool) -> List[int]:
+    """Batch positions (1-based) to judge singly: those without a parsed score, or all of them with `check`."""
+    return [pos for pos in range(1, n + 1) if check or pos not in parsed]
+
+
+def _batch_label(tasks: List) -> str:
+    return f"batch[{tasks[0][0]}..{tasks[-1][0]}]"
+
+
+def _batch_results(rt: Dict, tasks: List, eval_txt: Optional[str], score_probs, singles: Dict[int, Dict]) -> List[Tuple]:
+    """Per-item results of a batch: the batched verdict, or the single-item one where it was judged singly."""
+    scores = extract_batch_scores(eval_txt, len(tasks)) if eval_txt is not None else {}
+    out = []
+    for pos, task in enumerate(tasks, 1):
+        single = singles.get(pos)
+        single_ok = single is not None and single.get("status") == "ok"
+        if pos in scores and single_ok:
+            rt["batch_stats"].record_check(pos, scores[pos], single["score"]["score"])
+        if pos in scores and not single_ok:
+            res = _ok_result(task[0], task[1], task[2], eval_txt, {"score": scores[pos]}, (score_probs or {}).get(pos))
+            res["full"]["batch"] = {"size": len(tasks), "position": pos}
+        else:
+            res = single
+        out.append((task, res))
+    return out
+
+
+def _batch_images(rt: Dict, tasks: List, cfg: Dict, held: int):
+    urls = []
+    for task in tasks:
+        url = _media_url(rt, task[2], cfg)
+        if url is None:
+            img64, mime = _load_image(rt, task[2], cfg)
+            url = f"data:{mime};base64,{img64}"
+            rt["metrics"].record_media("base64")
+        else:
+            rt["metrics"].record_media("file_url")
+        urls.append(url)
+    return urls, rt["payload_budget"].resize(held, sum(len(url) for url in urls))
+
+
+async def _batch_images_async(rt: Dict, tasks: List, cfg: Dict, held: int):
+    urls = [_media_url(rt, task[2], cfg) for task in tasks]
+    for url in urls:
+        rt["metrics"].record_media("base64" if url is None else "file_url")
+    inline = [i for i, url in enumerate(urls) if url is None]
+    loaded = await asyncio.gather(*(_load_image_async(rt, tasks[i][2], cfg) for i in inline))
+    for i, (img64, mime) in zip(inline, loaded):
+        urls[i] = f"data:{mime};base64,{img64}"
+    return urls, await rt["payload_budget"].resize(held, sum(len(url) for url in urls))
+
+
+def _batch_estimate(rt: Dict, tasks: List, cfg: Dict) -> int:
+    total = 0
+    for task in tasks:
+        url = _media_url(rt, task[2], cfg)
+        total += _payload_estimate(task[2]) if url is None else _payload_bytes(len(url))
+    return total
+
+
+def evaluate_batch(rt: Dict, tasks: List, cfg: Dict, check: bool = False) -> List[Tuple]:
+    """Judges several items in one request; returns [(task, result)] in task order.
+
+    Items whose line can't be parsed, or all of them when the request fails
+    for good, are judged singly instead. With `check`, every item is also
+    judged singly for the agreement check, and the single verdict is kept.
+    """
+    label = _batch_label(tasks)
+    if not cfg["quiet"]:
+        print(f"Evaluating {label} ({len(tasks)} items) ...")
+    bcfg = dict(cfg, batch_items=len(tasks))
+    budget = rt["payload_budget"]
+    held = _batch_estimate(rt, tasks, cfg)
+    budget.acquire(held)
+    eval_txt = score_probs = key = None
+    try:
+        urls, held = _batch_images(rt, tasks, cfg, held)
+        with rt["profiler"].stage("build_messages"):
+            msgs = build_batch_messages([(t[1], url) for t, url in zip(tasks, urls)])
+        if rt.get("cache") is not None:
+            with rt["profiler"].stage("cache_lookup"):
+                key = _batch_key(tasks, urls, bcfg)
+                cached = rt["cache"].get(key)
+            if cached is not None:
+                eval_txt, score_probs = cached
+        del urls
+
+        attempts = []
+        call = (msgs, bcfg)
+        while eval_txt is None:
+            start = time.monotonic()
+            try:
+                eval_txt, score_probs = _judge_call(rt, *call)
+            except Exception as e:
+                plan = _plan_retry(rt, label, attempts, msgs, bcfg, call, start, error=e)
+                if plan is None:
+                    break
+                delay, *call = plan
+                time.sleep(delay)
+                continue
+            rt["metrics"].record_attempt("ok")
+            if not cfg["quiet"]:
+                print(f"\n--- {label} ---\n{eval_txt}\n--------------\n")
+            if key is not None and extract_batch_scores(eval_txt, len(tasks)):
+                rt["cache"].put(key, cfg["model"], eval_txt, score_probs)
+    finally:
+        budget.release(held)
+
+    parsed = extract_batch_scores(eval_txt, len(tasks)) if eval_txt is not None else {}
+    rt["batch_stats"].record_batch(len(tasks), len(parsed), eval_txt is not None)
+    singles = {}
+    for pos in _fallback_positions(parsed, len(tasks), check):
+        task = tasks[pos - 1]
+        singles[pos] = evaluate_image(rt, task[0], task[1], task[2], cfg)
+    return _batch_results(rt, tasks, eval_txt, score_probs, singles)
 
 
-def save_results(data: List[Dict], filename: str, cfg: Dict):
+async def evaluate_batch_async(rt: Dict, tasks: List, cfg: Dict, check: bool = False) -> List[Tuple]:
+    label = _batch_label(tasks)
+    if not cfg["quiet"]:
+        print(f"Evaluating {label} ({len(tasks)} items) ...")
+    bcfg = dict(cfg, batch_items=len(tasks))
+    budget = rt["payload_budget"]
+    held = _batch_estimate(rt, tasks, cfg)
+    await budget.acquire(held)
+    eval_txt = score_probs = key = None
+    try:
+        urls, held = await _batch_images_async(rt, tasks, cfg, held)
+        with rt["profiler"].stage("build_messages"):
+            msgs = build_batch_messages([(t[1], url) for t, url in zip(tasks, urls)])
+        if rt.get("cache") is not None:
+            with rt["profiler"].stage("cache_lookup"):
+                key = await asyncio.to_thread(_batch_key, tasks, urls, bcfg)
+                cached = rt["cache"].get(key)
+            if cached is not None:
+                eval_txt, score_probs = cached
+        del urls
+
+        attempts = []
+        call = (msgs, bcfg)
+        while eval_txt is None:
+            start = time.monotonic()
+            try:
+                eval_txt, score_probs = await _judge_call_async(rt, *call)
+            except Exception as e:
+                plan = _plan_retry(rt, label, attempts, msgs, bcfg, call, start, error=e)
+                if plan is None:
+                    break
+                delay, *call = plan
+                await asyncio.sleep(delay)
+                continue
+            rt["metrics"].record_attempt("ok")
+            if not cfg["quiet"]:
+                print(f"\n--- {label} ---\n{eval_txt}\n--------------\n")
+            if key is not None and extract_batch_scores(eval_txt, len(tasks)):
+                rt["cache"].put(key, cfg["model"], eval_txt, score_probs)
+    finally:
+        await budget.release(held)
+
+    parsed = extract_batch_scores(eval_txt, len(tasks)) if eval_txt is not None else {}
+    rt["batch_stats"].record_batch(len(tasks), len(parsed), eval_txt is not None)
+    need = _fallback_positions(parsed, len(tasks), check)
+    results = await asyncio.gather(*(evaluate_image_async(rt, tasks[pos - 1][0], tasks[pos - 1][1], tasks[pos - 1][2], cfg) for pos in need))
+    return _batch_results(rt, tasks, eval_txt, score_probs, dict(zip(need, results)))
+
+
+def _evaluate_batch_unless_stopped(stop: GracefulStop, rt: Dict, tasks: List, check: bool, cfg: Dict) -> List[Tuple]:
+    if stop.is_set():
+        return [(task, None) for task in tasks]
+    return evaluate_batch(rt, tasks, cfg, check)
+
+
+def run_threads(tasks: List, cfg: Dict, on_result, stop: GracefulStop, rt: Dict):
+    # Not a `with` block: on abort we must not wait for queued futures.
+    ex = concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"])
+    rt["payload_budget"] = ByteBudget(cfg["max_inflight_bytes"])
+    health_done = threading.Event()
+    if cfg["health_interval"] > 0:
+        threading.Thread(target=_health_check_loop, args=(rt, cfg, health_done), daemon=True).start()
+    try:
+        if cfg["judge_batch"] > 1:
+            batches = plan_batches(tasks, cfg["judge_batch"], cfg["batch_agreement"])
+            futures = [ex.submit(_evaluate_batch_unless_stopped, stop, rt, batch, check, cfg) for batch, check in batches]
+            for fut in concurrent.futures.as_completed(futures):
+                for task, res in fut.result():
+                    on_result(task, res)
+            return
+        future_to_task = {ex.submit(_evaluate_unless_stopped, stop, rt, t[0], t[1], t[2], cfg): t for t in tasks}
+        for fut in concurrent.futures.as_completed(future_to_task):
+            on_result(future_to_task[fut], fut.result())
+    finally:
+        health_done.set()
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_async(tasks: List, cfg: Dict, on_result, stop: GracefulStop, rt: Dict):
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise SystemExit("--engine async requires aiohttp (pip install aiohttp)") from e
+
+    # One pooled client for the whole run so keep-alive connections are reused
+    # across requests; the pool is sized to the in-flight cap plus the hedge budget.
+    hedge_headroom = max(1, math.ceil(cfg["max_workers"] * cfg["hedge_max_rate"] / 100)) if cfg["hedge"] else 0
+    connector = aiohttp.TCPConnector(limit=cfg["max_workers"] + hedge_headroom, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=cfg["timeout"])
+    # Gate the whole item (encode + request), not just the socket, so at most
+    # max_workers encoded images are held in memory at once.
+    sem = asyncio.Semaphore(cfg["max_workers"])
+
+    rt["limiter"] = None
+    if cfg["adaptive_concurrency"]:
+        rt["limiter"] = AdaptiveLimiter(cfg["min_workers"], cfg["max_workers"])
+    rt["payload_budget"] = AsyncByteBudget(cfg["max_inflight_bytes"])
+    rt["hedge"] = None
+    if cfg["hedge"]:
+        rt["hedge"] = HedgePolicy(cfg["hedge_max_rate"] / 100, cfg["hedge_min_delay"])
+
+    async def worker(task):
+        async with sem:
+            if stop.is_set():
+                return [(task, None)]
+            return [(task, await evaluate_image_async(rt, task[0], task[1], task[2], cfg))]
+
+    async def batch_worker(batch, check):
+        async with sem:
+            if stop.is_set():
+                return [(task, None) for task in batch]
+            return await evaluate_batch_async(rt, batch, cfg, check)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        rt["session"] = session
+        health = asyncio.ensure_future(_health_check_loop_async(rt, cfg)) if cfg["health_interval"] > 0 else None
+        if cfg["judge_batch"] > 1:
+            batches = plan_batches(tasks, cfg["judge_batch"], cfg["batch_agreement"])
+            pending = [asyncio.ensure_future(batch_worker(batch, check)) for batch, check in batches]
+        else:
+            pending = [asyncio.ensure_future(worker(task)) for task in tasks]
+        try:
+            for fut in asyncio.as_completed(pending):
+                for task, res in await fut:
+                    on_result(task, res)
+        finally:
+            if health is not None:
+                health.cancel()
+
+    if rt["limiter"] is not None:
+        summary = rt["limiter"].summary()
+        print(
+            f"[AIMD] settled limit={summary['settled_limit']} final={summary['final_limit']} "
+            f"decreases={summary['decreases']}"
+        )
+    if rt["hedge"] is not None:
+        summary = rt["hedge"].summary()
+        print(
+            f"[HEDGE] hedged={summary['hedges']}/{summary['requests']} ({summary['hedge_rate']:.1%}) "
+            f"won={summary['hedge_wins']} delay={summary['delay_s']}s"
+        )
+
+
+def run_async(tasks: List, cfg: Dict, on_result, stop: GracefulStop, rt: Dict):
+    asyncio.run(_run_async(tasks, cfg, on_result, stop, rt))
+
+
+def save_results(data: List[Dict], filename: str, cfg: Dict, append: bool = False):
     path = os.path.join(cfg["output_dir"], filename)
-    if filename.endswith(".jsonl"):
-        with open(path, "w", encoding="utf-8") as f:
-            for item in data:
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
-    else:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"[SAVE] {path}")
+    write_records(path, data, append=append)
+    print(f"[SAVE] {path}" + (f" (+{len(data)} records)" if append else ""))
+
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """Reads the batch manifest as a list of {"name", "image_dir"[, "output_dir"]}.
+
+    Accepts a JSON object {name: image_dir}, a JSON list of such dicts, or a
+    text file with one `name<TAB>image_dir` per line (# starts a comment).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, image_dir = line.split("\t", 1)
+            data.append({"name": name.strip(), "image_dir": image_dir.strip()})
+    if isinstance(data, dict):
+        data = [{"name": name, "image_dir": image_dir} for name, image_dir in data.items()]
+    return data
+
+
+def build_jobs(cfg: Dict) -> List[Tuple[str, Dict]]:
+    """Returns (model label, per-model cfg) pairs; a single unlabeled job outside batch mode."""
+    if not cfg["manifest"]:
+        return [("", cfg)]
+    jobs = []
+    for entry in load_manifest(cfg["manifest"]):
+        output_dir = entry.get("output_dir") or os.path.join(source_root(entry["image_dir"]), cfg["results_subdir"])
+        jobs.append((entry["name"], dict(cfg, image_dir=entry["image_dir"], output_dir=output_dir)))
+    return jobs
+
+
+def interleave_tasks(per_job_tasks: List[List]) -> List:
+    # Round-robin across models so every model advances at the same rate and
+    # the pool never drains to a single model's stragglers.
+    tasks = []
+    for i in range(max((len(t) for t in per_job_tasks), default=0)):
+        tasks.extend(t[i] for t in per_job_tasks if i < len(t))
+    return tasks
+
+
+def open_result_set(group: str, cfg: Dict) -> Dict:
+    """Loads (and journal-replays) the score/full files of one output group for resume."""
+    full_name = cfg["result_files"]["full"].replace(GROUP_PLACEHOLDER, group)
+    scores_name = cfg["result_files"]["scores"].replace(GROUP_PLACEHOLDER, group)
+    exist_scores = load_jsonl(os.path.join(cfg["output_dir"], scores_name))
+    # JSONL transcripts are append-only: done_ids come from the scores file, so
+    # earlier transcripts never need to be parsed or rewritten. Only the
+    # legacy .json array is loaded and rewritten in full.
+    append_full = is_jsonl_path(full_name)
+    exist_full = {} if append_full else load_json(os.path.join(cfg["output_dir"], full_name))
+
+    # ---- Resume: replay records journaled by an interrupted run ----
+    journal_path = journal_path_for(os.path.join(cfg["output_dir"], scores_name))
+    replayed = 0
+    for rec in replay_journal(journal_path):
+        exist_full[rec["full"]["prompt_id"]] = rec["full"]
+        exist_scores[rec["score"]["prompt_id"]] = rec["score"]
+        replayed += 1
+    if replayed:
+        print(f"[RESUME] Replayed {replayed} records from {journal_path}")
+
+    return {
+        "cfg": cfg,
+        "full_name": full_name,
+        "scores_name": scores_name,
+        "append_full": append_full,
+        "exist_full": exist_full,
+        "exist_scores": exist_scores,
+        "journal": ResultJournal(journal_path, fsync_every=cfg["fsync_every"]),
+        "failed_extract_ids": [],
+        "judged": 0,
+    }
+
+
+def add_result(rs: Dict, res: Dict):
+    if not res or res.get("status") != "ok":
+        if res and res.get("status") == "extract_fail":
+            rs["failed_extract_ids"].append(res["prompt_id"])
+        return
+    full_rec = res["full"]
+    score_rec = res["score"]
+    rs["exist_full"][full_rec["prompt_id"]] = full_rec
+    rs["exist_scores"][score_rec["prompt_id"]] = score_rec
+    rs["journal"].append(full_rec, score_rec)
+    rs["judged"] += 1
+
+
+def close_result_set(rs: Dict):
+    cfg = rs["cfg"]
+    full_sorted = [rs["exist_full"][k] for k in sorted(rs["exist_full"].keys())]
+    score_sorted = [rs["exist_scores"][k] for k in sorted(rs["exist_scores"].keys())]
+
+    save_results(full_sorted, rs["full_name"], cfg, append=rs["append_full"])
+    save_results(score_sorted, rs["scores_name"], cfg)
+    rs["journal"].discard()
+    if rs["failed_extract_ids"]:
+        print(f"[WARN] Failed to extract scores (skipped): {sorted(rs['failed_extract_ids'])}")
+
+
+def build_run_summary(rt: Dict, result_sets: Dict, wall: float) -> Dict[str, Any]:
+    latencies = rt["replicas"].latencies
+    replicas = rt["replicas"].summary()
+    metrics = rt["metrics"].snapshot()
+    judged = sum(rs["judged"] for rs in result_sets.values())
+    requests_sent = sum(r["requests"] for r in replicas)
+    return {
+        "wall_s": round(wall, 3),
+        "items_judged": judged,
+        "items_failed": sum(len(rs["failed_extract_ids"]) for rs in result_sets.values()),
+        "items_per_s": round(judged / wall, 3) if wall > 0 else 0.0,
+        "requests": requests_sent,
+        "request_errors": sum(r["errors"] for r in replicas),
+        "requests_per_s": round(requests_sent / wall, 3) if wall > 0 else 0.0,
+        "latency_s": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+        },
+        "replicas": replicas,
+        "cache": rt["cache"].summary() if rt["cache"] is not None else None,
+        "prep": rt["prep_stats"].summary(),
+        "aimd": rt["limiter"].summary() if rt.get("limiter") is not None else None,
+        "hedge": rt["hedge"].summary() if rt.get("hedge") is not None else None,
+        "payload_budget": rt["payload_budget"].summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "attempts": metrics["attempts"],
+        "retry_backoff_s": rt["retry"].summary()["backoff_s"],
+        "tokens": metrics["tokens"],
+        "media": metrics["media"],
+        "batch": rt["batch_stats"].summary() if rt["batch_stats"] is not None else None,
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def start_py_spy(path: str) -> subprocess.Popen:
+    exe = shutil.which("py-spy")
+    if exe is None:
+        raise SystemExit("--py_spy requires py-spy on PATH (pip install py-spy)")
+    cmd = [exe, "record", "--output", path, "--pid", str(os.getpid()), "--threads", "--subprocesses", "--nonblocking"]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+
+
+def stop_py_spy(proc: subprocess.Popen, path: str):
+    # py-spy writes its output when interrupted.
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    print(f"[PROFILE] py-spy flame graph written to {path}")
 
 
 def main():
     args = parse_arguments()
     cfg = get_config(args)
-    Path(cfg["output_dir"]).mkdir(parents=True, exist_ok=True)
 
-    prompts = load_prompts(cfg["json_path"])
+    split_groups = any(GROUP_PLACEHOLDER in name for name in cfg["result_files"].values())
+    prompts = load_grouped_prompts(cfg["json_path"], split_groups)
+    groups = sorted({group for group, _ in prompts.values()})
+    if len(groups) > 1 and not all(GROUP_PLACEHOLDER in name for name in cfg["result_files"].values()):
+        raise SystemExit(f"Prompts span several categories {groups}; put {GROUP_PLACEHOLDER} in both --result_full and --result_scores")
 
-    exist_scores = load_jsonl(os.path.join(cfg["output_dir"], cfg["result_files"]["scores"]))
-    exist_full = load_json(os.path.join(cfg["output_dir"], cfg["result_files"]["full"]))
-    done_ids = set(exist_scores.keys())
+    result_sets = {}
+    per_job_tasks = []
+    file_media_dirs = set()
+    for label, job_cfg in build_jobs(cfg):
+        Path(job_cfg["output_dir"]).mkdir(parents=True, exist_ok=True)
+        for group in groups:
+            result_sets[(label, group)] = open_result_set(group, job_cfg)
 
-    tasks = []
-    for pid, pdata in prompts.items():
-        if pid in done_ids:
-            continue
-        img_path = os.path.join(cfg["image_dir"], f"{pid}.png")
-        if not os.path.exists(img_path):
-            print(f"[WARN] Missing image: {img_path}")
-            continue
-        tasks.append((pid, pdata, img_path))
-
-    failed_extract_ids = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=cfg["max_workers"]) as ex:
-        future_to_id = {ex.submit(evaluate_image, pid, pd, ip, cfg): pid for pid, pd, ip in tasks}
-        for fut in concurrent.futures.as_completed(future_to_id):
-            res = fut.result()
-            if not res or res.get("status") != "ok":
-                if res and res.get("status") == "extract_fail":
-                    failed_extract_ids.append(res["prompt_id"])
+        source = ImageSource(job_cfg["image_dir"])
+        print(f"[IMAGES] {source.describe()}")
+        job_tasks = []
+        for pid, (group, pdata) in sorted(prompts.items()):
+            if pid in result_sets[(label, group)]["exist_scores"]:
                 continue
-            full_rec = res["full"]
-            score_rec = res["score"]
-            exist_full[full_rec["prompt_id"]] = full_rec
-            exist_scores[score_rec["prompt_id"]] = score_rec
-
-    full_sorted = [exist_full[k] for k in sorted(exist_full.keys())]
-    score_sorted = [exist_scores[k] for k in sorted(exist_scores.keys())]
-
-    save_results(full_sorted, cfg["result_files"]["full"], cfg)
-    save_results(score_sorted, cfg["result_files"]["scores"], cfg)
-    if failed_extract_ids:
-        print(f"[WARN] Failed to extract scores (skipped): {sorted(failed_extract_ids)}")
+            img_path = source.get(pid)
+            if img_path is None:
+                print(f"[WARN] Missing image: prompt {pid} in {job_cfg['image_dir']}")
+                continue
+            job_tasks.append((pid, pdata, img_path, (label, group)))
+        if cfg["image_url_mode"] == "file":
+            probe = next((t[2] for t in job_tasks if t[2].member is None), None)
+            reason = "no loose image files (archive members are always inlined)" if probe is None else probe_file_media(probe, cfg)
+            if reason is None:
+                file_media_dirs.add(os.path.dirname(probe.path))
+                print(f"[MEDIA] {job_cfg['image_dir']}: judge reads images via file:// URLs")
+            elif job_tasks:
+                print(f"[WARN] {job_cfg['image_dir']}: judge cannot read file:// URLs ({reason}); sending base64")
+        if label:
+            print(f"[BATCH] {label}: {len(job_tasks)} prompts to judge")
+        per_job_tasks.append(job_tasks)
+    tasks = interleave_tasks(per_job_tasks)
+
+    stop = GracefulStop()
+    stop.install()
+    # Per-run shared objects (cache, HTTP session, limiter), as opposed to cfg's plain settings.
+    rt = {
+        "cache": None,
+        "prep_pool": None,
+        "prep_stats": PrepStats(),
+        "replicas": ReplicaPool(cfg["api_bases"]),
+        "retry": RetryPolicy(cfg["max_retries"], cfg["retry_backoff"], cfg["retry_max_delay"]),
+        "metrics": RunMetrics(items_total=len(tasks)),
+        "profiler": StageProfiler(enabled=cfg["profile"]),
+        # Image directories the judge has been shown to read by file:// URL.
+        "file_media_dirs": file_media_dirs,
+        "batch_stats": BatchStats() if cfg["judge_batch"] > 1 else None,
+    }
+    if cfg["cache_path"]:
+        rt["cache"] = JudgeCache(cfg["cache_path"], cfg["cache_max_mb"] * 2**20)
+    if cfg["prep_workers"]:
+        # Decoding/resizing/base64 run in separate processes so they don't contend for the GIL.
+        rt["prep_pool"] = concurrent.futures.ProcessPoolExecutor(max_workers=cfg["prep_workers"])
+
+    def on_result(task, res):
+        add_result(result_sets[task[3]], res)
+        if res is not None:
+            rt["metrics"].item_done(res.get("status") == "ok")
+
+    reporters = []
+    metrics_server = None
+    if cfg["quiet"]:
+        reporters.append(PeriodicTask(cfg["progress_interval"], lambda: print(rt["metrics"].progress_line(), flush=True)))
+    if cfg["metrics_json"]:
+        reporters.append(PeriodicTask(cfg["metrics_interval"], lambda: write_metrics_json(rt["metrics"], cfg["metrics_json"])))
+    if cfg["metrics_port"]:
+        metrics_server = serve_prometheus(rt["metrics"], cfg["metrics_port"])
+        print(f"[METRICS] Prometheus metrics on http://0.0.0.0:{cfg['metrics_port']}/metrics")
+
+    cprofile = spy = None
+    if cfg["cprofile"]:
+        import cProfile
+
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    if cfg["py_spy"]:
+        spy = start_py_spy(cfg["py_spy"])
+
+    run_start = time.monotonic()
+    try:
+        if cfg["engine"] == "async":
+            run_async(tasks, cfg, on_result, stop, rt)
+        else:
+            run_threads(tasks, cfg, on_result, stop, rt)
+    except KeyboardInterrupt:
+        for rs in result_sets.values():
+            rs["journal"].close()
+            print(f"[ABORT] {len(rs['exist_scores'])} records kept in {rs['journal'].path}; rerun the same command to resume.")
+        # Skip joining worker threads that may still be blocked on the judge.
+        os._exit(130)
+    wall = time.monotonic() - run_start
+    if cprofile is not None:
+        cprofile.disable()
+        cprofile.dump_stats(cfg["cprofile"])
+        print(f"[PROFILE] cProfile stats written to {cfg['cprofile']} (python -m pstats {cfg['cprofile']})")
+    if spy is not None:
+        stop_py_spy(spy, cfg["py_spy"])
+    # Stopping flushes each reporter once more, so the final progress line and JSON snapshot are complete.
+    for reporter in reporters:
+        reporter.stop()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+    for rs in result_sets.values():
+        close_result_set(rs)
+    if cfg["manifest"]:
+        for label in dict.fromkeys(label for label, _ in result_sets):
+            done = sum(len(rs["exist_scores"]) for (l, _), rs in result_sets.items() if l == label)
+            print(f"[BATCH] {label}: {done}/{len(prompts)} prompts scored")
+    if rt["prep_pool"] is not None:
+        rt["prep_pool"].shutdown()
+        prep = rt["prep_stats"].summary()
+        print(
+            f"[PREP] images={prep['images']} original={prep['original_mb']}MB sent={prep['sent_mb']}MB "
+            f"saved={prep['saved']:.1%} (before base64)"
+        )
+    if len(cfg["api_bases"]) > 1:
+        for rep in rt["replicas"].summary():
+            print(
+                f"[REPLICA] {rep['api_base']} requests={rep['requests']} errors={rep['errors']} "
+                f"req/s={rep['req_per_s']} avg_latency={rep['avg_latency_s']}s ejections={rep['ejections']} "
+                f"healthy={rep['healthy']}"
+            )
+    if cfg["image_url_mode"] == "file":
+        media = rt["metrics"].snapshot()["media"]
+        print("[MEDIA] " + " ".join(f"{k}={v}" for k, v in sorted(media.items())))
+    if rt["batch_stats"] is not None:
+        batch = rt["batch_stats"].summary()
+        print(
+            f"[JUDGE-BATCH] size={cfg['judge_batch']} batches={batch['batches']} items={batch['items']} "
+            f"parsed={batch['parsed']} single_fallbacks={batch['single_fallbacks']} failed_requests={batch['failed_requests']}"
+        )
+        agreement = batch["agreement"]
+        if agreement["items"]:
+            by_position = " ".join(f"{pos}:{rate:.0%}" for pos, rate in agreement["by_position"].items())
+            print(
+                f"[JUDGE-BATCH] agreement with single-item judging: {agreement['rate']:.1%} over {agreement['items']} items, "
+                f"kappa={agreement['kappa']} batch1/single0={agreement['batch_1_single_0']} "
+                f"batch0/single1={agreement['batch_0_single_1']}; by position {by_position}"
+            )
+    attempts = rt["metrics"].snapshot()["attempts"]
+    if set(attempts) - {"ok"}:
+        outcomes = " ".join(f"{k}={v}" for k, v in sorted(attempts.items()))
+        print(f"[RETRY] {outcomes} backoff={rt['retry'].summary()['backoff_s']}s")
+    if rt["cache"] is not None:
+        summary = rt["cache"].summary()
+        rt["cache"].close()
+        print(
+            f"[CACHE] hits={summary['hits']} misses={summary['misses']} hit_rate={summary['hit_rate']:.1%} "
+            f"evicted={summary['evicted']} size={summary['size_mb']}MB"
+        )
+    budget = rt["payload_budget"].summary()
+    print(
+        f"[MEMORY] peak_rss={peak_rss_mb()}MB peak_payload_in_flight={budget['peak_mb']}MB "
+        f"(budget={budget['limit_mb'] or 'unlimited'}{'MB' if budget['limit_mb'] else ''}, admission waits={budget['waits']})"
+    )
+    if cfg["profile"]:
+        print("[PROFILE] per-item stage times (x_wall = average number of workers in that stage)")
+        print(format_profile(rt["profiler"].report(wall)))
+    if cfg["summary_json"]:
+        summary = build_run_summary(rt, result_sets, wall)
+        if cfg["profile"]:
+            summary["profile"] = rt["profiler"].report(wall)
+        with open(cfg["summary_json"], "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"[SAVE] {cfg['summary_json']}")
+    if stop.is_set():
+        saved = sum(len(rs["exist_scores"]) for rs in result_sets.values())
+        print(f"[STOP] Saved {saved} records; rerun the same command to evaluate the remaining prompts.")
+        # Non-zero so wrapper scripts such as eval_qwen.sh do not stop silently half-way.
+        sys.exit(130)
 
 
 if __name__ == "__main__":